@@ -1,17 +1,21 @@
 # account_manager.py
 from database import get_db_connection
+from query_builder import compile_update
+from log_config import get_logger
 
-def add_account(user_id, name, type, initial_balance=0):
+logger = get_logger(__name__)
+
+def add_account(user_id, name, type, initial_balance=0, currency='CNY'):
     conn = get_db_connection()
     cursor = conn.cursor()
     try:
-        cursor.execute('INSERT INTO accounts (user_id, name, type, balance) VALUES (?, ?, ?, ?)', 
-                       (user_id, name, type, initial_balance))
+        cursor.execute('INSERT INTO accounts (user_id, name, type, balance, initial_balance, currency) VALUES (?, ?, ?, ?, ?, ?)', 
+                       (user_id, name, type, initial_balance, initial_balance, (currency or 'CNY').upper()))
         conn.commit()
-        print(f"调试: 账户添加成功 - 用户ID: {user_id}, 账户名: {name}")  # 添加调试信息
+        logger.debug('账户添加成功 - 用户ID: %s, 账户名: %s', user_id, name)
         return True
     except Exception as e:
-        print(f"调试: 添加账户时出错: {str(e)}")  # 添加调试信息
+        logger.error('添加账户时出错: %s', e)
         return False
     finally:
         conn.close()
@@ -43,9 +47,9 @@ def get_accounts(user_id, include_linked=True):
                 display_name = f"{name} ({owner})"
                 accounts.append((account_id, display_name, acc_type, balance))
         except ImportError:
-            print("警告: account_sharing 模块未找到，只返回自有账户")
+            logger.warning('account_sharing 模块未找到，只返回自有账户')
         except Exception as e:
-            print(f"获取关联账户时出错: {e}")
+            logger.error('获取关联账户时出错: %s', e)
     
     conn.close()
     return accounts
@@ -61,14 +65,20 @@ def update_account(account_id, user_id, updates):
         print("错误: 账户不存在或无权操作")
         return False
     
-    set_clause = []
-    params = []
-    for key, value in updates.items():
-        set_clause.append(f"{key} = ?")
-        params.append(value)
+    # 只允许修改白名单中的字段；手动修改余额视为调整初始余额，保证 余额 = 初始余额 + 账本净额
+    try:
+        query, params = compile_update('accounts', updates, 'id = ? AND user_id = ?',
+                                       extra_set='initial_balance = initial_balance + (? - balance)'
+                                       if 'balance' in updates else None)
+    except ValueError as e:
+        conn.close()
+        print(f"错误: {e}")
+        return False
+    if 'balance' in updates:
+        params.append(updates['balance'])
     params.append(account_id)
     params.append(user_id)
-    cursor.execute(f'UPDATE accounts SET {", ".join(set_clause)} WHERE id = ? AND user_id = ?', params)
+    cursor.execute(query, params)
     conn.commit()
     conn.close()
     return True
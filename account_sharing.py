@@ -131,23 +131,9 @@ def validate_linked_account_access(user_id, account_id, require_write=False):
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # 检查是否是账户所有者
-    cursor.execute('SELECT id FROM accounts WHERE id = ? AND user_id = ?', 
-                  (account_id, user_id))
-    if cursor.fetchone():
-        conn.close()
-        return True  # 是账户所有者，拥有全部权限
-    
-    # 检查是否有关联权限
-    if require_write:
-        cursor.execute('''SELECT id FROM user_account_links 
-                         WHERE linked_user_id = ? AND account_id = ? AND permission_level = 'write' ''', 
-                      (user_id, account_id))
-    else:
-        cursor.execute('''SELECT id FROM user_account_links 
-                         WHERE linked_user_id = ? AND account_id = ?''', 
-                      (user_id, account_id))
-    
-    has_access = cursor.fetchone() is not None
+    # 账户所有者和 write 关联的 can_write 为 1（由触发器维护，一次主键查找）
+    cursor.execute('SELECT can_write FROM user_accessible_accounts WHERE user_id = ? AND account_id = ?',
+                   (user_id, account_id))
+    row = cursor.fetchone()
     conn.close()
-    return has_access
\ No newline at end of file
+    return row is not None and (bool(row[0]) or not require_write)
\ No newline at end of file
@@ -0,0 +1,382 @@
+# anomalies.py
+"""
+异常交易检测
+
+三类异常：
+- amount：金额远离该用户该分类的典型值。基线为中位数和 MAD（中位数绝对偏差），
+  稳健 z 分数 = (金额 - 中位数) / 尺度，尺度 = MAD / 0.6745（MAD 为 0 时改用平均绝对偏差 × 1.2533）
+- frequency：某天某分类的交易笔数突增。与之前 28 天每日笔数（含无交易的日子）的滚动均值和标准差比较
+- new_payee：用户已有一定交易历史后，第一次出现的收款方（与 transactions.payee 相同的规范化规则）
+
+scan 按 (用户, 分类, 日期) 顺序流式读取整个账本，一个用户一批地计算基线并给历史交易打标，
+结果写入 anomaly_baselines、anomaly_payees、anomaly_flags。之后写入的新交易（单笔、批量、导入、
+定期交易和转账都经过 transaction_manager.insert_transaction_rows）由 score_transactions 增量评分：
+每批只读取涉及用户的基线和收款方各一次，不重新扫描历史。
+基线（中位数、MAD）在下一次 scan 时刷新。转账不参与检测。
+
+用法：
+    python anomalies.py scan [--user 1]
+    python anomalies.py report --user 1 [--all]
+"""
+import argparse
+import math
+import time
+from bisect import bisect_left
+from datetime import datetime
+from itertools import groupby
+from database import get_db_connection
+from payees import normalize_payee
+
+AMOUNT_THRESHOLD = 3.5        # 稳健 z 分数阈值
+FREQUENCY_THRESHOLD = 4.0     # 每日笔数滚动 z 分数阈值（每日笔数近似泊松分布，尾部比正态分布重）
+FREQUENCY_WINDOW = 28         # 滚动窗口（天）
+MIN_SPIKE_COUNT = 3           # 当天至少这么多笔才算频率突增
+MIN_SAMPLES = 8               # 分类至少这么多笔交易才计算金额基线
+MIN_HISTORY = 20              # 用户至少这么多笔交易后才提示新收款方
+MIN_DAILY_MEAN = 0.5          # 近期日均笔数低于该值的稀疏分类不做频率检测（偶尔一天几笔是正常的泊松波动）
+
+
+def _day_number(value):
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').toordinal()
+
+
+def _robust_baseline(amounts):
+    """返回 (中位数, 尺度)，尺度为 0 表示无法评分"""
+    ordered = sorted(amounts)
+    n = len(ordered)
+    median = (ordered[(n - 1) // 2] + ordered[n // 2]) / 2
+    deviations = sorted(abs(a - median) for a in ordered)
+    mad = (deviations[(n - 1) // 2] + deviations[n // 2]) / 2
+    if mad > 0:
+        return median, mad / 0.6745
+    mean_deviation = sum(deviations) / n
+    return median, mean_deviation * 1.2533
+
+
+def _window_stats(total, total_sq, window=FREQUENCY_WINDOW):
+    mean = total / window
+    return mean, math.sqrt(max(total_sq / window - mean * mean, 0.0))
+
+
+def _frequency_z(count, mean, std):
+    """
+    当天笔数的 z 分数；标准差下限取泊松分布的 sqrt(均值)，避免平稳序列上一笔之差就报警
+    稀疏分类（均值低于 MIN_DAILY_MEAN）返回 None
+    """
+    if mean < MIN_DAILY_MEAN:
+        return None
+    std = max(std, math.sqrt(mean))
+    return (count - mean) / std, std
+
+
+def _scan_category(rows, amount_threshold, frequency_threshold, flags):
+    """
+    对一个 (用户, 分类) 的交易（按日期排序）打标，返回基线
+    rows: [(id, user_id, category_id, amount, date, description)]
+    """
+    user_id, category_id = rows[0][1], rows[0][2]
+    median, scale = _robust_baseline([row[3] for row in rows])
+    if len(rows) >= MIN_SAMPLES and scale > 0:
+        for row in rows:
+            score = (row[3] - median) / scale
+            if abs(score) > amount_threshold:
+                flags.append((row[0], 'amount', user_id, round(score, 2),
+                              f"中位数 {median:.2f}，金额 {row[3]:.2f}"))
+
+    # 每日笔数，滚动窗口为当天之前的 FREQUENCY_WINDOW 天
+    days = []
+    day_rows = {}
+    for row in rows:
+        day = _day_number(row[4])
+        if day not in day_rows:
+            days.append(day)
+            day_rows[day] = []
+        day_rows[day].append(row[0])
+    counts = [len(day_rows[day]) for day in days]
+    left = 0
+    total = total_sq = 0
+    for i, day in enumerate(days):
+        if i > 0:
+            total += counts[i - 1]
+            total_sq += counts[i - 1] ** 2
+        while days[left] < day - FREQUENCY_WINDOW:
+            total -= counts[left]
+            total_sq -= counts[left] ** 2
+            left += 1
+        if day - days[0] < FREQUENCY_WINDOW or counts[i] < MIN_SPIKE_COUNT:
+            continue
+        mean, std = _window_stats(total, total_sq)
+        scored = _frequency_z(counts[i], mean, std)
+        if scored is None:
+            continue
+        z, std = scored
+        if z > frequency_threshold:
+            # 只标记超出阈值之后的那几笔，与增量评分时逐笔判断的结果一致
+            allowed = max(int(mean + frequency_threshold * std), MIN_SPIKE_COUNT - 1)
+            for transaction_id in day_rows[day][allowed:]:
+                flags.append((transaction_id, 'frequency', user_id, round(z, 2),
+                              f"当天 {counts[i]} 笔，近 {FREQUENCY_WINDOW} 天日均 {mean:.2f} 笔"))
+
+    # 增量评分使用截至最后一天（含）的窗口
+    last = days[-1]
+    start = bisect_left(days, last - FREQUENCY_WINDOW + 1)
+    daily_mean, daily_std = _window_stats(sum(counts[start:]), sum(c * c for c in counts[start:]))
+    last_date = datetime.fromordinal(last).strftime('%Y-%m-%d')
+    return (user_id, category_id, len(rows), median, scale, daily_mean, daily_std, last_date, counts[-1])
+
+
+def _scan_payees(rows, flags, payees):
+    """按时间顺序找出每个收款方第一次出现的交易"""
+    rows = sorted(rows, key=lambda row: (row[4], row[0]))
+    seen = set()
+    for position, row in enumerate(rows):
+        payee = normalize_payee(row[5])
+        if not payee or payee in seen:
+            continue
+        seen.add(payee)
+        payees.append((row[1], payee, str(row[4])[:10]))
+        if position >= MIN_HISTORY:
+            flags.append((row[0], 'new_payee', row[1], None, f"首次出现的收款方: {payee}"))
+
+
+def _iter_rows(cursor, chunk_size):
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+
+def scan(user_id=None, amount_threshold=AMOUNT_THRESHOLD, frequency_threshold=FREQUENCY_THRESHOLD,
+         chunk_size=5000):
+    """
+    全量扫描账本：重建基线和收款方集合，并给历史交易打标（已复核的标记保留）
+    :param user_id: 只扫描该用户（默认全部用户）
+    :return: {'transactions', 'baselines', 'flags': {原因: 数量}, 'seconds'}，失败时返回 False
+    """
+    started = time.perf_counter()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        query = '''SELECT id, user_id, category_id, amount, date, description FROM transactions
+                   WHERE transfer_id IS NULL'''
+        params = []
+        if user_id is not None:
+            query += ' AND user_id = ?'
+            params.append(user_id)
+        cursor.execute(query + ' ORDER BY user_id, category_id, date, id', params)
+
+        flags, baselines, payees = [], [], []
+        scanned = 0
+        # 一次只在内存中保留一个用户的交易
+        for _, user_rows in groupby(_iter_rows(cursor, chunk_size), key=lambda row: row[1]):
+            user_rows = list(user_rows)
+            scanned += len(user_rows)
+            for _, category_rows in groupby(user_rows, key=lambda row: row[2]):
+                baselines.append(_scan_category(list(category_rows), amount_threshold, frequency_threshold, flags))
+            _scan_payees(user_rows, flags, payees)
+
+        cursor.execute('BEGIN IMMEDIATE')
+        scope, scope_params = ('WHERE user_id = ?', (user_id,)) if user_id is not None else ('', ())
+        cursor.execute(f'DELETE FROM anomaly_baselines {scope}', scope_params)
+        cursor.execute(f'DELETE FROM anomaly_payees {scope}', scope_params)
+        unreviewed = 'AND user_id = ?' if user_id is not None else ''
+        cursor.execute(f'DELETE FROM anomaly_flags WHERE reviewed = 0 {unreviewed}', scope_params)
+        cursor.execute('DELETE FROM anomaly_flags WHERE transaction_id NOT IN (SELECT id FROM transactions)')
+        cursor.executemany('''
+            INSERT INTO anomaly_baselines (user_id, category_id, sample_size, median, scale, daily_mean, daily_std,
+                                           last_date, last_date_count)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', baselines)
+        cursor.executemany('INSERT INTO anomaly_payees (user_id, payee, first_seen) VALUES (?, ?, ?)', payees)
+        # 已复核的标记不会被重新打开
+        cursor.executemany('''
+            INSERT OR IGNORE INTO anomaly_flags (transaction_id, reason, user_id, score, detail)
+            VALUES (?, ?, ?, ?, ?)
+        ''', flags)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"错误：异常扫描失败: {e}")
+        return False
+    finally:
+        conn.close()
+
+    by_reason = {}
+    for flag in flags:
+        by_reason[flag[1]] = by_reason.get(flag[1], 0) + 1
+    return {'transactions': scanned, 'baselines': len(baselines), 'flags': by_reason,
+            'seconds': round(time.perf_counter() - started, 4)}
+
+
+def score_transaction(cursor, transaction_id, amount_threshold=AMOUNT_THRESHOLD,
+                      frequency_threshold=FREQUENCY_THRESHOLD):
+    """
+    对刚写入的一笔交易增量评分（使用调用方的游标，不提交）
+    需要先运行过 scan 建立基线；没有基线的分类只检测新收款方
+    :return: [(原因, 分数, 说明)]
+    """
+    return score_transactions(cursor, [transaction_id], amount_threshold,
+                              frequency_threshold).get(transaction_id, [])
+
+
+def score_transactions(cursor, transaction_ids, amount_threshold=AMOUNT_THRESHOLD,
+                       frequency_threshold=FREQUENCY_THRESHOLD, chunk_size=500):
+    """
+    对刚写入的一批交易增量评分（使用调用方的游标，不提交），结果与按ID顺序逐笔调用 score_transaction 相同
+    涉及用户的基线和收款方各读取一次，在内存中按ID顺序评分，再批量写回基线的最新一天笔数、新收款方和标记
+    :return: {交易ID: [(原因, 分数, 说明)]}，转账和不存在的交易不在结果中
+    """
+    transaction_ids = list(transaction_ids)
+    rows = []
+    for i in range(0, len(transaction_ids), chunk_size):
+        chunk = transaction_ids[i:i + chunk_size]
+        cursor.execute(f'''SELECT id, user_id, category_id, amount, date, description FROM transactions
+                           WHERE id IN ({', '.join('?' * len(chunk))}) AND transfer_id IS NULL''', chunk)
+        rows.extend(cursor.fetchall())
+    if not rows:
+        return {}
+    rows.sort()
+
+    user_ids = sorted({row[1] for row in rows})
+    placeholders = ', '.join('?' * len(user_ids))
+    cursor.execute(f'''SELECT user_id, category_id, sample_size, median, scale, daily_mean, daily_std, last_date,
+                              last_date_count
+                       FROM anomaly_baselines WHERE user_id IN ({placeholders})''', user_ids)
+    baselines = {}
+    history = dict.fromkeys(user_ids, 0)
+    for user_id, category_id, *baseline in cursor.fetchall():
+        baselines[(user_id, category_id)] = baseline
+        history[user_id] += baseline[0]
+
+    payee_of = {row[0]: normalize_payee(row[5]) for row in rows}
+    candidates = {}
+    for row in rows:
+        if payee_of[row[0]]:
+            candidates.setdefault(row[1], set()).add(payee_of[row[0]])
+    seen = set()
+    for user_id, payees in candidates.items():
+        payees = sorted(payees)
+        for i in range(0, len(payees), chunk_size):
+            chunk = payees[i:i + chunk_size]
+            cursor.execute(f'''SELECT payee FROM anomaly_payees
+                               WHERE user_id = ? AND payee IN ({', '.join('?' * len(chunk))})''',
+                           [user_id] + chunk)
+            seen.update((user_id, payee) for payee, in cursor.fetchall())
+
+    results, new_payees, touched = {}, [], set()
+    for transaction_id, user_id, category_id, amount, t_date, _ in rows:
+        t_date = str(t_date)[:10]
+        flags = []
+        baseline = baselines.get((user_id, category_id))
+        if baseline:
+            sample_size, median, scale, daily_mean, daily_std, last_date, last_count = baseline
+            if sample_size >= MIN_SAMPLES and scale > 0:
+                score = (amount - median) / scale
+                if abs(score) > amount_threshold:
+                    flags.append(('amount', round(score, 2), f"中位数 {median:.2f}，金额 {amount:.2f}"))
+            # 只跟踪最新一天的笔数；补录更早日期的交易不做频率检测
+            if t_date >= last_date:
+                count = last_count + 1 if t_date == last_date else 1
+                baseline[5:7] = [t_date, count]
+                touched.add((user_id, category_id))
+                scored = _frequency_z(count, daily_mean, daily_std)
+                if count >= MIN_SPIKE_COUNT and scored is not None and scored[0] > frequency_threshold:
+                    flags.append(('frequency', round(scored[0], 2),
+                                  f"当天 {count} 笔，近 {FREQUENCY_WINDOW} 天日均 {daily_mean:.2f} 笔"))
+
+        payee = payee_of[transaction_id]
+        if payee and (user_id, payee) not in seen:
+            seen.add((user_id, payee))
+            new_payees.append((user_id, payee, t_date))
+            if history[user_id] >= MIN_HISTORY:
+                flags.append(('new_payee', None, f"首次出现的收款方: {payee}"))
+        results[transaction_id] = flags
+
+    cursor.executemany('''UPDATE anomaly_baselines SET last_date = ?, last_date_count = ?
+                          WHERE user_id = ? AND category_id = ?''',
+                       [(baselines[key][5], baselines[key][6]) + key for key in sorted(touched)])
+    cursor.executemany('''INSERT INTO anomaly_payees (user_id, payee, first_seen) VALUES (?, ?, ?)
+                          ON CONFLICT(user_id, payee) DO NOTHING''', new_payees)
+    cursor.executemany('''
+        INSERT OR IGNORE INTO anomaly_flags (transaction_id, reason, user_id, score, detail)
+        VALUES (?, ?, ?, ?, ?)
+    ''', [(transaction_id, reason, user_id, score, detail)
+          for transaction_id, user_id, *_ in rows for reason, score, detail in results[transaction_id]])
+    return results
+
+
+def get_flags(user_id, include_reviewed=False, limit=100):
+    """
+    用户被标记的异常交易
+    :return: [(交易ID, 日期, 分类, 金额, 备注, 原因, 分数, 说明, 是否已复核)]，按日期倒序
+    """
+    query = '''
+        SELECT f.transaction_id, t.date, c.name, t.amount, t.description, f.reason, f.score, f.detail, f.reviewed
+        FROM anomaly_flags f
+        JOIN transactions t ON t.id = f.transaction_id
+        JOIN categories c ON c.id = t.category_id
+        WHERE f.user_id = ?
+    '''
+    if not include_reviewed:
+        query += ' AND f.reviewed = 0'
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(query + ' ORDER BY t.date DESC, f.transaction_id DESC LIMIT ?', (user_id, limit))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+
+def mark_reviewed(user_id, transaction_ids=None):
+    """把标记设为已复核（默认该用户全部标记），返回更新的条数"""
+    query = 'UPDATE anomaly_flags SET reviewed = 1 WHERE user_id = ?'
+    params = [user_id]
+    if transaction_ids:
+        query += f" AND transaction_id IN ({', '.join('?' * len(transaction_ids))})"
+        params.extend(transaction_ids)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    updated = cursor.rowcount
+    conn.commit()
+    conn.close()
+    return updated
+
+
+REASON_LABELS = {'amount': '金额异常', 'frequency': '频率突增', 'new_payee': '新收款方'}
+
+
+def print_flags(flags):
+    if not flags:
+        print("暂无异常交易")
+        return
+    print(f"\n{'ID':<8} {'日期':<12} {'分类':<8} {'金额':>10} {'原因':<8} 说明")
+    print("-" * 70)
+    for transaction_id, t_date, category, amount, _, reason, _, detail, reviewed in flags:
+        mark = ' (已复核)' if reviewed else ''
+        print(f"{transaction_id:<8} {str(t_date)[:10]:<12} {category:<8} {amount:>10.2f} "
+              f"{REASON_LABELS.get(reason, reason):<8} {detail}{mark}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='异常交易检测')
+    sub = parser.add_subparsers(dest='command', required=True)
+    scan_parser = sub.add_parser('scan', help='全量扫描并重建基线')
+    scan_parser.add_argument('--user', type=int, help='只扫描该用户')
+    scan_parser.add_argument('--amount-threshold', type=float, default=AMOUNT_THRESHOLD)
+    scan_parser.add_argument('--frequency-threshold', type=float, default=FREQUENCY_THRESHOLD)
+    report_parser = sub.add_parser('report', help='列出被标记的交易')
+    report_parser.add_argument('--user', type=int, required=True)
+    report_parser.add_argument('--all', action='store_true', help='包括已复核的标记')
+    report_parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+
+    if args.command == 'scan':
+        result = scan(args.user, args.amount_threshold, args.frequency_threshold)
+        if result:
+            flags = '，'.join(f"{REASON_LABELS[r]} {n}" for r, n in sorted(result['flags'].items())) or '无'
+            print(f"扫描 {result['transactions']} 笔交易，{result['baselines']} 个分类基线，"
+                  f"标记: {flags}，耗时 {result['seconds']:.2f} 秒")
+    else:
+        print_flags(get_flags(args.user, args.all, args.limit))
@@ -0,0 +1,234 @@
+# archive.py
+"""
+按年份归档历史交易
+
+已结束年份的交易可以迁移到 data/archive/finance-archive-<年份>.db，热库只保留近期数据。
+归档时在热库中保存按月汇总（archive_rollups），按月统计已归档年份时直接读取汇总。
+查询的日期范围覆盖已归档年份时，transactions_source 会 ATTACH 对应的归档文件，
+并返回热库与归档分区 UNION ALL 的子查询，调用方把它当作 transactions 表使用即可；
+日期范围只涉及近期数据时仍直接查询热库，不打开归档文件。
+
+归档后：
+- 账户余额不变，已归档交易的净额并入 accounts.initial_balance，对账只需扫描热库
+- 每日余额快照整体减去归档净额，历史日期的余额查询结果不变
+- 已归档的交易只读，不能再编辑或删除，也不参与全文搜索和重复检测
+
+用法：
+    python archive.py archive 2022
+    python archive.py list
+"""
+import argparse
+import os
+from datetime import datetime
+from database import get_db_connection
+
+ARCHIVE_DIR = os.path.join('data', 'archive')
+
+# 归档删除热库交易时暂停的逐行触发器，删除后由 archive_year 批量修正相应数据
+# （变更日志不逐条记录归档删除，而是写入一条 archive 事件；归档年份的预算支出保持不变）
+SUSPENDED_TRIGGERS = ('trg_daily_balances_delete', 'trg_checkpoint_invalidate_delete',
+                      'trg_change_log_transactions_delete', 'trg_budget_spend_delete')
+
+
+def archive_path(year, archive_dir=ARCHIVE_DIR):
+    return os.path.join(archive_dir, f'finance-archive-{year}.db')
+
+
+def get_archived_years(cursor):
+    """返回已归档年份 {年份: 归档文件路径}"""
+    cursor.execute('SELECT year, path FROM archived_years ORDER BY year')
+    return dict(cursor.fetchall())
+
+
+def _hot_columns(cursor):
+    cursor.execute('PRAGMA main.table_info(transactions)')
+    return [(row[1], row[2]) for row in cursor.fetchall()]
+
+
+def _attach(cursor, year, path):
+    """ATTACH 归档文件（已附加时跳过），返回 schema 名"""
+    schema = f'archive_{year}'
+    cursor.execute('PRAGMA database_list')
+    if schema not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute('ATTACH DATABASE ? AS ' + schema, (path,))
+    return schema
+
+
+def transactions_source(cursor, start_date=None, end_date=None):
+    """
+    返回覆盖指定日期范围的交易数据源
+    :param cursor: 查询将使用的游标（需要时在其连接上 ATTACH 归档文件，不能处于事务中）
+    :param start_date: 开始日期（为空表示不限）
+    :param end_date: 结束日期（为空表示不限）
+    :return: 可直接放在 FROM 之后的表名或子查询
+    """
+    archived = get_archived_years(cursor)
+    start_year = str(start_date)[:4] if start_date else None
+    end_year = str(end_date)[:4] if end_date else None
+    needed = [(year, path) for year, path in archived.items()
+              if (start_year is None or year >= start_year) and (end_year is None or year <= end_year)
+              and os.path.exists(path)]
+    if not needed:
+        return 'transactions'
+
+    columns = _hot_columns(cursor)
+    column_list = ', '.join(name for name, _ in columns)
+    parts = [f'SELECT {column_list} FROM main.transactions']
+    for year, path in needed:
+        schema = _attach(cursor, year, path)
+        cursor.execute(f'PRAGMA {schema}.table_info(transactions)')
+        archived_columns = {row[1] for row in cursor.fetchall()}
+        # 归档之后热库新增的列在归档分区中取 NULL
+        select_list = ', '.join(name if name in archived_columns else f'NULL AS {name}'
+                                for name, _ in columns)
+        parts.append(f'SELECT {select_list} FROM {schema}.transactions')
+    return '(' + ' UNION ALL '.join(parts) + ')'
+
+
+def get_monthly_rollups(cursor, user_id, year, reporting_currency):
+    """
+    读取已归档年份的按月汇总，按账户币种分组
+    :param reporting_currency: 报告币种，与其相同的币种折算日期为 NULL
+    :return: [(月份 'MM', 'YYYY-MM', 类型, 币种, 折算日期, 金额合计)]，该年未归档时返回空列表；
+             汇总已不区分日期，外币按该月最后一天的汇率折算
+    """
+    cursor.execute('''
+        SELECT substr(r.month, 6, 2) AS month, r.month AS month_year, r.type AS transaction_type, a.currency,
+               CASE WHEN a.currency = ? THEN NULL ELSE date(r.month || '-01', '+1 month', '-1 day') END AS rate_date,
+               SUM(r.total_amount) AS total_amount
+        FROM archive_rollups r
+        JOIN accounts a ON a.id = r.account_id
+        WHERE r.user_id = ? AND r.month LIKE ?
+        GROUP BY r.month, r.type, a.currency, rate_date
+        ORDER BY r.month, r.type
+    ''', (reporting_currency, user_id, f'{year}-%'))
+    return cursor.fetchall()
+
+
+def _suspend_triggers(cursor):
+    placeholders = ', '.join('?' * len(SUSPENDED_TRIGGERS))
+    cursor.execute(f"SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND name IN ({placeholders})",
+                   SUSPENDED_TRIGGERS)
+    saved = cursor.fetchall()
+    for name, _ in saved:
+        cursor.execute(f'DROP TRIGGER {name}')
+    return saved
+
+
+def archive_year(year, archive_dir=ARCHIVE_DIR):
+    """
+    把指定年份的交易从热库迁移到归档文件
+    :param year: 年份，必须早于当前年份
+    :return: {'year', 'path', 'archived', 'accounts'}；失败时返回 False
+    """
+    year = int(year)
+    if year >= datetime.now().year:
+        print(f"错误：只能归档已结束的年份（{year} 年尚未结束）")
+        return False
+
+    os.makedirs(archive_dir, exist_ok=True)
+    path = archive_path(year, archive_dir)
+    start, end = f'{year}-01-01', f'{year + 1}-01-01'
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        schema = _attach(cursor, year, path)
+        columns = _hot_columns(cursor)
+        column_defs = ', '.join(f'{name} {col_type} PRIMARY KEY' if name == 'id' else f'{name} {col_type}'
+                                for name, col_type in columns)
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS {schema}.transactions ({column_defs})')
+        cursor.execute(f'PRAGMA {schema}.table_info(transactions)')
+        archived_columns = {row[1] for row in cursor.fetchall()}
+        for name, col_type in columns:
+            if name not in archived_columns:
+                cursor.execute(f'ALTER TABLE {schema}.transactions ADD COLUMN {name} {col_type}')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_archive_user_date ON transactions(user_id, date)')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {schema}.idx_archive_account ON transactions(account_id)')
+
+        cursor.execute('BEGIN IMMEDIATE')
+        column_list = ', '.join(name for name, _ in columns)
+        cursor.execute(f'''
+            INSERT INTO {schema}.transactions ({column_list})
+            SELECT {column_list} FROM main.transactions WHERE date >= ? AND date < ?
+        ''', (start, end))
+        archived = cursor.rowcount
+        if archived == 0:
+            conn.rollback()
+            print(f"{year} 年没有需要归档的交易")
+            return {'year': year, 'path': path, 'archived': 0, 'accounts': 0}
+
+        cursor.execute('''
+            INSERT INTO archive_rollups (month, user_id, account_id, category_id, type, total_amount, transaction_count)
+            SELECT strftime('%Y-%m', date), user_id, account_id, category_id, type, SUM(amount), COUNT(*)
+            FROM main.transactions WHERE date >= ? AND date < ? AND transfer_id IS NULL
+            GROUP BY strftime('%Y-%m', date), user_id, account_id, category_id, type
+            ON CONFLICT(month, user_id, account_id, category_id, type) DO UPDATE SET
+                total_amount = total_amount + excluded.total_amount,
+                transaction_count = transaction_count + excluded.transaction_count
+        ''', (start, end))
+
+        cursor.execute('''
+            SELECT account_id, SUM(CASE WHEN type = 'income' THEN amount ELSE -amount END)
+            FROM main.transactions WHERE date >= ? AND date < ?
+            GROUP BY account_id
+        ''', (start, end))
+        account_nets = cursor.fetchall()
+
+        # 逐行触发器会对每条删除的交易更新之后所有日期的快照，这里暂停后按账户批量修正
+        saved_triggers = _suspend_triggers(cursor)
+        cursor.execute('DELETE FROM main.transactions WHERE date >= ? AND date < ?', (start, end))
+        for _, sql in saved_triggers:
+            cursor.execute(sql)
+
+        cursor.executemany('UPDATE accounts SET initial_balance = COALESCE(initial_balance, 0) + ? WHERE id = ?',
+                           [(net, account_id) for account_id, net in account_nets])
+        cursor.executemany('UPDATE daily_balances SET ledger_net = ledger_net - ? WHERE account_id = ?',
+                           [(net, account_id) for account_id, net in account_nets])
+        cursor.executemany('DELETE FROM balance_checkpoints WHERE account_id = ?',
+                           [(account_id,) for account_id, _ in account_nets])
+        cursor.execute('''
+            INSERT INTO change_log (table_name, op, row_id, payload)
+            VALUES ('transactions', 'archive', NULL, json_object('year', ?, 'path', ?, 'transactions', ?))
+        ''', (str(year), path, archived))
+        cursor.execute('''
+            INSERT INTO archived_years (year, path, transaction_count, archived_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(year) DO UPDATE SET path = excluded.path,
+                transaction_count = transaction_count + excluded.transaction_count,
+                archived_at = excluded.archived_at
+        ''', (str(year), path, archived))
+        conn.commit()
+        return {'year': year, 'path': path, 'archived': archived, 'accounts': len(account_nets)}
+    except Exception as e:
+        conn.rollback()
+        print(f"错误：归档 {year} 年交易失败: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='按年份归档历史交易')
+    sub = parser.add_subparsers(dest='command', required=True)
+    archive_parser = sub.add_parser('archive', help='归档指定年份')
+    archive_parser.add_argument('year', type=int)
+    archive_parser.add_argument('--dir', default=ARCHIVE_DIR, help='归档文件目录')
+    sub.add_parser('list', help='列出已归档年份')
+    args = parser.parse_args()
+
+    if args.command == 'archive':
+        result = archive_year(args.year, args.dir)
+        if result and result['archived']:
+            print(f"已归档 {result['year']} 年交易 {result['archived']} 条（涉及 {result['accounts']} 个账户）"
+                  f" -> {result['path']}")
+    else:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT year, path, transaction_count, archived_at FROM archived_years ORDER BY year')
+        rows = cursor.fetchall()
+        conn.close()
+        if not rows:
+            print("暂无归档")
+        for year, path, count, archived_at in rows:
+            print(f"{year}: {count} 条交易  {path}  (归档于 {archived_at})")
@@ -2,6 +2,13 @@
 import hashlib
 import sqlite3
 from database import get_db_connection
+from metrics import LOGIN_ATTEMPTS
+from log_config import get_logger
+
+logger = get_logger(__name__)
+
+_login_success = LOGIN_ATTEMPTS.labels(result='success')
+_login_failure = LOGIN_ATTEMPTS.labels(result='failure')
 
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -13,13 +20,13 @@ def register_user(username, password):
     try:
         cursor.execute('INSERT INTO users (username, password) VALUES (?, ?)', (username, hashed_password))
         conn.commit()
-        print(f"调试: 用户 {username} 注册成功，用户ID: {cursor.lastrowid}")  # 添加调试信息
+        logger.debug('用户 %s 注册成功，用户ID: %s', username, cursor.lastrowid)
         return True
     except sqlite3.IntegrityError:
-        print(f"调试: 用户名 {username} 已存在")  # 添加调试信息
+        logger.debug('用户名 %s 已存在', username)
         return False
     except Exception as e:
-        print(f"调试: 注册时发生错误: {str(e)}")  # 添加调试信息
+        logger.error('注册时发生错误: %s', e)
         return False
     finally:
         conn.close()
@@ -30,6 +37,7 @@ def login_user(username, password):
     hashed_password = hash_password(password)
     cursor.execute('SELECT id, username FROM users WHERE username = ? AND password = ?', (username, hashed_password))
     user = cursor.fetchone()
-    print(f"调试: 登录查询结果 - 用户: {user}")  # 添加调试信息
+    logger.debug('登录查询结果 - 用户: %s', user)
     conn.close()
+    (_login_success if user else _login_failure).inc()
     return user
\ No newline at end of file
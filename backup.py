@@ -0,0 +1,335 @@
+# backup.py
+"""
+在线备份与恢复
+
+使用 sqlite3.Connection.backup 按页分步复制数据库，每一步之间释放锁，
+备份期间 main.py 等读写方可以继续运行（若备份过程中源库被其他连接修改，
+SQLite 会自动从头重新复制，保证得到一致的快照）。
+
+- 可选 gzip 压缩
+- 按数量保留最近的备份，自动删除更早的备份
+- 备份完成后与恢复前执行 PRAGMA integrity_check 校验；校验失败的备份改名为 .failed，
+  不参与轮换，也不会被 list / restore 当作备份
+- 已归档年份的归档文件（archive.py）和分库文件（sharding.py）与主库一起备份，
+  放在同名的 .files 目录中，manifest.json 记录每个文件的原路径，恢复时写回原处。
+  各文件依次复制，不是跨文件的原子快照：备份期间不要归档或在分库中写入
+- 文件名包含微秒，同一秒内的多次备份不会互相覆盖
+
+用法：
+    python backup.py backup [--dir data/backups] [--compress] [--keep 7]
+    python backup.py verify data/backups/finance-20240101-120000-000000.db.gz
+    python backup.py restore data/backups/finance-20240101-120000-000000.db.gz
+    python backup.py list
+"""
+import argparse
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+import database
+import sharding
+from archive import get_archived_years
+
+DEFAULT_BACKUP_DIR = os.path.join('data', 'backups')
+BACKUP_PREFIX = 'finance-'
+COMPANION_SUFFIX = '.files'          # 归档文件和分库文件所在目录：<备份文件名>.files
+MANIFEST_NAME = 'manifest.json'
+FAILED_SUFFIX = '.failed'
+
+
+def _print_progress(status, remaining, total):
+    done = total - remaining
+    percent = done * 100 / total if total else 100
+    print(f"\r备份进度: {done}/{total} 页 ({percent:.0f}%)", end='', flush=True)
+
+
+def companion_dir(path):
+    """备份文件对应的归档文件 / 分库文件目录"""
+    return path + COMPANION_SUFFIX
+
+
+def read_manifest(path):
+    """备份中的附属文件 {备份内文件名: 原路径}，没有附属文件时返回空字典"""
+    manifest_path = os.path.join(companion_dir(path), MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _companion_files(cursor):
+    """
+    需要与主库一起备份的文件 {备份内文件名: 当前路径}：已归档年份的归档文件和分库文件
+    登记的归档文件不存在时抛出 FileNotFoundError（此时的备份无法完整恢复）
+    """
+    files = {}
+    for year, path in get_archived_years(cursor).items():
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{year} 年的归档文件不存在: {path}")
+        files[f'archive-{year}.db'] = path
+    if sharding.is_enabled():
+        for index in range(sharding.shard_count()):
+            path = sharding.shard_path(index)
+            if os.path.exists(path):
+                files[f'shard-{index}.db'] = path
+    return files
+
+
+def _verify_file(path):
+    """校验单个数据库文件（可以是 .gz），返回 (是否通过, 说明)"""
+    if not os.path.exists(path):
+        return False, f"备份文件不存在: {path}"
+    work_path = path
+    temp_dir = None
+    try:
+        if path.endswith('.gz'):
+            temp_dir = tempfile.mkdtemp(prefix='finance_verify_')
+            work_path = os.path.join(temp_dir, 'finance.db')
+            with gzip.open(path, 'rb') as src, open(work_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+        conn = sqlite3.connect(f'file:{work_path}?mode=ro', uri=True)
+        try:
+            result = conn.execute('PRAGMA integrity_check').fetchone()[0]
+            if result != 'ok':
+                return False, f"完整性检查失败: {result}"
+            count = conn.execute('SELECT COUNT(*) FROM transactions').fetchone()[0]
+        finally:
+            conn.close()
+        return True, f"校验通过，包含 {count} 条交易"
+    except (OSError, sqlite3.DatabaseError) as e:
+        return False, f"无法读取备份: {e}"
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def verify_backup(path):
+    """
+    校验备份文件及其归档文件 / 分库文件
+    :return: (是否通过, 说明)
+    """
+    ok, message = _verify_file(path)
+    if not ok:
+        return False, message
+    suffix = '.gz' if path.endswith('.gz') else ''
+    manifest = read_manifest(path)
+    for name in manifest:
+        companion_ok, companion_message = _verify_file(os.path.join(companion_dir(path), name + suffix))
+        if not companion_ok:
+            return False, f"{name}: {companion_message}"
+    if manifest:
+        message += f"，另含 {len(manifest)} 个归档 / 分库文件"
+    return True, message
+
+
+def list_backups(backup_dir=DEFAULT_BACKUP_DIR):
+    """返回备份文件路径列表，按时间从新到旧排序"""
+    if not os.path.isdir(backup_dir):
+        return []
+    names = [name for name in os.listdir(backup_dir)
+             if name.startswith(BACKUP_PREFIX) and (name.endswith('.db') or name.endswith('.db.gz'))]
+    # 文件名中的时间戳可直接按字符串排序
+    return [os.path.join(backup_dir, name) for name in sorted(names, reverse=True)]
+
+
+def rotate_backups(backup_dir=DEFAULT_BACKUP_DIR, keep=7):
+    """只保留最近 keep 个备份，返回被删除的文件列表"""
+    removed = []
+    for path in list_backups(backup_dir)[keep:]:
+        os.remove(path)
+        shutil.rmtree(companion_dir(path), ignore_errors=True)
+        removed.append(path)
+    return removed
+
+
+def _copy_database(source, final_path, compress, pages, progress=None, sleep=0.0):
+    """通过 backup API 把打开的连接 source 复制到 final_path（先写临时文件，完成后改名）"""
+    directory, name = os.path.split(final_path)
+    temp_path = os.path.join(directory, f'.{name}.tmp')
+    target = sqlite3.connect(temp_path)
+    try:
+        source.backup(target, pages=pages, progress=progress, sleep=sleep)
+    finally:
+        target.close()
+    if compress:
+        with open(temp_path, 'rb') as src, gzip.open(temp_path + '.gz', 'wb', compresslevel=6) as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+        os.remove(temp_path)
+        temp_path += '.gz'
+    os.replace(temp_path, final_path)
+
+
+def _unique_path(backup_dir, compress):
+    """精确到微秒的备份文件名，已存在时顺延，保证不会覆盖已有备份"""
+    now = datetime.now()
+    while True:
+        stamp = now.strftime('%Y%m%d-%H%M%S-%f')
+        path = os.path.join(backup_dir, f'{BACKUP_PREFIX}{stamp}.db' + ('.gz' if compress else ''))
+        if not os.path.exists(path):
+            return path
+        now += timedelta(microseconds=1)
+
+
+def backup_database(backup_dir=DEFAULT_BACKUP_DIR, pages=1024, compress=False, keep=7,
+                    verify=True, progress=None, sleep=0.005):
+    """
+    在线备份当前数据库（包括已归档年份的归档文件和分库文件）
+    :param backup_dir: 备份目录
+    :param pages: 每一步复制的页数，越小对并发读写的影响越小
+    :param compress: 是否 gzip 压缩
+    :param keep: 保留的备份数量（None 表示不清理）
+    :param verify: 备份完成后是否校验
+    :param progress: 进度回调 progress(status, remaining, total)，只用于主库
+    :param sleep: 每一步之间的等待秒数
+    :return: {'path', 'size_bytes', 'seconds', 'verified', 'removed', 'files'}，
+             登记的归档文件缺失时返回 False；校验失败时 path 为改名后的 .failed 文件，不清理旧备份
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    final_path = _unique_path(backup_dir, compress)
+    suffix = '.gz' if compress else ''
+
+    started = time.perf_counter()
+    source = database.get_db_connection()
+    try:
+        try:
+            companions = _companion_files(source.cursor())
+        except FileNotFoundError as e:
+            print(f"错误：{e}，备份无法完整恢复，已取消")
+            return False
+        _copy_database(source, final_path, compress, pages, progress, sleep)
+    finally:
+        source.close()
+
+    if companions:
+        files_dir = companion_dir(final_path)
+        os.makedirs(files_dir, exist_ok=True)
+        for name, path in companions.items():
+            companion = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+            try:
+                _copy_database(companion, os.path.join(files_dir, name + suffix), compress, pages, sleep=sleep)
+            finally:
+                companion.close()
+        with open(os.path.join(files_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(companions, f, ensure_ascii=False, indent=2)
+    elapsed = time.perf_counter() - started
+
+    verified = None
+    if verify:
+        verified, message = verify_backup(final_path)
+        if not verified:
+            print(f"错误：备份校验失败: {message}")
+            # 损坏的备份移到一边，不能计入 keep 挤掉更早的完好备份
+            failed_path = final_path + FAILED_SUFFIX
+            os.replace(final_path, failed_path)
+            if os.path.isdir(companion_dir(final_path)):
+                os.replace(companion_dir(final_path), companion_dir(failed_path))
+            final_path = failed_path
+
+    removed = rotate_backups(backup_dir, keep) if keep and verified is not False else []
+    return {
+        'path': final_path,
+        'size_bytes': os.path.getsize(final_path),
+        'seconds': round(elapsed, 4),
+        'verified': verified,
+        'removed': removed,
+        'files': sorted(companions),
+    }
+
+
+def _restore_file(path, target, pages, progress=None):
+    """把备份文件 path（可以是 .gz）通过 backup API 写入打开的连接 target"""
+    temp_dir = None
+    source_path = path
+    try:
+        if path.endswith('.gz'):
+            temp_dir = tempfile.mkdtemp(prefix='finance_restore_')
+            source_path = os.path.join(temp_dir, 'finance.db')
+            with gzip.open(path, 'rb') as src, open(source_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1024 * 1024)
+        source = sqlite3.connect(f'file:{source_path}?mode=ro', uri=True)
+        try:
+            source.backup(target, pages=pages, progress=progress)
+        finally:
+            source.close()
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def restore_backup(path, pages=1024, progress=None):
+    """
+    从备份恢复数据库（先校验备份，再通过 backup API 写回当前数据库），
+    归档文件和分库文件写回备份时的原路径
+    :return: (是否成功, 说明)
+    """
+    ok, message = verify_backup(path)
+    if not ok:
+        return False, message
+
+    suffix = '.gz' if path.endswith('.gz') else ''
+    try:
+        target = database.get_db_connection()
+        try:
+            _restore_file(path, target, pages, progress)
+        finally:
+            target.close()
+        for name, original_path in read_manifest(path).items():
+            os.makedirs(os.path.dirname(os.path.abspath(original_path)), exist_ok=True)
+            target = sqlite3.connect(original_path)
+            try:
+                _restore_file(os.path.join(companion_dir(path), name + suffix), target, pages)
+            finally:
+                target.close()
+        return True, f"已从 {path} 恢复（{message}）"
+    except (OSError, sqlite3.Error) as e:
+        return False, f"恢复失败: {e}"
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='数据库在线备份与恢复')
+    sub = parser.add_subparsers(dest='command', required=True)
+    backup_parser = sub.add_parser('backup', help='备份当前数据库')
+    backup_parser.add_argument('--dir', default=DEFAULT_BACKUP_DIR, help='备份目录')
+    backup_parser.add_argument('--pages', type=int, default=1024, help='每一步复制的页数')
+    backup_parser.add_argument('--compress', action='store_true', help='gzip 压缩')
+    backup_parser.add_argument('--keep', type=int, default=7, help='保留的备份数量')
+    backup_parser.add_argument('--no-verify', action='store_true', help='跳过校验')
+    verify_parser = sub.add_parser('verify', help='校验备份文件')
+    verify_parser.add_argument('path')
+    restore_parser = sub.add_parser('restore', help='从备份恢复')
+    restore_parser.add_argument('path')
+    list_parser = sub.add_parser('list', help='列出备份')
+    list_parser.add_argument('--dir', default=DEFAULT_BACKUP_DIR)
+    args = parser.parse_args()
+
+    if args.command == 'backup':
+        result = backup_database(args.dir, args.pages, args.compress, args.keep,
+                                 not args.no_verify, progress=_print_progress)
+        print()
+        if not result:
+            raise SystemExit(1)
+        if result['verified'] is False:
+            print(f"备份校验失败，已保留为 {result['path']}，未清理旧备份")
+            raise SystemExit(1)
+        print(f"备份完成: {result['path']} ({result['size_bytes'] / 1024 / 1024:.1f} MB, "
+              f"{result['seconds']:.2f}s)")
+        if result['files']:
+            print(f"归档 / 分库文件: {', '.join(result['files'])}")
+        for path in result['removed']:
+            print(f"已删除旧备份: {path}")
+    elif args.command == 'verify':
+        ok, message = verify_backup(args.path)
+        print(("✅ " if ok else "❌ ") + message)
+        raise SystemExit(0 if ok else 1)
+    elif args.command == 'restore':
+        ok, message = restore_backup(args.path, progress=_print_progress)
+        print()
+        print(("✅ " if ok else "❌ ") + message)
+        raise SystemExit(0 if ok else 1)
+    else:
+        for path in list_backups(args.dir):
+            print(f"{path}  {os.path.getsize(path) / 1024 / 1024:.1f} MB")
@@ -0,0 +1,114 @@
+# balance_history.py
+"""
+历史余额查询
+
+daily_balances 表记录每个账户在有交易的日期结束时的累计账本净额，
+由 transactions 上的触发器在增删改时增量维护（见 database.init_db）。
+任意日期的余额 = 初始余额 + 该日期或之前最近一条快照的累计净额，
+只需一次索引查找，不必从开户起累加所有交易。
+"""
+from datetime import datetime, timedelta
+from database import get_db_connection
+
+
+def rebuild_daily_balances(cursor, account_ids=None):
+    """
+    从账本重新计算每日余额快照
+    :param cursor: 数据库游标（由调用方负责提交）
+    :param account_ids: 只重建指定账户（默认全部）
+    """
+    where = ''
+    params = []
+    if account_ids:
+        placeholders = ', '.join('?' * len(account_ids))
+        where = f'WHERE account_id IN ({placeholders})'
+        params = list(account_ids)
+    cursor.execute(f'DELETE FROM daily_balances {where}', params)
+    cursor.execute(f'''
+        INSERT INTO daily_balances (account_id, balance_date, ledger_net)
+        SELECT account_id, balance_date,
+               SUM(day_net) OVER (PARTITION BY account_id ORDER BY balance_date)
+        FROM (
+            SELECT account_id, date(date) AS balance_date,
+                   SUM(CASE WHEN type = 'income' THEN amount ELSE -amount END) AS day_net
+            FROM transactions
+            {where}
+            GROUP BY account_id, date(date)
+        )
+    ''', params)
+
+
+def get_balance_at(account_id, date):
+    """
+    获取账户在指定日期结束时的余额
+    :param account_id: 账户ID
+    :param date: 日期 (YYYY-MM-DD)
+    :return: 余额，账户不存在时返回 None
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT COALESCE(a.initial_balance, 0) + COALESCE((
+            SELECT ledger_net FROM daily_balances
+            WHERE account_id = a.id AND balance_date <= ?
+            ORDER BY balance_date DESC LIMIT 1
+        ), 0)
+        FROM accounts a WHERE a.id = ?
+    ''', (date, account_id))
+    row = cursor.fetchone()
+    conn.close()
+    return round(row[0], 2) if row else None
+
+
+def get_balance_series(account_ids, start_date, end_date):
+    """
+    获取多个账户在日期范围内每天的余额
+    :param account_ids: 账户ID列表
+    :param start_date: 开始日期 (YYYY-MM-DD)
+    :param end_date: 结束日期 (YYYY-MM-DD)
+    :return: {账户ID: [(日期, 余额), ...]}，不存在的账户不出现在结果中
+    """
+    start = datetime.strptime(start_date, '%Y-%m-%d').date()
+    end = datetime.strptime(end_date, '%Y-%m-%d').date()
+    if start > end:
+        raise ValueError("开始日期不能晚于结束日期")
+    if not account_ids:
+        return {}
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    placeholders = ', '.join('?' * len(account_ids))
+
+    # 每个账户在开始日期前一天的余额（起点）
+    cursor.execute(f'''
+        SELECT a.id, COALESCE(a.initial_balance, 0) + COALESCE((
+            SELECT ledger_net FROM daily_balances
+            WHERE account_id = a.id AND balance_date < ?
+            ORDER BY balance_date DESC LIMIT 1
+        ), 0)
+        FROM accounts a WHERE a.id IN ({placeholders})
+    ''', [start_date] + list(account_ids))
+    opening = dict(cursor.fetchall())
+
+    # 范围内有变化的日期
+    cursor.execute(f'''
+        SELECT d.account_id, d.balance_date, COALESCE(a.initial_balance, 0) + d.ledger_net
+        FROM daily_balances d JOIN accounts a ON a.id = d.account_id
+        WHERE d.account_id IN ({placeholders}) AND d.balance_date BETWEEN ? AND ?
+        ORDER BY d.account_id, d.balance_date
+    ''', list(account_ids) + [start_date, end_date])
+    changes = {}
+    for account_id, balance_date, balance in cursor.fetchall():
+        changes.setdefault(account_id, {})[balance_date] = balance
+    conn.close()
+
+    days = [(start + timedelta(days=i)).strftime('%Y-%m-%d') for i in range((end - start).days + 1)]
+    series = {}
+    for account_id, balance in opening.items():
+        account_changes = changes.get(account_id, {})
+        points = []
+        for day in days:
+            balance = account_changes.get(day, balance)
+            points.append((day, round(balance, 2)))
+        series[account_id] = points
+    return series
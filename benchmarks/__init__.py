@@ -0,0 +1,2 @@
+# benchmarks 包：性能基准测试
+# 运行方式（在项目根目录下）：python -m benchmarks.run_benchmarks
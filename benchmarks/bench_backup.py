@@ -0,0 +1,90 @@
+# benchmarks/bench_backup.py
+"""
+在线备份基准
+
+对不同的分步页数分别执行一次备份（可选压缩），记录备份耗时、吞吐量，
+以及备份期间后台线程执行 get_all_accessible_transactions 的读延迟。
+数据库大小由 --transactions 控制，约 1000 万条交易时数据库为数 GB。
+
+用法：
+    python -m benchmarks.bench_backup --transactions 10000000
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.harness import environment_info, write_results
+from benchmarks.ledger_generator import generate_ledger
+from backup import backup_database, verify_backup
+from transaction_manager import get_all_accessible_transactions
+
+
+def _reader(stop, latencies):
+    """备份期间持续读取，记录每次查询耗时（毫秒）"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        get_all_accessible_transactions(1, {'start_date': '2024-12-01'})
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+def _timed_backup(backup_dir, pages, compress, db_size):
+    stop = threading.Event()
+    latencies = []
+    reader = threading.Thread(target=_reader, args=(stop, latencies), daemon=True)
+    reader.start()
+    result = backup_database(backup_dir, pages=pages, compress=compress, keep=None, verify=False)
+    stop.set()
+    reader.join()
+
+    verify_start = time.perf_counter()
+    verified, _ = verify_backup(result['path'])
+    latencies.sort()
+    return {
+        'pages_per_step': pages,
+        'compress': compress,
+        'seconds': result['seconds'],
+        'mb_per_second': round(db_size / 1024 / 1024 / result['seconds'], 1),
+        'backup_size_mb': round(result['size_bytes'] / 1024 / 1024, 1),
+        'verify_seconds': round(time.perf_counter() - verify_start, 4),
+        'verified': verified,
+        'reader_queries': len(latencies),
+        'reader_median_ms': round(statistics.median(latencies), 3) if latencies else None,
+        'reader_max_ms': round(latencies[-1], 3) if latencies else None,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='在线备份基准')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--output', help='结果 JSON 文件（默认输出到标准输出）')
+    args = parser.parse_args(argv)
+
+    work_dir = tempfile.mkdtemp(prefix='finance_bench_')
+    db_path = os.path.join(work_dir, 'finance.db')
+    ledger = generate_ledger(db_path, num_users=args.users, num_transactions=args.transactions)
+    db_size = os.path.getsize(db_path)
+    ledger['db_size_mb'] = round(db_size / 1024 / 1024, 1)
+
+    scenarios = {}
+    for pages, compress in ((-1, False), (4096, False), (256, False), (4096, True)):
+        backup_dir = os.path.join(work_dir, 'backups')
+        name = f"backup.pages_{'all' if pages < 0 else pages}" + ('.gzip' if compress else '')
+        scenarios[name] = _timed_backup(backup_dir, pages, compress, db_size)
+        shutil.rmtree(backup_dir)
+
+    write_results({'environment': environment_info(), 'ledger': ledger, 'scenarios': scenarios},
+                  args.output)
+
+
+if __name__ == '__main__':
+    main()
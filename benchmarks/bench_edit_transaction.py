@@ -0,0 +1,140 @@
+# benchmarks/bench_edit_transaction.py
+"""
+edit_transaction 微基准与并发一致性检查
+
+1. 微基准：分别计时「只改金额」「改类型」「换账户」三种编辑
+2. 并发检查：多个线程同时编辑同一批交易，结束后验证每个账户
+   (余额 - 账本净额) 与编辑前完全一致，即余额没有因并发而漂移
+
+用法：
+    python -m benchmarks.bench_edit_transaction --transactions 20000 --threads 8
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.harness import time_call, environment_info, write_results
+from benchmarks.ledger_generator import generate_ledger
+from database import get_db_connection
+from transaction_manager import edit_transaction
+
+
+def balance_offsets():
+    """每个账户的 (余额 - 账本净额)；余额与账本一致时，该值在任何编辑前后保持不变"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT a.id, a.balance - COALESCE(SUM(CASE WHEN t.type = 'income' THEN t.amount
+                                                   ELSE -t.amount END), 0)
+        FROM accounts a LEFT JOIN transactions t ON t.account_id = a.id
+        GROUP BY a.id
+    ''')
+    offsets = {account_id: round(offset, 2) for account_id, offset in cursor.fetchall()}
+    conn.close()
+    return offsets
+
+
+def _user_fixture():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT user_id FROM accounts GROUP BY user_id HAVING COUNT(*) >= 2 ORDER BY user_id LIMIT 1')
+    user_id = cursor.fetchone()[0]
+    cursor.execute('SELECT id FROM accounts WHERE user_id = ? ORDER BY id', (user_id,))
+    account_ids = [row[0] for row in cursor.fetchall()]
+    cursor.execute('SELECT id FROM transactions WHERE user_id = ? ORDER BY id', (user_id,))
+    transaction_ids = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return user_id, account_ids, transaction_ids
+
+
+def run_micro(user_id, account_ids, transaction_ids, repeat):
+    rng = random.Random(1)
+    tid = transaction_ids[0]
+    toggle = {'type': 'income', 'account': 0}
+
+    def edit_amount():
+        edit_transaction(tid, user_id, {'amount': round(rng.uniform(1, 500), 2)})
+
+    def edit_type():
+        toggle['type'] = 'expense' if toggle['type'] == 'income' else 'income'
+        edit_transaction(tid, user_id, {'type': toggle['type']})
+
+    def edit_account():
+        toggle['account'] = (toggle['account'] + 1) % len(account_ids)
+        edit_transaction(tid, user_id, {'account_id': account_ids[toggle['account']]})
+
+    return {
+        'edit_transaction.amount': time_call(edit_amount, repeat=repeat),
+        'edit_transaction.type': time_call(edit_type, repeat=repeat),
+        'edit_transaction.account': time_call(edit_account, repeat=repeat),
+    }
+
+
+def run_concurrency(user_id, account_ids, transaction_ids, threads, edits_per_thread):
+    """多线程并发编辑，返回一致性检查结果"""
+    before = balance_offsets()
+    hot_ids = transaction_ids[:20]  # 集中编辑少量交易，制造冲突
+    failures = []
+
+    def worker(seed):
+        rng = random.Random(seed)
+        for _ in range(edits_per_thread):
+            updates = {'amount': round(rng.uniform(1, 500), 2)}
+            if rng.random() < 0.5:
+                updates['account_id'] = rng.choice(account_ids)
+            if rng.random() < 0.3:
+                updates['type'] = rng.choice(['income', 'expense'])
+            if not edit_transaction(rng.choice(hot_ids), user_id, updates):
+                failures.append(updates)
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+    after = balance_offsets()
+    drifted = {account_id: (before[account_id], after[account_id])
+               for account_id in before if abs(before[account_id] - after[account_id]) > 0.005}
+    return {
+        'threads': threads,
+        'edits': threads * edits_per_thread,
+        'failed_edits': len(failures),
+        'drifted_accounts': len(drifted),
+        'consistent': not drifted,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='edit_transaction 微基准与并发一致性检查')
+    parser.add_argument('--transactions', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--edits-per-thread', type=int, default=200)
+    parser.add_argument('--output', help='结果 JSON 文件（默认输出到标准输出）')
+    args = parser.parse_args(argv)
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='finance_bench_'), 'finance.db')
+    ledger = generate_ledger(db_path, num_transactions=args.transactions)
+    user_id, account_ids, transaction_ids = _user_fixture()
+
+    results = {
+        'environment': environment_info(),
+        'ledger': ledger,
+        'scenarios': run_micro(user_id, account_ids, transaction_ids, args.repeat),
+        'concurrency': run_concurrency(user_id, account_ids, transaction_ids,
+                                       args.threads, args.edits_per_thread),
+    }
+    write_results(results, args.output)
+    return 0 if results['concurrency']['consistent'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,76 @@
+# benchmarks/bench_reconciliation.py
+"""
+余额对账基准
+
+计时三种情况：全量对账、无新交易的增量对账、新增少量交易后的增量对账。
+
+用法：
+    python -m benchmarks.bench_reconciliation --transactions 10000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.harness import environment_info, write_results
+from benchmarks.ledger_generator import generate_ledger
+from database import get_db_connection
+from reconciliation import reconcile_balances
+
+
+def _append_transactions(count):
+    """直接向账本追加 count 条交易（同时更新余额），模拟两次对账之间的新写入"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id, user_id FROM accounts ORDER BY id')
+    accounts = cursor.fetchall()
+    cursor.execute("SELECT id FROM categories WHERE user_id IS NULL AND type = 'expense' LIMIT 1")
+    category_id = cursor.fetchone()[0]
+    rows = [(accounts[i % len(accounts)][1], accounts[i % len(accounts)][0], 'expense', 1.0,
+             category_id, '2024-12-30', None) for i in range(count)]
+    cursor.executemany('''INSERT INTO transactions
+                          (user_id, account_id, type, amount, category_id, date, description)
+                          VALUES (?, ?, ?, ?, ?, ?, ?)''', rows)
+    cursor.executemany('UPDATE accounts SET balance = balance - ? WHERE id = ?',
+                       [(sum(1 for r in rows if r[1] == account_id), account_id) for account_id, _ in accounts])
+    conn.commit()
+    conn.close()
+
+
+def _timed(**kwargs):
+    start = time.perf_counter()
+    report = reconcile_balances(**kwargs)
+    return {
+        'seconds': round(time.perf_counter() - start, 4),
+        'transactions_scanned': report['transactions_scanned'],
+        'mismatches': len(report['mismatches']),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='余额对账基准')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--append', type=int, default=1000, help='两次对账之间新增的交易数')
+    parser.add_argument('--output', help='结果 JSON 文件（默认输出到标准输出）')
+    args = parser.parse_args(argv)
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='finance_bench_'), 'finance.db')
+    ledger = generate_ledger(db_path, num_users=args.users, num_transactions=args.transactions)
+
+    scenarios = {'reconcile.full': _timed(full=True),
+                 'reconcile.incremental_no_changes': _timed()}
+    _append_transactions(args.append)
+    scenarios['reconcile.incremental_after_append'] = _timed()
+
+    write_results({'environment': environment_info(), 'ledger': ledger, 'scenarios': scenarios},
+                  args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+# benchmarks/bench_search.py
+"""
+备注全文搜索基准
+
+对比 search_transactions（FTS5 索引）与直接 LIKE 扫描同一检索词的耗时。
+
+用法：
+    python -m benchmarks.bench_search --transactions 2000000
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.harness import time_call, environment_info, write_results
+from benchmarks.ledger_generator import generate_ledger
+from database import get_db_connection
+from transaction_search import search_transactions
+from query_builder import ACCESSIBLE_CONDITION
+
+
+def like_scan(user_id, term, limit):
+    """不使用全文索引的基线：LIKE 全表扫描"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT t.id, t.type, t.amount, t.date, t.description FROM transactions t
+        WHERE {ACCESSIBLE_CONDITION} AND t.description LIKE ?
+        ORDER BY t.date DESC LIMIT ?
+    ''', (user_id, user_id, f'%{term}%', limit))
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='备注全文搜索基准')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--transactions', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--output', help='结果 JSON 文件（默认输出到标准输出）')
+    args = parser.parse_args(argv)
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='finance_bench_'), 'finance.db')
+    ledger = generate_ledger(db_path, num_users=args.users, num_transactions=args.transactions)
+    user_id = 1
+
+    scenarios = {}
+    for term in ('超市购物', '培训课程', '医院挂号'):
+        scenarios[f'search.fts.{term}'] = time_call(
+            lambda: search_transactions(user_id, term, limit=args.limit), repeat=args.repeat)
+        scenarios[f'search.like_scan.{term}'] = time_call(
+            lambda: like_scan(user_id, term, args.limit), repeat=args.repeat)
+    scenarios['search.short_term_like.午餐'] = time_call(
+        lambda: search_transactions(user_id, '午餐', limit=args.limit), repeat=args.repeat)
+
+    write_results({'environment': environment_info(), 'ledger': ledger, 'scenarios': scenarios},
+                  args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+# benchmarks/bench_sharding.py
+"""
+分库写入吞吐基准
+
+对不同分库数量，用多个线程同时为不同用户逐笔写入交易（每笔单独提交），
+记录总吞吐量（笔/秒）以及 database is locked 失败次数。
+
+用法：
+    python -m benchmarks.bench_sharding --shards 1 2 4 8 --writers 8
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.harness import environment_info, write_results
+import database
+import sharding
+
+
+def _setup(work_dir, shard_count, num_users):
+    database.DB_PATH = os.path.join(work_dir, 'finance.db')
+    sharding.configure(shard_count, os.path.join(work_dir, 'shards'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.init_db()
+        sharding.init_shards()
+    conn = database.get_db_connection()
+    conn.executemany('INSERT INTO users (id, username, password) VALUES (?, ?, ?)',
+                     [(uid, f'bench_user_{uid:05d}', 'x') for uid in range(1, num_users + 1)])
+    conn.commit()
+    conn.close()
+    return {uid: sharding.create_account(uid, '现金', 'cash', 1000.0) for uid in range(1, num_users + 1)}
+
+
+def _writer(user_ids, accounts, per_writer, category_id, failures):
+    for i in range(per_writer):
+        uid = user_ids[i % len(user_ids)]
+        ok = sharding.add_transaction(uid, accounts[uid], 'expense', 1.5, category_id,
+                                      '2024-06-01', f'bench {i}')
+        if not ok:
+            failures.append(uid)
+
+
+def run_scenario(shard_count, writers, per_writer, num_users):
+    work_dir = tempfile.mkdtemp(prefix='finance_bench_')
+    accounts = _setup(work_dir, shard_count, num_users)
+    conn = sharding.get_shard_connection(0)
+    category_id = conn.execute("SELECT id FROM categories WHERE user_id IS NULL AND type = 'expense'").fetchone()[0]
+    conn.close()
+
+    failures = []
+    user_ids = sorted(accounts)
+    threads = [threading.Thread(target=_writer,
+                                args=(user_ids[w::writers], accounts, per_writer, category_id, failures))
+               for w in range(writers)]
+    # 标准输出重定向是进程级的，只能在所有线程外层做一次
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+    total = writers * per_writer - len(failures)
+    return {
+        'shards': shard_count,
+        'writers': writers,
+        'transactions': total,
+        'failures': len(failures),
+        'seconds': round(elapsed, 4),
+        'transactions_per_second': round(total / elapsed, 1),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='分库写入吞吐基准')
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--writers', type=int, default=8, help='并发写入线程数')
+    parser.add_argument('--per-writer', type=int, default=500, help='每个线程写入的交易数')
+    parser.add_argument('--users', type=int, default=64)
+    parser.add_argument('--output', help='结果 JSON 文件（默认输出到标准输出）')
+    args = parser.parse_args(argv)
+
+    scenarios = {f'sharding.write.shards_{count}': run_scenario(count, args.writers, args.per_writer, args.users)
+                 for count in args.shards}
+    write_results({'environment': environment_info(), 'scenarios': scenarios}, args.output)
+
+
+if __name__ == '__main__':
+    main()
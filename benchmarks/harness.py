@@ -0,0 +1,98 @@
+# benchmarks/harness.py
+"""基准测试公共工具：计时、环境信息、JSON 结果输出与对比"""
+import contextlib
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+
+def time_call(func, repeat=20, warmup=2, quiet=True):
+    """
+    重复执行 func 并统计耗时
+    :param func: 无参可调用对象
+    :param repeat: 计时次数
+    :param warmup: 预热次数（不计时）
+    :param quiet: 是否屏蔽 func 的标准输出
+    :return: 以毫秒为单位的统计结果字典
+    """
+    samples = []
+    with open(os.devnull, 'w') as devnull:
+        redirect = contextlib.redirect_stdout(devnull) if quiet else contextlib.nullcontext()
+        with redirect:
+            for _ in range(warmup):
+                func()
+            for _ in range(repeat):
+                start = time.perf_counter()
+                func()
+                samples.append((time.perf_counter() - start) * 1000)
+
+    samples.sort()
+    p95_index = min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))
+    return {
+        'repeat': repeat,
+        'min_ms': round(samples[0], 4),
+        'median_ms': round(statistics.median(samples), 4),
+        'mean_ms': round(statistics.fmean(samples), 4),
+        'p95_ms': round(samples[p95_index], 4),
+        'max_ms': round(samples[-1], 4),
+    }
+
+
+def git_revision():
+    """当前代码的 git 提交号（不可用时返回 None）"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment_info():
+    """运行环境信息，写入结果文件便于对比"""
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': sys.version.split()[0],
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+    }
+
+
+def write_results(results, output=None):
+    """将结果以 JSON 写入文件；output 为空时输出到标准输出"""
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+def compare_results(baseline, current, metric='median_ms', threshold=0.10):
+    """
+    对比两次运行结果
+    :return: [(场景名, 基线耗时, 当前耗时, 变化比例, 是否退化)]
+    """
+    rows = []
+    for name, stats in current.get('scenarios', {}).items():
+        old = baseline.get('scenarios', {}).get(name)
+        if not old or not old.get(metric):
+            continue
+        change = (stats[metric] - old[metric]) / old[metric]
+        rows.append((name, old[metric], stats[metric], change, change > threshold))
+    return rows
+
+
+def print_comparison(rows, metric='median_ms'):
+    print(f"\n{'场景':<40} {'基线':>10} {'当前':>10} {'变化':>8}")
+    print("-" * 72)
+    for name, old, new, change, regressed in rows:
+        flag = ' ⚠️' if regressed else ''
+        print(f"{name:<40} {old:>10.3f} {new:>10.3f} {change * 100:>7.1f}%{flag}")
+    print(f"(指标: {metric})")
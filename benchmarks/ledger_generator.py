@@ -0,0 +1,192 @@
+# benchmarks/ledger_generator.py
+"""
+确定性的合成账本生成器
+
+按给定的随机种子生成 N 个用户、每个用户若干账户、账户共享关联以及 M 条交易，
+写入一个全新的 finance.db。相同参数 + 相同种子 => 完全相同的数据库内容，
+便于在不同版本之间对比基准测试结果。
+
+用法：
+    python -m benchmarks.ledger_generator --db /tmp/finance.db --users 50 --transactions 100000
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+# 允许以脚本方式运行时导入项目根目录下的模块
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+import database
+from auth import hash_password
+from dedup import transaction_fingerprint
+
+ACCOUNT_TYPES = ['现金', '银行卡', '支付宝', '微信钱包', '信用卡']
+DESCRIPTIONS = {
+    'income': ['月度工资', '年终奖', '项目奖金', '兼职收入', '理财收益'],
+    'expense': ['午餐', '晚餐', '地铁', '打车', '超市购物', '网购', '电影票',
+                '医院挂号', '培训课程', '咖啡', '房租', '水电费', None],
+}
+
+DEFAULT_START_DATE = date(2023, 1, 1)
+DEFAULT_DAYS = 730
+
+
+def username_for(index):
+    """第 index 个合成用户的用户名（从 0 开始）"""
+    return f'bench_user_{index:05d}'
+
+
+def password_for(index):
+    """第 index 个合成用户的明文密码"""
+    return f'password_{index:05d}'
+
+
+def use_database(db_path):
+    """将数据库模块指向 db_path（所有 get_db_connection 调用都会使用该文件）"""
+    database.DB_PATH = db_path
+
+
+def _insert_transactions(cursor, rows):
+    cursor.executemany('''INSERT INTO transactions
+                          (user_id, account_id, type, amount, category_id, date, description, fingerprint)
+                          VALUES (?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+
+
+def generate_ledger(db_path, num_users=20, accounts_per_user=3, num_links=10,
+                    num_transactions=10000, seed=42, start_date=DEFAULT_START_DATE,
+                    days=DEFAULT_DAYS):
+    """
+    生成合成账本
+    :param db_path: 目标数据库文件路径（已存在则删除重建）
+    :param num_users: 用户数量
+    :param accounts_per_user: 每个用户的账户数量
+    :param num_links: 账户共享关联数量
+    :param num_transactions: 交易数量
+    :param seed: 随机种子
+    :param start_date: 交易日期起点
+    :param days: 交易日期跨度（天）
+    :return: 生成结果的摘要字典
+    """
+    rng = random.Random(seed)
+
+    db_dir = os.path.dirname(os.path.abspath(db_path))
+    os.makedirs(db_dir, exist_ok=True)
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    use_database(db_path)
+
+    # init_db 会打印预置分类信息，这里静默处理
+    with contextlib.redirect_stdout(io.StringIO()):
+        database.init_db()
+
+    conn = database.get_db_connection()
+    cursor = conn.cursor()
+
+    # 1. 用户
+    users = [(username_for(i), hash_password(password_for(i))) for i in range(num_users)]
+    cursor.executemany('INSERT INTO users (username, password) VALUES (?, ?)', users)
+    cursor.execute('SELECT id FROM users ORDER BY id')
+    user_ids = [row[0] for row in cursor.fetchall()]
+
+    # 2. 账户（余额先记为初始余额，交易写入后再累加）
+    balances = {}
+    account_owner = {}
+    for user_id in user_ids:
+        for j in range(accounts_per_user):
+            acc_type = ACCOUNT_TYPES[j % len(ACCOUNT_TYPES)]
+            initial = round(rng.uniform(0, 20000), 2)
+            cursor.execute('''INSERT INTO accounts (user_id, name, type, balance, initial_balance)
+                              VALUES (?, ?, ?, ?, ?)''',
+                           (user_id, f'{acc_type}{j + 1}', acc_type, initial, initial))
+            balances[cursor.lastrowid] = initial
+            account_owner[cursor.lastrowid] = user_id
+    account_ids = sorted(balances)
+
+    # 3. 共享关联（跳过自己和重复关联；同一用户同一账户只能关联一次，与 UNIQUE(linked_user_id, account_id) 一致）
+    links = {}
+    if num_users > 1:
+        attempts = 0
+        while len(links) < num_links and attempts < num_links * 20:
+            attempts += 1
+            account_id = rng.choice(account_ids)
+            linked_user_id = rng.choice(user_ids)
+            if linked_user_id == account_owner[account_id]:
+                continue
+            permission = rng.choice(['read', 'write'])
+            links.setdefault((linked_user_id, account_id),
+                             (account_owner[account_id], linked_user_id, account_id, permission))
+    cursor.executemany('''INSERT INTO user_account_links
+                          (owner_user_id, linked_user_id, account_id, permission_level)
+                          VALUES (?, ?, ?, ?)''', sorted(links.values()))
+
+    # 4. 交易（只使用预置分类）
+    # 转账分类只用于 transfers.py 写入的转账腿
+    cursor.execute("SELECT id, type FROM categories WHERE user_id IS NULL AND name != '转账' ORDER BY id")
+    categories = {'income': [], 'expense': []}
+    for cid, ctype in cursor.fetchall():
+        categories[ctype].append(cid)
+
+    # 按生成顺序写入（日期随机，包含补录的历史交易），随机数的抽取顺序保持不变，
+    # 相同参数 + 相同种子在各个版本生成相同的交易
+    batch = []
+    for _ in range(num_transactions):
+        account_id = rng.choice(account_ids)
+        user_id = account_owner[account_id]
+        t_type = 'income' if rng.random() < 0.2 else 'expense'
+        if t_type == 'income':
+            amount = round(rng.uniform(1000, 20000), 2)
+            balances[account_id] += amount
+        else:
+            amount = round(rng.uniform(1, 800), 2)
+            balances[account_id] -= amount
+        t_date = (start_date + timedelta(days=rng.randrange(days))).strftime('%Y-%m-%d')
+        category_id = rng.choice(categories[t_type])
+        description = rng.choice(DESCRIPTIONS[t_type])
+        batch.append((user_id, account_id, t_type, amount, category_id, t_date, description,
+                      transaction_fingerprint(account_id, t_type, amount, t_date, description)))
+        if len(batch) >= 5000:
+            _insert_transactions(cursor, batch)
+            batch = []
+    if batch:
+        _insert_transactions(cursor, batch)
+
+    cursor.executemany('UPDATE accounts SET balance = ? WHERE id = ?',
+                       [(round(balance, 2), account_id) for account_id, balance in balances.items()])
+
+    conn.commit()
+    conn.close()
+
+    return {
+        'db_path': db_path,
+        'seed': seed,
+        'users': len(user_ids),
+        'accounts': len(account_ids),
+        'links': len(links),
+        'transactions': num_transactions,
+        'start_date': start_date.strftime('%Y-%m-%d'),
+        'end_date': (start_date + timedelta(days=days - 1)).strftime('%Y-%m-%d'),
+    }
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description='生成确定性的合成账本数据库')
+    parser.add_argument('--db', default='data/bench_finance.db', help='输出数据库路径')
+    parser.add_argument('--users', type=int, default=20, help='用户数量')
+    parser.add_argument('--accounts-per-user', type=int, default=3, help='每个用户的账户数量')
+    parser.add_argument('--links', type=int, default=10, help='账户共享关联数量')
+    parser.add_argument('--transactions', type=int, default=10000, help='交易数量')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_arg_parser().parse_args()
+    summary = generate_ledger(args.db, args.users, args.accounts_per_user, args.links,
+                              args.transactions, args.seed)
+    print(summary)
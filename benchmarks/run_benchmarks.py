@@ -0,0 +1,147 @@
+# benchmarks/run_benchmarks.py
+"""
+账本核心操作的基准测试
+
+先用 ledger_generator 生成一个确定性的数据库，然后对以下场景计时：
+  - add_transaction（最新日期 / 补录到最早日期，后者需要更新之后每天的余额快照）
+  - get_transactions（无过滤 / 各个过滤条件 / 组合过滤）
+  - StatisticsManager 的全部统计方法（含分类预测和收款方排行）
+  - get_accounts（包含关联账户）
+  - login_user
+
+结果以 JSON 输出，可用 --baseline 与之前的结果对比。
+
+用法：
+    python -m benchmarks.run_benchmarks --transactions 50000 --output results.json
+    python -m benchmarks.run_benchmarks --baseline old.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+from benchmarks.harness import (time_call, environment_info, write_results,
+                                compare_results, print_comparison)
+from benchmarks.ledger_generator import generate_ledger, username_for, password_for
+from database import get_db_connection
+from auth import login_user
+from account_manager import get_accounts
+from transaction_manager import add_transaction, get_transactions
+from mystatistics import StatisticsManager
+
+
+def _pick_fixtures():
+    """从生成的数据库中挑选基准测试用到的用户、账户和分类"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''SELECT user_id, COUNT(*) FROM transactions
+                      GROUP BY user_id ORDER BY COUNT(*) DESC, user_id LIMIT 1''')
+    user_id = cursor.fetchone()[0]
+    cursor.execute('SELECT id FROM accounts WHERE user_id = ? ORDER BY id LIMIT 1', (user_id,))
+    account_id = cursor.fetchone()[0]
+    cursor.execute("SELECT id FROM categories WHERE user_id IS NULL AND type = 'expense' ORDER BY id LIMIT 1")
+    category_id = cursor.fetchone()[0]
+    cursor.execute('SELECT linked_user_id FROM user_account_links ORDER BY id LIMIT 1')
+    row = cursor.fetchone()
+    linked_user_id = row[0] if row else user_id
+    cursor.execute('SELECT username FROM users WHERE id = ?', (user_id,))
+    username = cursor.fetchone()[0]
+    conn.close()
+    index = int(username.rsplit('_', 1)[1])
+    return {
+        'user_id': user_id,
+        'account_id': account_id,
+        'category_id': category_id,
+        'linked_user_id': linked_user_id,
+        'username': username_for(index),
+        'password': password_for(index),
+    }
+
+
+def build_scenarios(fx, start_date, end_date):
+    """返回 [(场景名, 可调用对象)]，只读场景在前，写场景在后"""
+    uid = fx['user_id']
+    mid_date = f"{end_date[:4]}-01-01"
+
+    def stats(method, *args):
+        def run():
+            with StatisticsManager(uid) as manager:
+                getattr(manager, method)(*args, display=False)
+        return run
+
+    scenarios = [
+        ('login_user', lambda: login_user(fx['username'], fx['password'])),
+        ('get_accounts.include_linked', lambda: get_accounts(fx['linked_user_id'], include_linked=True)),
+        ('get_transactions.all', lambda: get_transactions(uid)),
+        ('get_transactions.type', lambda: get_transactions(uid, {'type': 'income'})),
+        ('get_transactions.category_id', lambda: get_transactions(uid, {'category_id': fx['category_id']})),
+        ('get_transactions.date_range', lambda: get_transactions(uid, {'start_date': mid_date,
+                                                                       'end_date': end_date})),
+        ('get_transactions.combined', lambda: get_transactions(uid, {'type': 'expense',
+                                                                     'category_id': fx['category_id'],
+                                                                     'start_date': mid_date,
+                                                                     'end_date': end_date})),
+        ('statistics.get_by_category', stats('get_by_category', start_date, end_date)),
+        ('statistics.get_by_month', stats('get_by_month', int(end_date[:4]))),
+        ('statistics.get_by_account', stats('get_by_account', start_date, end_date)),
+        ('statistics.get_financial_summary', stats('get_financial_summary', start_date, end_date)),
+        ('statistics.get_forecast', stats('get_forecast', 'expense', 3)),
+        ('statistics.get_top_payees.exact', stats('get_top_payees', mid_date, end_date, 10)),
+        ('statistics.get_top_payees.all_history', stats('get_top_payees', None, None, 10)),
+        ('add_transaction', lambda: add_transaction(uid, fx['account_id'], 'expense', 12.5,
+                                                    fx['category_id'], end_date, '基准测试')),
+        ('add_transaction.backdated', lambda: add_transaction(uid, fx['account_id'], 'expense', 12.5,
+                                                              fx['category_id'], start_date, '基准测试补录')),
+    ]
+    return scenarios
+
+
+def run(args):
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix='finance_bench_'), 'finance.db')
+    ledger = generate_ledger(db_path, args.users, args.accounts_per_user, args.links,
+                             args.transactions, args.seed)
+    fixtures = _pick_fixtures()
+
+    results = {
+        'environment': environment_info(),
+        'ledger': ledger,
+        'scenarios': {},
+    }
+    only = set(args.only.split(',')) if args.only else None
+    for name, func in build_scenarios(fixtures, ledger['start_date'], ledger['end_date']):
+        if only and name not in only:
+            continue
+        results['scenarios'][name] = time_call(func, repeat=args.repeat, warmup=args.warmup)
+        print(f"{name:<40} median {results['scenarios'][name]['median_ms']:>10.3f} ms", file=sys.stderr)
+    return results
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description='个人账簿核心操作基准测试')
+    parser.add_argument('--db', help='生成的数据库路径（默认使用临时目录）')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--accounts-per-user', type=int, default=3)
+    parser.add_argument('--links', type=int, default=10)
+    parser.add_argument('--transactions', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=20, help='每个场景的计时次数')
+    parser.add_argument('--warmup', type=int, default=2, help='每个场景的预热次数')
+    parser.add_argument('--only', help='只运行指定场景（逗号分隔）')
+    parser.add_argument('--output', help='结果 JSON 文件（默认输出到标准输出）')
+    parser.add_argument('--baseline', help='用于对比的历史结果 JSON 文件')
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_arg_parser().parse_args()
+    results = run(args)
+    write_results(results, args.output)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print_comparison(compare_results(baseline, results))
@@ -0,0 +1,228 @@
+# budgets.py
+"""
+预算
+
+每个预算针对一个用户的某个支出分类（或全部支出），按月或按年计算。
+budget_spend 中每个预算每个周期的已支出金额（不含转账）由 transactions 上的触发器在增删改时增量维护
+（见 database.init_db），查询剩余预算只需一次主键查找，不必重新汇总交易。
+已支出金额首次达到 alert_ratio 和超过预算时，触发器各写入一条 budget_alerts 提醒。
+每个预算有一个币种，只统计该币种账户上的支出；不同币种的账户需要分别设置预算。
+"""
+from datetime import date
+from database import get_db_connection
+from currency import BASE_CURRENCY
+
+PERIODS = ('monthly', 'yearly')
+
+
+def period_key(period, on_date=None):
+    """日期所属的预算周期键：按月为 YYYY-MM，按年为 YYYY"""
+    on_date = str(on_date or date.today())
+    return on_date[:4] if period == 'yearly' else on_date[:7]
+
+
+def rebuild_budget_spend(cursor, budget_id):
+    """从账本重新计算一个预算各周期的已支出金额（由调用方负责提交）"""
+    cursor.execute('DELETE FROM budget_spend WHERE budget_id = ?', (budget_id,))
+    cursor.execute('''
+        INSERT INTO budget_spend (budget_id, period_key, spent)
+        SELECT b.id,
+               CASE b.period WHEN 'yearly' THEN strftime('%Y', t.date) ELSE strftime('%Y-%m', t.date) END AS pk,
+               SUM(t.amount)
+        FROM budgets b
+        JOIN transactions t ON t.user_id = b.user_id AND t.type = 'expense' AND t.transfer_id IS NULL
+             AND (b.category_id IS NULL OR t.category_id = b.category_id)
+        JOIN accounts a ON a.id = t.account_id AND a.currency = b.currency
+        WHERE b.id = ?
+        GROUP BY pk
+    ''', (budget_id,))
+
+
+def check_alerts(cursor, budget_id, on_date=None):
+    """
+    按预算当前的金额和提醒比例检查指定日期所在周期，补写尚未发出的提醒（由调用方负责提交）
+    触发器只在已支出增加时检查，修改预算金额或提醒比例后需要调用本函数
+    """
+    cursor.execute('''
+        INSERT INTO budget_alerts (budget_id, period_key, threshold, spent, budget_amount)
+        SELECT b.id, s.period_key, r.ratio, s.spent, b.amount
+        FROM budgets b
+        JOIN budget_spend s ON s.budget_id = b.id
+             AND s.period_key = CASE b.period WHEN 'yearly' THEN ? ELSE ? END
+        JOIN (SELECT alert_ratio AS ratio FROM budgets WHERE id = ? UNION SELECT 1.0) r
+        WHERE b.id = ? AND s.spent >= b.amount * r.ratio
+          AND NOT EXISTS (SELECT 1 FROM budget_alerts
+                          WHERE budget_id = b.id AND period_key = s.period_key AND threshold = r.ratio)
+    ''', (period_key('yearly', on_date), period_key('monthly', on_date), budget_id, budget_id))
+
+
+def set_budget(user_id, amount, category_id=None, period='monthly', alert_ratio=0.8, currency=BASE_CURRENCY):
+    """
+    设置预算（同一用户、分类、周期、币种已有预算时更新金额和提醒比例）
+    设置后立即按当前周期的已支出检查提醒，例如把预算调低到已支出以下会马上提醒
+    :param category_id: 支出分类ID，为空表示全部支出
+    :param currency: 预算币种，只统计该币种账户上的支出
+    :return: 预算ID，失败时返回 False
+    """
+    if period not in PERIODS:
+        print(f"错误：预算周期必须是 {' 或 '.join(PERIODS)}")
+        return False
+    if amount <= 0 or not 0 < alert_ratio <= 1:
+        print("错误：预算金额必须大于0，提醒比例必须在 0 到 1 之间")
+        return False
+
+    currency = (currency or BASE_CURRENCY).upper()
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if category_id is not None:
+            cursor.execute('''SELECT id FROM categories WHERE id = ? AND type = 'expense'
+                              AND (user_id = ? OR user_id IS NULL)''', (category_id, user_id))
+            if not cursor.fetchone():
+                print("错误：分类不存在或不是支出分类。")
+                return False
+        cursor.execute('''SELECT id FROM budgets
+                          WHERE user_id = ? AND IFNULL(category_id, 0) = IFNULL(?, 0) AND period = ?
+                            AND currency = ?''',
+                       (user_id, category_id, period, currency))
+        row = cursor.fetchone()
+        if row:
+            budget_id = row[0]
+            cursor.execute('UPDATE budgets SET amount = ?, alert_ratio = ? WHERE id = ?',
+                           (amount, alert_ratio, budget_id))
+        else:
+            cursor.execute('''INSERT INTO budgets (user_id, category_id, period, amount, alert_ratio, currency)
+                              VALUES (?, ?, ?, ?, ?, ?)''',
+                           (user_id, category_id, period, amount, alert_ratio, currency))
+            budget_id = cursor.lastrowid
+            # 新预算从已有交易回填各周期的支出（回填不对过去的周期提醒）
+            rebuild_budget_spend(cursor, budget_id)
+            cursor.execute('DELETE FROM budget_alerts WHERE budget_id = ?', (budget_id,))
+        check_alerts(cursor, budget_id)
+        conn.commit()
+        return budget_id
+    except Exception as e:
+        conn.rollback()
+        print(f"错误：设置预算失败: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+def delete_budget(user_id, budget_id):
+    """删除预算及其支出记录和提醒，返回是否成功"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM budgets WHERE id = ? AND user_id = ?', (budget_id, user_id))
+    deleted = cursor.rowcount > 0
+    if deleted:
+        cursor.execute('DELETE FROM budget_spend WHERE budget_id = ?', (budget_id,))
+        cursor.execute('DELETE FROM budget_alerts WHERE budget_id = ?', (budget_id,))
+    conn.commit()
+    conn.close()
+    return deleted
+
+
+def get_remaining(budget_id, on_date=None):
+    """
+    预算在指定日期所在周期的剩余金额
+    :return: 剩余金额（超支时为负数），预算不存在时返回 None
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT period, amount FROM budgets WHERE id = ?', (budget_id,))
+    row = cursor.fetchone()
+    if not row:
+        conn.close()
+        return None
+    period, amount = row
+    cursor.execute('SELECT spent FROM budget_spend WHERE budget_id = ? AND period_key = ?',
+                   (budget_id, period_key(period, on_date)))
+    spent = cursor.fetchone()
+    conn.close()
+    return round(amount - (spent[0] if spent else 0), 2)
+
+
+def get_budget_status(user_id, on_date=None):
+    """
+    用户所有预算在指定日期所在周期的执行情况
+    :return: [{'budget_id', 'category', 'period', 'period_key', 'currency', 'amount', 'spent', 'remaining',
+               'used_ratio'}]
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT b.id, COALESCE(c.name, '全部支出'), b.period, b.currency, b.amount,
+               COALESCE(s.spent, 0),
+               CASE b.period WHEN 'yearly' THEN ? ELSE ? END AS pk
+        FROM budgets b
+        LEFT JOIN categories c ON c.id = b.category_id
+        LEFT JOIN budget_spend s ON s.budget_id = b.id
+             AND s.period_key = CASE b.period WHEN 'yearly' THEN ? ELSE ? END
+        WHERE b.user_id = ?
+        ORDER BY b.period, b.currency, b.category_id IS NOT NULL, c.name
+    ''', (period_key('yearly', on_date), period_key('monthly', on_date),
+          period_key('yearly', on_date), period_key('monthly', on_date), user_id))
+    rows = cursor.fetchall()
+    conn.close()
+    return [{
+        'budget_id': budget_id,
+        'category': category,
+        'period': period,
+        'period_key': pk,
+        'currency': currency,
+        'amount': amount,
+        'spent': round(spent, 2),
+        'remaining': round(amount - spent, 2),
+        'used_ratio': round(spent / amount, 4) if amount else None,
+    } for budget_id, category, period, currency, amount, spent, pk in rows]
+
+
+def get_alerts(user_id, unacknowledged_only=True):
+    """
+    用户的预算提醒
+    :return: [(提醒ID, 分类, 周期键, 阈值, 触发时已支出, 预算金额, 时间)]
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    query = '''
+        SELECT al.id, COALESCE(c.name, '全部支出'), al.period_key, al.threshold, al.spent,
+               al.budget_amount, al.created_at
+        FROM budget_alerts al
+        JOIN budgets b ON b.id = al.budget_id
+        LEFT JOIN categories c ON c.id = b.category_id
+        WHERE b.user_id = ?
+    '''
+    if unacknowledged_only:
+        query += ' AND al.acknowledged = 0'
+    cursor.execute(query + ' ORDER BY al.id', (user_id,))
+    alerts = cursor.fetchall()
+    conn.close()
+    return alerts
+
+
+def acknowledge_alerts(user_id, alert_ids=None):
+    """把提醒标记为已读（默认该用户全部提醒）"""
+    conn = get_db_connection()
+    query = '''UPDATE budget_alerts SET acknowledged = 1
+               WHERE budget_id IN (SELECT id FROM budgets WHERE user_id = ?)'''
+    params = [user_id]
+    if alert_ids:
+        query += f" AND id IN ({', '.join('?' * len(alert_ids))})"
+        params.extend(alert_ids)
+    conn.execute(query, params)
+    conn.commit()
+    conn.close()
+
+
+def print_budget_status(statuses):
+    if not statuses:
+        print("暂无预算")
+        return
+    print(f"\n{'ID':<4} {'分类':<10} {'周期':<8} {'币种':<4} {'预算':>10} {'已支出':>10} {'剩余':>10} {'使用率':>7}")
+    print("-" * 71)
+    for s in statuses:
+        flag = ' ⚠️' if s['remaining'] < 0 else ''
+        print(f"{s['budget_id']:<4} {s['category']:<10} {s['period_key']:<8} {s['currency']:<4} {s['amount']:>10.2f} "
+              f"{s['spent']:>10.2f} {s['remaining']:>10.2f} {s['used_ratio'] * 100:>6.1f}%{flag}")
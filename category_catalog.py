@@ -0,0 +1,140 @@
+# category_catalog.py
+"""
+分类目录
+
+- 清理重复的预置分类（旧数据库中 user_id 为 NULL 的预置分类被重复插入）
+- 按用户缓存可见分类列表，菜单每次渲染不必再查询数据库和去重
+- 通过本模块增删分类时自动使对应用户的缓存失效
+
+缓存只在当前进程内有效；其他进程修改分类后可调用 invalidate_category_cache()。
+"""
+import threading
+from database import get_db_connection
+from metrics import CACHE_REQUESTS
+
+_cache = {}
+_cache_lock = threading.Lock()
+_cache_hit = CACHE_REQUESTS.labels(cache='categories', result='hit')
+_cache_miss = CACHE_REQUESTS.labels(cache='categories', result='miss')
+
+
+def dedupe_preset_categories(cursor):
+    """
+    合并重复的预置分类：每组 (name, type) 保留ID最小的一条，
+    引用被删除分类的交易改为引用保留的分类（由调用方负责提交）
+    :return: 删除的分类数量
+    """
+    cursor.execute('''
+        SELECT c.id, k.keep_id
+        FROM categories c
+        JOIN (SELECT name, type, MIN(id) AS keep_id FROM categories
+              WHERE user_id IS NULL GROUP BY name, type) k
+          ON k.name = c.name AND k.type = c.type
+        WHERE c.user_id IS NULL AND c.id <> k.keep_id
+    ''')
+    duplicates = cursor.fetchall()
+    if not duplicates:
+        return 0
+    cursor.executemany('UPDATE transactions SET category_id = ? WHERE category_id = ?',
+                       [(keep_id, dup_id) for dup_id, keep_id in duplicates])
+    cursor.executemany('DELETE FROM categories WHERE id = ?', [(dup_id,) for dup_id, _ in duplicates])
+    invalidate_category_cache()
+    return len(duplicates)
+
+
+def _load_categories(user_id):
+    """查询用户可见的全部分类，用户自定义分类优先，同名只保留一个"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id, name, type FROM categories
+        WHERE user_id = ? OR user_id IS NULL
+        ORDER BY user_id IS NULL, id
+    ''', (user_id,))
+    rows = cursor.fetchall()
+    conn.close()
+
+    seen = set()
+    categories = []
+    for cid, name, ctype in rows:
+        if (name, ctype) not in seen:
+            seen.add((name, ctype))
+            categories.append((cid, name, ctype))
+    return tuple(categories)
+
+
+def get_user_categories(user_id, transaction_type=None):
+    """返回用户可见的分类 [(id, name, type)]，可按 income/expense 过滤"""
+    categories = _cache.get(user_id)
+    if categories is None:
+        _cache_miss.inc()
+        categories = _load_categories(user_id)
+        with _cache_lock:
+            _cache[user_id] = categories
+    else:
+        _cache_hit.inc()
+    if transaction_type:
+        return [c for c in categories if c[2] == transaction_type]
+    return list(categories)
+
+
+def invalidate_category_cache(user_id=None):
+    """使分类缓存失效；user_id 为空时清空全部（预置分类变化影响所有用户）"""
+    with _cache_lock:
+        if user_id is None:
+            _cache.clear()
+        else:
+            _cache.pop(user_id, None)
+
+
+def add_category(user_id, name, type):
+    """
+    添加用户自定义分类
+    :return: (是否成功, 提示信息)
+    """
+    name = (name or '').strip()
+    if not name:
+        return False, "分类名称不能为空"
+    if type not in ('income', 'expense'):
+        return False, "分类类型必须是 income 或 expense"
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT id FROM categories WHERE (user_id = ? OR user_id IS NULL) AND name = ? AND type = ?',
+                       (user_id, name, type))
+        if cursor.fetchone():
+            return False, "分类已存在"
+        cursor.execute('INSERT INTO categories (user_id, name, type) VALUES (?, ?, ?)', (user_id, name, type))
+        conn.commit()
+        invalidate_category_cache(user_id)
+        return True, "分类添加成功"
+    except Exception as e:
+        conn.rollback()
+        return False, f"添加分类失败: {str(e)}"
+    finally:
+        conn.close()
+
+
+def delete_category(user_id, category_id):
+    """
+    删除用户自定义分类（预置分类和已被交易使用的分类不能删除）
+    :return: (是否成功, 提示信息)
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT id FROM categories WHERE id = ? AND user_id = ?', (category_id, user_id))
+        if not cursor.fetchone():
+            return False, "分类不存在或无权操作"
+        cursor.execute('SELECT 1 FROM transactions WHERE category_id = ? LIMIT 1', (category_id,))
+        if cursor.fetchone():
+            return False, "该分类下有交易记录，无法删除"
+        cursor.execute('DELETE FROM categories WHERE id = ? AND user_id = ?', (category_id, user_id))
+        conn.commit()
+        invalidate_category_cache(user_id)
+        return True, "分类删除成功"
+    except Exception as e:
+        conn.rollback()
+        return False, f"删除分类失败: {str(e)}"
+    finally:
+        conn.close()
@@ -0,0 +1,158 @@
+# change_log.py
+"""
+变更数据捕获（CDC）
+
+transactions、accounts、user_account_links 上的触发器把每次增删改追加到 change_log 表
+（见 database.init_db），下游系统按变更序号增量读取，不必轮询整张交易表：
+
+    changes = read_changes(since_seq=last_seq, limit=1000)
+    ...处理...
+    commit_offset('warehouse', changes[-1]['seq'])
+
+- 读取使用主键范围扫描（seq > ?），与日志总长度无关
+- 账户余额的变化由交易变更体现，账户只记录名称、类型、所有者和初始余额的修改
+- 归档一整年的交易时只写一条 op = 'archive' 的事件
+- compact_changes 对同一行只保留最新一条变更；truncate_consumed 删除所有消费者都已处理的变更
+
+用法：
+    python change_log.py tail [--since 0] [--limit 100]
+    python change_log.py compact [--up-to SEQ] [--drop-tombstones]
+    python change_log.py truncate
+"""
+import argparse
+import json
+from database import get_db_connection
+
+
+def read_changes(since_seq=0, limit=1000, tables=None):
+    """
+    读取变更序号大于 since_seq 的变更
+    :param since_seq: 上次处理到的变更序号
+    :param limit: 最多返回条数
+    :param tables: 只返回这些表的变更（默认全部）
+    :return: [{'seq', 'table', 'op', 'row_id', 'data', 'changed_at'}]，按序号升序
+    """
+    query = 'SELECT seq, table_name, op, row_id, payload, changed_at FROM change_log WHERE seq > ?'
+    params = [since_seq]
+    if tables:
+        query += f" AND table_name IN ({', '.join('?' * len(tables))})"
+        params.extend(tables)
+    query += ' ORDER BY seq LIMIT ?'
+    params.append(limit)
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    rows = cursor.fetchall()
+    conn.close()
+    return [{'seq': seq, 'table': table, 'op': op, 'row_id': row_id,
+             'data': json.loads(payload) if payload else None, 'changed_at': changed_at}
+            for seq, table, op, row_id, payload, changed_at in rows]
+
+
+def latest_seq():
+    """当前最大的变更序号（没有变更时为 0）"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log')
+    seq = cursor.fetchone()[0]
+    conn.close()
+    return seq
+
+
+def get_offset(consumer):
+    """消费者已处理到的变更序号（未登记时为 0）"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT last_seq FROM change_consumers WHERE name = ?', (consumer,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else 0
+
+
+def commit_offset(consumer, seq):
+    """记录消费者已处理到的变更序号"""
+    conn = get_db_connection()
+    conn.execute('''
+        INSERT INTO change_consumers (name, last_seq, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(name) DO UPDATE SET last_seq = excluded.last_seq, updated_at = excluded.updated_at
+    ''', (consumer, seq))
+    conn.commit()
+    conn.close()
+
+
+def compact_changes(up_to_seq=None, drop_tombstones=False):
+    """
+    压缩变更日志：序号不超过 up_to_seq 的变更中，同一行只保留最新一条
+    :param up_to_seq: 压缩范围上限（默认为所有消费者中最小的已处理序号，没有消费者时为全部）
+    :param drop_tombstones: 是否同时删除最新一条为 delete 的行（从未读取过的消费者将不知道这些行被删除）
+    :return: 删除的变更数
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        if up_to_seq is None:
+            cursor.execute('SELECT MIN(last_seq) FROM change_consumers')
+            up_to_seq = cursor.fetchone()[0]
+            if up_to_seq is None:
+                cursor.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log')
+                up_to_seq = cursor.fetchone()[0]
+        # archive 等没有行ID的事件不参与压缩
+        cursor.execute('''
+            DELETE FROM change_log
+            WHERE seq <= ? AND row_id IS NOT NULL AND seq NOT IN (
+                SELECT MAX(seq) FROM change_log
+                WHERE seq <= ? AND row_id IS NOT NULL
+                GROUP BY table_name, row_id
+            )
+        ''', (up_to_seq, up_to_seq))
+        removed = cursor.rowcount
+        if drop_tombstones:
+            cursor.execute("DELETE FROM change_log WHERE seq <= ? AND op = 'delete'", (up_to_seq,))
+            removed += cursor.rowcount
+        conn.commit()
+        return removed
+    except Exception as e:
+        conn.rollback()
+        print(f"错误：压缩变更日志失败: {e}")
+        return 0
+    finally:
+        conn.close()
+
+
+def truncate_consumed():
+    """删除所有已登记消费者都已处理的变更，返回删除的条数"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT MIN(last_seq) FROM change_consumers')
+    min_seq = cursor.fetchone()[0]
+    removed = 0
+    if min_seq:
+        cursor.execute('DELETE FROM change_log WHERE seq <= ?', (min_seq,))
+        removed = cursor.rowcount
+        conn.commit()
+    conn.close()
+    return removed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='变更日志（CDC）')
+    sub = parser.add_subparsers(dest='command', required=True)
+    tail = sub.add_parser('tail', help='输出变更（JSON Lines）')
+    tail.add_argument('--since', type=int, default=0, help='从该序号之后开始')
+    tail.add_argument('--limit', type=int, default=100)
+    tail.add_argument('--table', action='append', help='只输出指定表的变更，可重复')
+    compact = sub.add_parser('compact', help='同一行只保留最新变更')
+    compact.add_argument('--up-to', type=int, help='压缩范围上限')
+    compact.add_argument('--drop-tombstones', action='store_true', help='同时删除已删除行的变更')
+    sub.add_parser('truncate', help='删除所有消费者都已处理的变更')
+    args = parser.parse_args()
+
+    if args.command == 'tail':
+        for change in read_changes(args.since, args.limit, args.table):
+            print(json.dumps(change, ensure_ascii=False))
+    elif args.command == 'compact':
+        print(f"已删除 {compact_changes(args.up_to, args.drop_tombstones)} 条变更")
+    else:
+        print(f"已删除 {truncate_consumed()} 条变更")
@@ -0,0 +1,357 @@
+# cli.py
+"""
+非交互式命令行（供定时任务和脚本使用）
+
+子命令 add、list、stats、share、import、export 的结果以 JSON 输出到标准输出，
+各模块打印的提示和错误信息转到标准错误，失败时退出码为 1。
+
+batch 模式从标准输入逐行读取命令（与命令行写法相同，空行和 # 开头的行忽略），
+每条命令输出一行 JSON，数据库只初始化一次。连续的 add 命令合并为一次 add_transactions，
+在同一个连接、同一个事务内写入并只提交一次，不再为每笔交易单独建连接和提交。
+
+用法：
+    python cli.py add --user 1 --account 2 --type expense --amount 25.5 --category 3 --description 午餐
+    python cli.py list --user 1 --start-date 2024-01-01 --text 午餐 --limit 20
+    python cli.py stats summary --user 1 --start-date 2024-01-01 --end-date 2024-12-31
+    python cli.py share add --user 1 --account 2 --to alice --permission write
+    python cli.py import data.csv --user 1
+    python cli.py export out.jsonl --format jsonl --user 1
+    python cli.py batch < commands.txt
+"""
+import argparse
+import contextlib
+import csv
+import json
+import shlex
+import sys
+from datetime import date
+import database
+from database import init_db
+from log_config import setup_from_env as setup_logging_from_env
+
+TRANSACTION_COLUMNS = ['id', 'type', 'amount', 'category', 'account', 'date', 'description',
+                       'transaction_owner', 'ownership']
+STAT_KINDS = ('category', 'month', 'account', 'summary', 'forecast', 'payees')
+
+
+class CommandError(Exception):
+    """命令执行失败（参数无效、权限不足等），消息作为 JSON 的 error 字段输出"""
+
+
+def _add_filter_arguments(parser):
+    parser.add_argument('--type', choices=('income', 'expense'))
+    parser.add_argument('--category-id', type=int)
+    parser.add_argument('--account-id', type=int)
+    parser.add_argument('--start-date')
+    parser.add_argument('--end-date')
+
+
+def _filters(args):
+    """把命令行参数转为 query_builder.TRANSACTION_FILTERS 形式的筛选条件"""
+    filters = {'type': args.type, 'category_id': args.category_id, 'account_id': args.account_id,
+               'start_date': args.start_date, 'end_date': args.end_date,
+               'min_amount': getattr(args, 'min_amount', None), 'max_amount': getattr(args, 'max_amount', None),
+               'text': getattr(args, 'text', None)}
+    return {key: value for key, value in filters.items() if value is not None}
+
+
+def _transaction_item(args):
+    return {'account_id': args.account, 'type': args.type, 'amount': args.amount,
+            'category_id': args.category, 'date': args.date or date.today().isoformat(),
+            'description': args.description}
+
+
+def _add_result(result, index=0):
+    """从 add_transactions 的结果中取出第 index 笔交易的状态"""
+    if not result:
+        raise CommandError('写入失败')
+    for rejected_index, reason in result['rejected']:
+        if rejected_index == index:
+            raise CommandError(reason)
+    if index in result['duplicates']:
+        raise CommandError('与已有交易重复')
+    return {'inserted': True}
+
+
+def cmd_add(args):
+    from transaction_manager import add_transactions
+    result = add_transactions(args.user, [_transaction_item(args)], skip_duplicates=not args.allow_duplicate)
+    return _add_result(result)
+
+
+def cmd_list(args):
+    from transaction_manager import get_all_accessible_transactions
+    try:
+        rows = get_all_accessible_transactions(args.user, _filters(args))
+    except ValueError as e:
+        raise CommandError(str(e))
+    if args.limit is not None:
+        rows = rows[:args.limit]
+    return [dict(zip(TRANSACTION_COLUMNS, row)) for row in rows]
+
+
+def cmd_stats(args):
+    import mystatistics
+    today = date.today()
+    start_date = args.start_date or today.replace(month=1, day=1).isoformat()
+    end_date = args.end_date or today.isoformat()
+    try:
+        if args.kind == 'category':
+            return mystatistics.get_category_stats(args.user, start_date, end_date, False, args.currency)
+        if args.kind == 'month':
+            return mystatistics.get_monthly_stats(args.user, args.year or today.year, False, args.currency)
+        if args.kind == 'account':
+            return mystatistics.get_account_stats(args.user, start_date, end_date, False, args.currency)
+        if args.kind == 'summary':
+            return mystatistics.get_summary(args.user, start_date, end_date, False, args.currency)
+        if args.kind == 'forecast':
+            return mystatistics.get_forecast(args.user, args.transaction_type, args.horizon, display=False,
+                                             reporting_currency=args.currency)
+        return mystatistics.get_top_payees(args.user, args.start_date, args.end_date, args.top, display=False,
+                                           reporting_currency=args.currency)
+    except ValueError as e:
+        raise CommandError(str(e))
+
+
+def cmd_share(args):
+    from account_sharing import link_user_account, unlink_user_account, get_linked_accounts, get_shared_accounts
+    if args.action == 'list':
+        shared = [dict(zip(('link_id', 'account_id', 'account', 'account_type', 'linked_username',
+                            'permission_level', 'created_at'), row)) for row in get_shared_accounts(args.user)]
+        linked = [dict(zip(('link_id', 'account_id', 'account', 'account_type', 'balance', 'owner_username',
+                            'permission_level', 'created_at'), row)) for row in get_linked_accounts(args.user)]
+        return {'shared': shared, 'linked': linked}
+    if args.action == 'add':
+        if args.account is None or not args.to:
+            raise CommandError('share add 需要 --account 和 --to')
+        success, message = link_user_account(args.user, args.to, args.account, args.permission)
+    else:
+        if args.link_id is None:
+            raise CommandError('share remove 需要 --link-id')
+        success, message = unlink_user_account(args.user, args.link_id)
+    if not success:
+        raise CommandError(message)
+    return {'message': message}
+
+
+def _read_import_rows(path, format):
+    """读取 CSV 或 JSON Lines 文件（列名与 exporter 导出的一致，多余的列忽略）"""
+    with open(path, newline='', encoding='utf-8') as f:
+        if format == 'jsonl':
+            records = (json.loads(line) for line in f if line.strip())
+        else:
+            records = csv.DictReader(f)
+        for record in records:
+            yield {
+                'account_id': int(record['account_id']),
+                'type': record['type'],
+                'amount': float(record['amount']),
+                'category_id': int(record['category_id']),
+                'date': record['date'],
+                'description': record.get('description') or None,
+            }
+
+
+def cmd_import(args):
+    from transaction_manager import add_transactions
+    format = args.format or ('jsonl' if args.path.endswith(('.jsonl', '.json')) else 'csv')
+    summary = {'inserted': 0, 'duplicates': 0, 'rejected': []}
+    offset = 0
+
+    def flush(chunk):
+        result = add_transactions(args.user, chunk, skip_duplicates=not args.allow_duplicates)
+        if not result:
+            raise CommandError(f'第 {offset + 1} 行起的一批交易写入失败')
+        summary['inserted'] += result['inserted']
+        summary['duplicates'] += len(result['duplicates'])
+        summary['rejected'] += [(offset + index + 1, reason) for index, reason in result['rejected']]
+
+    chunk = []
+    try:
+        for item in _read_import_rows(args.path, format):
+            chunk.append(item)
+            if len(chunk) >= args.chunk_size:
+                flush(chunk)
+                offset += len(chunk)
+                chunk = []
+        if chunk:
+            flush(chunk)
+    except (OSError, KeyError, ValueError) as e:
+        raise CommandError(f'读取导入文件失败（已导入 {summary["inserted"]} 条）: {e}')
+    return summary
+
+
+def cmd_export(args):
+    from exporter import export_transactions
+    try:
+        return export_transactions(args.path, args.format, args.user, _filters(args), args.since_last,
+                                   args.chunk_size)
+    except (OSError, ValueError) as e:
+        raise CommandError(str(e))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='个人财务管理非交互式命令行（JSON 输出）')
+    parser.add_argument('--db', help='数据库文件路径（默认 database.DB_PATH）')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add = subparsers.add_parser('add', help='添加一笔交易')
+    add.add_argument('--user', type=int, required=True)
+    add.add_argument('--account', type=int, required=True)
+    add.add_argument('--type', choices=('income', 'expense'), required=True)
+    add.add_argument('--amount', type=float, required=True)
+    add.add_argument('--category', type=int, required=True)
+    add.add_argument('--date', help='YYYY-MM-DD（默认今天）')
+    add.add_argument('--description')
+    add.add_argument('--allow-duplicate', action='store_true', help='与已有交易重复时仍然写入')
+    add.set_defaults(handler=cmd_add)
+
+    list_parser = subparsers.add_parser('list', help='列出可访问的交易')
+    list_parser.add_argument('--user', type=int, required=True)
+    _add_filter_arguments(list_parser)
+    list_parser.add_argument('--min-amount', type=float)
+    list_parser.add_argument('--max-amount', type=float)
+    list_parser.add_argument('--text', help='备注包含的文本')
+    list_parser.add_argument('--limit', type=int)
+    list_parser.set_defaults(handler=cmd_list)
+
+    stats = subparsers.add_parser('stats', help='统计')
+    stats.add_argument('kind', choices=STAT_KINDS)
+    stats.add_argument('--user', type=int, required=True)
+    stats.add_argument('--start-date', help='默认今年 1 月 1 日（payees 默认全部历史）')
+    stats.add_argument('--end-date', help='默认今天')
+    stats.add_argument('--year', type=int, help='month 统计的年份（默认今年）')
+    stats.add_argument('--currency', help='报告币种（默认本位币）')
+    stats.add_argument('--transaction-type', choices=('income', 'expense'), default='expense',
+                       help='forecast 预测的交易类型')
+    stats.add_argument('--horizon', type=int, default=3, help='forecast 预测月数')
+    stats.add_argument('--top', type=int, default=10, help='payees 返回的收款方数量')
+    stats.set_defaults(handler=cmd_stats)
+
+    share = subparsers.add_parser('share', help='账户共享')
+    share.add_argument('action', choices=('add', 'remove', 'list'))
+    share.add_argument('--user', type=int, required=True, help='账户所有者')
+    share.add_argument('--account', type=int)
+    share.add_argument('--to', metavar='USERNAME', help='共享给该用户')
+    share.add_argument('--permission', choices=('read', 'write'), default='read')
+    share.add_argument('--link-id', type=int, help='要解除的关联ID')
+    share.set_defaults(handler=cmd_share)
+
+    import_parser = subparsers.add_parser('import', help='从 CSV / JSON Lines 文件批量导入交易')
+    import_parser.add_argument('path')
+    import_parser.add_argument('--user', type=int, required=True)
+    import_parser.add_argument('--format', choices=('csv', 'jsonl'), help='默认按扩展名判断')
+    import_parser.add_argument('--allow-duplicates', action='store_true')
+    import_parser.add_argument('--chunk-size', type=int, default=5000, help='每个事务写入的行数')
+    import_parser.set_defaults(handler=cmd_import)
+
+    export = subparsers.add_parser('export', help='导出交易')
+    export.add_argument('path')
+    export.add_argument('--format', choices=('csv', 'jsonl', 'parquet'), default='csv')
+    export.add_argument('--user', type=int)
+    _add_filter_arguments(export)
+    export.add_argument('--since-last', metavar='NAME', help='增量导出任务名')
+    export.add_argument('--chunk-size', type=int, default=5000)
+    export.set_defaults(handler=cmd_export)
+
+    subparsers.add_parser('batch', help='从标准输入逐行读取命令并执行')
+    return parser
+
+
+def _dump(payload):
+    print(json.dumps(payload, ensure_ascii=False, default=str), flush=True)
+
+
+def run_command(args):
+    """执行一条命令，返回输出的 JSON 对象；模块打印的信息转到标准错误"""
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            return {'ok': True, 'command': args.command, 'result': args.handler(args)}
+        except CommandError as e:
+            return {'ok': False, 'command': args.command, 'error': str(e)}
+        except Exception as e:
+            # 数据库被锁等意外错误同样输出为一行 JSON，batch 中后续命令继续执行
+            return {'ok': False, 'command': args.command, 'error': f'执行失败: {e}'}
+
+
+def run_batch(parser, lines):
+    """
+    逐行执行命令，返回失败的命令数
+    连续的 add 命令（同一用户、相同的重复处理方式）缓存起来，遇到其他命令或输入结束时一次写入
+    """
+    from transaction_manager import add_transactions
+
+    failures = 0
+    pending = []        # [(行号, args)]
+
+    def flush():
+        nonlocal failures
+        if not pending:
+            return
+        first = pending[0][1]
+        error = None
+        with contextlib.redirect_stdout(sys.stderr):
+            try:
+                result = add_transactions(first.user, [_transaction_item(args) for _, args in pending],
+                                          skip_duplicates=not first.allow_duplicate)
+            except Exception as e:
+                # 整批写入失败（如数据库被锁），缓存的每条 add 都输出失败，之后的命令继续执行
+                error = f'执行失败: {e}'
+        for index, (line_number, _) in enumerate(pending):
+            try:
+                if error:
+                    raise CommandError(error)
+                output = {'ok': True, 'command': 'add', 'result': _add_result(result, index)}
+            except CommandError as e:
+                output = {'ok': False, 'command': 'add', 'error': str(e)}
+                failures += 1
+            _dump(dict(output, line=line_number))
+        pending.clear()
+
+    for line_number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        try:
+            args = parser.parse_args(shlex.split(line))
+        except (SystemExit, ValueError):
+            flush()
+            failures += 1
+            _dump({'ok': False, 'line': line_number, 'error': f'无法解析的命令: {line}'})
+            continue
+        if args.command == 'batch' or args.db:
+            flush()
+            failures += 1
+            _dump({'ok': False, 'line': line_number, 'error': 'batch 中不能嵌套 batch 或切换数据库'})
+            continue
+        if args.command == 'add':
+            if pending and (pending[0][1].user, pending[0][1].allow_duplicate) != (args.user, args.allow_duplicate):
+                flush()
+            pending.append((line_number, args))
+            continue
+        flush()
+        output = run_command(args)
+        failures += not output['ok']
+        _dump(dict(output, line=line_number))
+    flush()
+    return failures
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.db:
+        database.DB_PATH = args.db
+    setup_logging_from_env()
+    with contextlib.redirect_stdout(sys.stderr):
+        init_db()
+
+    if args.command == 'batch':
+        return 1 if run_batch(parser, sys.stdin) else 0
+    output = run_command(args)
+    _dump(output)
+    return 0 if output['ok'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
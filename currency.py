@@ -0,0 +1,147 @@
+# currency.py
+"""
+多币种与汇率
+
+- accounts.currency 记录账户币种，交易金额以所在账户的币种计
+- exchange_rates 保存本地导入的历史汇率：1 单位外币折合多少本位币（BASE_CURRENCY）
+- 汇率按币种载入内存，日期升序排列，用二分查找取“当天或之前最近一天”的汇率
+- 统计时先在 SQL 中按 (币种, 日期) 汇总，再按币种分组批量折算，折算次数与交易笔数无关
+
+用法：
+    python currency.py load rates.csv      # CSV 列: currency,date,rate
+    python currency.py convert 100 USD CNY --date 2024-06-30
+"""
+import argparse
+import csv
+import threading
+from bisect import bisect_right
+from datetime import date
+from database import get_db_connection
+
+BASE_CURRENCY = 'CNY'
+
+_rate_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _load_currency(currency):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT rate_date, rate FROM exchange_rates WHERE currency = ? ORDER BY rate_date', (currency,))
+    rows = cursor.fetchall()
+    conn.close()
+    return [row[0] for row in rows], [row[1] for row in rows]
+
+
+def invalidate_rate_cache():
+    with _cache_lock:
+        _rate_cache.clear()
+
+
+def _rates_for(currency):
+    series = _rate_cache.get(currency)
+    if series is None:
+        series = _load_currency(currency)
+        with _cache_lock:
+            _rate_cache[currency] = series
+    return series
+
+
+def _series_or_error(currency):
+    if currency == BASE_CURRENCY:
+        return None
+    series = _rates_for(currency)
+    if not series[1]:
+        raise ValueError(f"缺少 {currency} 的汇率")
+    return series
+
+
+def _lookup(series, on_date):
+    if series is None:
+        return 1.0
+    dates, rates = series
+    return rates[max(bisect_right(dates, on_date) - 1, 0)]
+
+
+def get_rate(currency, on_date=None):
+    """
+    1 单位 currency 在指定日期折合多少本位币
+    早于最早汇率的日期使用最早的汇率；没有任何汇率时抛出 ValueError
+    """
+    return _lookup(_series_or_error(currency), str(on_date or date.today())[:10])
+
+
+def convert(amount, from_currency, to_currency, on_date=None):
+    """按指定日期的汇率折算金额"""
+    if from_currency == to_currency:
+        return amount
+    return amount * get_rate(from_currency, on_date) / get_rate(to_currency, on_date)
+
+
+def convert_grouped(rows, reporting_currency=BASE_CURRENCY):
+    """
+    批量折算分组汇总结果
+    :param rows: [(分组键, 币种, 日期, 金额)]，日期为空表示无需按日期折算（币种与报告币种相同）
+    :return: {分组键: 折算后的金额合计}
+    """
+    by_currency = {}
+    for key, currency, on_date, amount in rows:
+        by_currency.setdefault(currency or BASE_CURRENCY, []).append((key, on_date, amount))
+
+    totals = {}
+    for currency, items in by_currency.items():
+        if currency == reporting_currency:
+            for key, _, amount in items:
+                totals[key] = totals.get(key, 0) + amount
+            continue
+        # 同一币种只取一次汇率序列，组内逐个日期二分查找
+        from_series = _series_or_error(currency)
+        to_series = _series_or_error(reporting_currency)
+        for key, on_date, amount in items:
+            on_date = str(on_date)[:10]
+            totals[key] = totals.get(key, 0) + amount * _lookup(from_series, on_date) / _lookup(to_series, on_date)
+    return totals
+
+
+def set_rate(currency, rate_date, rate):
+    """写入或更新一条汇率"""
+    conn = get_db_connection()
+    conn.execute('''INSERT INTO exchange_rates (currency, rate_date, rate) VALUES (?, ?, ?)
+                    ON CONFLICT(currency, rate_date) DO UPDATE SET rate = excluded.rate''',
+                 (currency.upper(), rate_date, rate))
+    conn.commit()
+    conn.close()
+    invalidate_rate_cache()
+
+
+def load_rates_csv(path):
+    """从 CSV（currency,date,rate）导入汇率，返回导入条数"""
+    with open(path, encoding='utf-8-sig', newline='') as f:
+        rows = [(row['currency'].strip().upper(), row['date'].strip()[:10], float(row['rate']))
+                for row in csv.DictReader(f)]
+    conn = get_db_connection()
+    conn.executemany('''INSERT INTO exchange_rates (currency, rate_date, rate) VALUES (?, ?, ?)
+                        ON CONFLICT(currency, rate_date) DO UPDATE SET rate = excluded.rate''', rows)
+    conn.commit()
+    conn.close()
+    invalidate_rate_cache()
+    return len(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='汇率管理')
+    sub = parser.add_subparsers(dest='command', required=True)
+    load_parser = sub.add_parser('load', help='从 CSV 导入汇率')
+    load_parser.add_argument('path')
+    convert_parser = sub.add_parser('convert', help='折算金额')
+    convert_parser.add_argument('amount', type=float)
+    convert_parser.add_argument('from_currency')
+    convert_parser.add_argument('to_currency')
+    convert_parser.add_argument('--date')
+    args = parser.parse_args()
+
+    if args.command == 'load':
+        print(f"导入 {load_rates_csv(args.path)} 条汇率")
+    else:
+        result = convert(args.amount, args.from_currency.upper(), args.to_currency.upper(), args.date)
+        print(f"{args.amount:.2f} {args.from_currency.upper()} = {result:.2f} {args.to_currency.upper()}")
@@ -1,20 +1,98 @@
 # database.py
 import sqlite3
 import os
+import query_profiler
+from metrics import DB_CONNECTIONS
 
 DB_PATH = 'data/finance.db'
 
+_connections_opened = DB_CONNECTIONS.labels()
+
+PRESET_CATEGORIES = [
+    (None, '工资', 'income'),
+    (None, '奖金', 'income'),
+    (None, '餐饮', 'expense'),
+    (None, '交通', 'expense'),
+    (None, '购物', 'expense'),
+    (None, '医疗', 'expense'),
+    (None, '教育', 'expense'),
+    (None, '娱乐', 'expense'),
+    (None, '其他', 'expense'),
+    (None, '转账', 'income'),
+    (None, '转账', 'expense')
+]
+
+def add_column_if_missing(cursor, table, column, definition):
+    """为已有表补充新列，返回是否真的新增了该列"""
+    # table_xinfo 同时列出生成列
+    cursor.execute(f'PRAGMA table_xinfo({table})')
+    if any(row[1] == column for row in cursor.fetchall()):
+        return False
+    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return True
+
+def create_trigger(cursor, name, body):
+    """重新创建触发器，保证已有数据库中的触发器定义与代码一致"""
+    cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+    cursor.execute(f'CREATE TRIGGER {name} {body}')
+
 # 在 database.py 中修改 init_db 函数
-def init_db():
+def init_db(db_path=None):
+    # db_path 为空时初始化主库；分库模式下用于初始化各分库文件（见 sharding.py）
+    db_path = db_path or DB_PATH
     if not os.path.exists('data'):
         os.makedirs('data')
     
     # 检查数据库是否已经初始化
-    db_exists = os.path.exists(DB_PATH)
+    db_exists = os.path.exists(db_path)
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
     
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS accounts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        name TEXT NOT NULL,
+        type TEXT NOT NULL,
+        balance REAL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id)
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS categories (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,  
+        name TEXT NOT NULL,
+        type TEXT NOT NULL,
+        UNIQUE(user_id, name, type)
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS transactions (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        account_id INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        amount REAL NOT NULL,
+        category_id INTEGER NOT NULL,
+        date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        description TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (account_id) REFERENCES accounts (id),
+        FOREIGN KEY (category_id) REFERENCES categories (id)
+    )
+    ''')
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS user_account_links (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -29,26 +107,558 @@ def init_db():
         UNIQUE(linked_user_id, account_id)  -- 防止重复关联
     )
     ''')
-    # 只有在新数据库时才插入预置分类
+    
+    # 账户初始余额：余额 = 初始余额 + 账本净额，用于余额对账
+    if add_column_if_missing(cursor, 'accounts', 'initial_balance', 'REAL DEFAULT 0'):
+        # 旧数据库没有记录初始余额，以当前余额反推
+        cursor.execute('''
+        UPDATE accounts SET initial_balance = balance - COALESCE((
+            SELECT SUM(CASE WHEN t.type = 'income' THEN t.amount ELSE -t.amount END)
+            FROM transactions t WHERE t.account_id = accounts.id
+        ), 0)
+        ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_account ON transactions(account_id)')
+    
+    # 用户可访问的账户（自己的账户和被共享的账户），由账户和关联上的触发器维护，
+    # 交易查询按 user_id 前缀读取后逐个账户走 idx_transactions_account
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_accessible_accounts'")
+    accessible_exists = cursor.fetchone() is not None
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS user_accessible_accounts (
+        user_id INTEGER NOT NULL,
+        account_id INTEGER NOT NULL,
+        can_write INTEGER NOT NULL,           -- 账户所有者或 write 关联为 1
+        PRIMARY KEY (user_id, account_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_accessible_accounts_account ON user_accessible_accounts(account_id)')
+    # 重新计算一个 (用户, 账户) 的访问权限：所有者或任一关联存在时保留，取最高权限
+    accessible_refresh = '''
+        DELETE FROM user_accessible_accounts WHERE user_id = {user} AND account_id = {account};
+        INSERT INTO user_accessible_accounts (user_id, account_id, can_write)
+        SELECT {user}, {account}, MAX(can_write) FROM (
+            SELECT 1 AS can_write FROM accounts WHERE id = {account} AND user_id = {user}
+            UNION ALL
+            SELECT permission_level = 'write' FROM user_account_links
+            WHERE linked_user_id = {user} AND account_id = {account}
+        ) HAVING COUNT(*) > 0;
+    '''
+    create_trigger(cursor, 'trg_accessible_accounts_insert', f'''
+    AFTER INSERT ON accounts
+    BEGIN
+        {accessible_refresh.format(user='NEW.user_id', account='NEW.id')}
+    END
+    ''')
+    create_trigger(cursor, 'trg_accessible_accounts_owner', f'''
+    AFTER UPDATE OF user_id ON accounts
+    BEGIN
+        {accessible_refresh.format(user='OLD.user_id', account='OLD.id')}
+        {accessible_refresh.format(user='NEW.user_id', account='NEW.id')}
+    END
+    ''')
+    create_trigger(cursor, 'trg_accessible_accounts_delete', '''
+    AFTER DELETE ON accounts
+    BEGIN
+        DELETE FROM user_accessible_accounts WHERE account_id = OLD.id;
+    END
+    ''')
+    create_trigger(cursor, 'trg_accessible_links_insert', f'''
+    AFTER INSERT ON user_account_links
+    BEGIN
+        {accessible_refresh.format(user='NEW.linked_user_id', account='NEW.account_id')}
+    END
+    ''')
+    create_trigger(cursor, 'trg_accessible_links_update', f'''
+    AFTER UPDATE OF linked_user_id, account_id, permission_level ON user_account_links
+    BEGIN
+        {accessible_refresh.format(user='OLD.linked_user_id', account='OLD.account_id')}
+        {accessible_refresh.format(user='NEW.linked_user_id', account='NEW.account_id')}
+    END
+    ''')
+    create_trigger(cursor, 'trg_accessible_links_delete', f'''
+    AFTER DELETE ON user_account_links
+    BEGIN
+        {accessible_refresh.format(user='OLD.linked_user_id', account='OLD.account_id')}
+    END
+    ''')
+    if not accessible_exists:
+        # 已有数据库首次升级时从账户和关联回填
+        cursor.execute('''
+        INSERT INTO user_accessible_accounts (user_id, account_id, can_write)
+        SELECT user_id, account_id, MAX(can_write) FROM (
+            SELECT user_id, id AS account_id, 1 AS can_write FROM accounts
+            UNION ALL
+            SELECT linked_user_id, account_id, permission_level = 'write' FROM user_account_links
+        )
+        GROUP BY user_id, account_id
+        ''')
+    
+    # 对账检查点：记录每个账户已核对到的最大交易ID及对应的账本净额
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS balance_checkpoints (
+        account_id INTEGER PRIMARY KEY,
+        last_transaction_id INTEGER NOT NULL,  -- 已核对的最大交易ID
+        ledger_net REAL NOT NULL,              -- 截至该交易的账本净额
+        checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (account_id) REFERENCES accounts (id)
+    )
+    ''')
+    # 检查点之前的交易被修改或删除时，检查点失效
+    create_trigger(cursor, 'trg_checkpoint_invalidate_update', '''
+    AFTER UPDATE OF account_id, type, amount ON transactions
+    BEGIN
+        DELETE FROM balance_checkpoints
+        WHERE account_id IN (OLD.account_id, NEW.account_id) AND last_transaction_id >= OLD.id;
+    END
+    ''')
+    create_trigger(cursor, 'trg_checkpoint_invalidate_delete', '''
+    AFTER DELETE ON transactions
+    BEGIN
+        DELETE FROM balance_checkpoints
+        WHERE account_id = OLD.account_id AND last_transaction_id >= OLD.id;
+    END
+    ''')
+    create_trigger(cursor, 'trg_checkpoint_account_delete', '''
+    AFTER DELETE ON accounts
+    BEGIN
+        DELETE FROM balance_checkpoints WHERE account_id = OLD.id;
+    END
+    ''')
+    
+    # 每日余额快照：每个账户在有交易的日期记录当天结束时的累计账本净额
+    # 某日余额 = 初始余额 + 该日或之前最近一条快照的 ledger_net
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'daily_balances'")
+    daily_balances_exists = cursor.fetchone() is not None
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS daily_balances (
+        account_id INTEGER NOT NULL,
+        balance_date TEXT NOT NULL,   -- YYYY-MM-DD
+        ledger_net REAL NOT NULL,     -- 截至当天结束的累计账本净额
+        PRIMARY KEY (account_id, balance_date)
+    ) WITHOUT ROWID
+    ''')
+    # 写入交易时增量维护：补齐当天的快照行，再把当天及之后的快照加上该笔金额
+    # （补录历史日期的交易会自动回填之后所有日期）
+    snapshot_add = '''
+        INSERT OR IGNORE INTO daily_balances (account_id, balance_date, ledger_net)
+        VALUES ({row}.account_id, date({row}.date), COALESCE((
+            SELECT ledger_net FROM daily_balances
+            WHERE account_id = {row}.account_id AND balance_date < date({row}.date)
+            ORDER BY balance_date DESC LIMIT 1
+        ), 0));
+        UPDATE daily_balances
+        SET ledger_net = ledger_net + (CASE WHEN {row}.type = 'income' THEN {row}.amount ELSE -{row}.amount END)
+        WHERE account_id = {row}.account_id AND balance_date >= date({row}.date);
+    '''
+    snapshot_remove = '''
+        UPDATE daily_balances
+        SET ledger_net = ledger_net - (CASE WHEN OLD.type = 'income' THEN OLD.amount ELSE -OLD.amount END)
+        WHERE account_id = OLD.account_id AND balance_date >= date(OLD.date);
+    '''
+    create_trigger(cursor, 'trg_daily_balances_insert', f'''
+    AFTER INSERT ON transactions
+    BEGIN
+        {snapshot_add.format(row='NEW')}
+    END
+    ''')
+    create_trigger(cursor, 'trg_daily_balances_update', f'''
+    AFTER UPDATE OF account_id, type, amount, date ON transactions
+    BEGIN
+        {snapshot_remove}
+        {snapshot_add.format(row='NEW')}
+    END
+    ''')
+    create_trigger(cursor, 'trg_daily_balances_delete', f'''
+    AFTER DELETE ON transactions
+    BEGIN
+        {snapshot_remove}
+    END
+    ''')
+    create_trigger(cursor, 'trg_daily_balances_account_delete', '''
+    AFTER DELETE ON accounts
+    BEGIN
+        DELETE FROM daily_balances WHERE account_id = OLD.id;
+    END
+    ''')
+    if not daily_balances_exists:
+        # 新建快照表时从已有账本回填
+        from balance_history import rebuild_daily_balances
+        rebuild_daily_balances(cursor)
+    
+    # 交易指纹：用于重复交易检测
+    if add_column_if_missing(cursor, 'transactions', 'fingerprint', 'TEXT'):
+        from dedup import backfill_fingerprints
+        backfill_fingerprints(cursor)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_fingerprint ON transactions(fingerprint)')
+    
+    # 交易备注全文索引（FTS5 外部内容表，trigram 分词以支持中文子串搜索）
+    try:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions_fts'")
+        fts_exists = cursor.fetchone() is not None
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5(
+            description, content='transactions', content_rowid='id', tokenize='trigram'
+        )
+        ''')
+        create_trigger(cursor, 'trg_transactions_fts_insert', '''
+        AFTER INSERT ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (rowid, description) VALUES (NEW.id, NEW.description);
+        END
+        ''')
+        create_trigger(cursor, 'trg_transactions_fts_delete', '''
+        AFTER DELETE ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description)
+            VALUES ('delete', OLD.id, OLD.description);
+        END
+        ''')
+        create_trigger(cursor, 'trg_transactions_fts_update', '''
+        AFTER UPDATE OF description ON transactions
+        BEGIN
+            INSERT INTO transactions_fts (transactions_fts, rowid, description)
+            VALUES ('delete', OLD.id, OLD.description);
+            INSERT INTO transactions_fts (rowid, description) VALUES (NEW.id, NEW.description);
+        END
+        ''')
+        if not fts_exists:
+            cursor.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+    except sqlite3.OperationalError as e:
+        # SQLite 未编译 FTS5 时退化为 LIKE 搜索
+        print(f"警告: 无法创建全文索引，备注搜索将使用普通扫描: {e}")
+    # 增量导出记录：每个导出任务已处理到的变更日志序号（last_transaction_id 为旧版本按交易ID增量时的记录，已不再使用）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS export_state (
+        name TEXT PRIMARY KEY,
+        last_transaction_id INTEGER NOT NULL DEFAULT 0,
+        exported_at TIMESTAMP,
+        rows_exported INTEGER NOT NULL DEFAULT 0
+    )
+    ''')
+    add_column_if_missing(cursor, 'export_state', 'last_seq', 'INTEGER')
+    
+    # 定期交易规则（见 recurring.py）；由规则生成的交易记录规则ID，同一规则同一天只生成一次
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS recurring_rules (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        account_id INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        amount REAL NOT NULL,
+        category_id INTEGER NOT NULL,
+        description TEXT,
+        frequency TEXT NOT NULL,            -- daily / weekly / monthly / yearly
+        interval INTEGER NOT NULL DEFAULT 1, -- 每隔几个周期
+        start_date TEXT NOT NULL,           -- 首次发生日期，按月/按年时以其日期为锚点
+        end_date TEXT,                      -- 最后可发生日期（为空表示不结束）
+        next_date TEXT,                     -- 下一次待生成的日期，为空表示已结束
+        occurrences INTEGER NOT NULL DEFAULT 0, -- 已生成的次数
+        active INTEGER NOT NULL DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (account_id) REFERENCES accounts (id),
+        FOREIGN KEY (category_id) REFERENCES categories (id)
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_recurring_rules_due ON recurring_rules(active, next_date)')
+    add_column_if_missing(cursor, 'transactions', 'recurring_rule_id', 'INTEGER')
+    cursor.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_recurring
+                      ON transactions(recurring_rule_id, date) WHERE recurring_rule_id IS NOT NULL''')
+    
+    # 转账：每笔转账在交易表中有转出、转入两条腿，通过 transfer_id 关联（见 transfers.py）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS transfers (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        from_account_id INTEGER NOT NULL,
+        to_account_id INTEGER NOT NULL,
+        amount REAL NOT NULL,                 -- 转出金额（转出账户币种）
+        to_amount REAL NOT NULL,              -- 转入金额（转入账户币种）
+        date TEXT NOT NULL,
+        description TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (from_account_id) REFERENCES accounts (id),
+        FOREIGN KEY (to_account_id) REFERENCES accounts (id)
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transfers_user_date ON transfers(user_id, date)')
+    add_column_if_missing(cursor, 'transactions', 'transfer_id', 'INTEGER')
+    cursor.execute('''CREATE INDEX IF NOT EXISTS idx_transactions_transfer
+                      ON transactions(transfer_id) WHERE transfer_id IS NOT NULL''')
+    
+    # 预算：每个预算在每个周期的已支出金额由交易触发器增量维护，超过阈值时写入提醒（见 budgets.py）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS budgets (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        category_id INTEGER,                  -- 为空表示该用户的全部支出
+        period TEXT NOT NULL DEFAULT 'monthly', -- monthly / yearly
+        amount REAL NOT NULL,
+        alert_ratio REAL NOT NULL DEFAULT 0.8,  -- 已支出达到预算的该比例时提醒，超支时再提醒一次
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (user_id) REFERENCES users (id),
+        FOREIGN KEY (category_id) REFERENCES categories (id)
+    )
+    ''')
+    # 预算币种：只统计该币种账户上的支出，不同币种的金额不相加
+    add_column_if_missing(cursor, 'budgets', 'currency', "TEXT NOT NULL DEFAULT 'CNY'")
+    cursor.execute('DROP INDEX IF EXISTS idx_budgets_user_category')
+    cursor.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_budgets_user_category_currency
+                      ON budgets(user_id, IFNULL(category_id, 0), period, currency)''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS budget_spend (
+        budget_id INTEGER NOT NULL,
+        period_key TEXT NOT NULL,             -- YYYY-MM 或 YYYY
+        spent REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (budget_id, period_key)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS budget_alerts (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        budget_id INTEGER NOT NULL,
+        period_key TEXT NOT NULL,
+        threshold REAL NOT NULL,              -- 触发的比例（alert_ratio 或 1.0）
+        spent REAL NOT NULL,
+        budget_amount REAL NOT NULL,
+        acknowledged INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE (budget_id, period_key, threshold)  -- 每个周期每个阈值只提醒一次
+    )
+    ''')
+    # 交易所属的预算周期
+    budget_period_key = "CASE b.period WHEN 'yearly' THEN strftime('%Y', {row}.date) ELSE strftime('%Y-%m', {row}.date) END"
+    # 转账不计入预算；交易所在账户的币种须与预算币种相同
+    budget_match_any_currency = ("{row}.type = 'expense' AND {row}.transfer_id IS NULL AND b.user_id = {row}.user_id"
+                                 " AND (b.category_id IS NULL OR b.category_id = {row}.category_id)")
+    budget_match = (budget_match_any_currency
+                    + " AND b.currency = (SELECT currency FROM accounts WHERE id = {row}.account_id)")
+    budget_add = f'''
+        INSERT INTO budget_spend (budget_id, period_key, spent)
+        SELECT b.id, {budget_period_key.format(row='NEW')}, NEW.amount FROM budgets b
+        WHERE {budget_match.format(row='NEW')}
+        ON CONFLICT(budget_id, period_key) DO UPDATE SET spent = spent + excluded.spent;
+    '''
+    budget_remove = f'''
+        UPDATE budget_spend SET spent = spent - OLD.amount
+        WHERE (budget_id, period_key) IN (
+            SELECT b.id, {budget_period_key.format(row='OLD')} FROM budgets b
+            WHERE {budget_match.format(row='OLD')}
+        );
+    '''
+    create_trigger(cursor, 'trg_budget_spend_insert', f'''
+    AFTER INSERT ON transactions
+    BEGIN
+        {budget_add}
+    END
+    ''')
+    create_trigger(cursor, 'trg_budget_spend_update', f'''
+    AFTER UPDATE OF user_id, account_id, type, amount, category_id, date, transfer_id ON transactions
+    BEGIN
+        {budget_remove}
+        {budget_add}
+    END
+    ''')
+    # 账户改币种时，该账户上的支出从原币种的预算移到新币种的预算
+    budget_period_key_t = budget_period_key.format(row='t')
+    budget_match_t = budget_match_any_currency.format(row='t')
+    create_trigger(cursor, 'trg_budget_spend_account_currency', f'''
+    AFTER UPDATE OF currency ON accounts WHEN OLD.currency IS NOT NEW.currency
+    BEGIN
+        UPDATE budget_spend SET spent = spent - (
+            SELECT COALESCE(SUM(t.amount), 0) FROM transactions t JOIN budgets b ON b.id = budget_spend.budget_id
+            WHERE t.account_id = NEW.id AND {budget_match_t} AND {budget_period_key_t} = budget_spend.period_key
+        )
+        WHERE budget_id IN (SELECT id FROM budgets WHERE currency = OLD.currency);
+        INSERT INTO budget_spend (budget_id, period_key, spent)
+        SELECT b.id, {budget_period_key_t} AS pk, SUM(t.amount)
+        FROM budgets b JOIN transactions t ON t.account_id = NEW.id AND {budget_match_t}
+        WHERE b.currency = NEW.currency
+        GROUP BY b.id, pk
+        ON CONFLICT(budget_id, period_key) DO UPDATE SET spent = spent + excluded.spent;
+    END
+    ''')
+    create_trigger(cursor, 'trg_budget_spend_delete', f'''
+    AFTER DELETE ON transactions
+    BEGIN
+        {budget_remove}
+    END
+    ''')
+    # 触发器中的 OR IGNORE 会被外层语句的冲突处理方式覆盖，这里显式排除已提醒过的阈值
+    budget_alert = '''
+        INSERT INTO budget_alerts (budget_id, period_key, threshold, spent, budget_amount)
+        SELECT b.id, NEW.period_key, r.ratio, NEW.spent, b.amount
+        FROM budgets b
+        JOIN (SELECT alert_ratio AS ratio FROM budgets WHERE id = NEW.budget_id UNION SELECT 1.0) r
+        WHERE b.id = NEW.budget_id AND NEW.spent >= b.amount * r.ratio
+          AND NOT EXISTS (SELECT 1 FROM budget_alerts
+                          WHERE budget_id = NEW.budget_id AND period_key = NEW.period_key AND threshold = r.ratio);
+    '''
+    create_trigger(cursor, 'trg_budget_alert_insert', f'''
+    AFTER INSERT ON budget_spend
+    BEGIN
+        {budget_alert}
+    END
+    ''')
+    create_trigger(cursor, 'trg_budget_alert_update', f'''
+    AFTER UPDATE OF spent ON budget_spend WHEN NEW.spent > OLD.spent
+    BEGIN
+        {budget_alert}
+    END
+    ''')
+    
+    # 收款方：备注规范化后的虚拟生成列，按用户建索引用于收款方排行（见 payees.py）
+    add_column_if_missing(cursor, 'transactions', 'payee', 'TEXT GENERATED ALWAYS AS (lower(trim(description))) VIRTUAL')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_user_payee ON transactions(user_id, payee)')
+    
+    # 异常检测：按 (用户, 分类) 的稳健基线、用户见过的收款方、被标记的交易（见 anomalies.py）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS anomaly_baselines (
+        user_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        sample_size INTEGER NOT NULL,
+        median REAL NOT NULL,
+        scale REAL NOT NULL,                  -- 稳健标准差（MAD / 0.6745）
+        daily_mean REAL NOT NULL,             -- 最近窗口内每日笔数的均值
+        daily_std REAL NOT NULL,
+        last_date TEXT NOT NULL,              -- 最新交易日期及当天笔数，供增量频率检测
+        last_date_count INTEGER NOT NULL,
+        PRIMARY KEY (user_id, category_id)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS anomaly_payees (
+        user_id INTEGER NOT NULL,
+        payee TEXT NOT NULL,
+        first_seen TEXT,
+        PRIMARY KEY (user_id, payee)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS anomaly_flags (
+        transaction_id INTEGER NOT NULL,
+        reason TEXT NOT NULL,                 -- amount / frequency / new_payee
+        user_id INTEGER NOT NULL,
+        score REAL,
+        detail TEXT,
+        reviewed INTEGER NOT NULL DEFAULT 0,
+        flagged_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (transaction_id, reason)
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_anomaly_flags_user ON anomaly_flags(user_id, reviewed)')
+    
+    # 多币种：账户币种与本地汇率表（1 单位外币折合多少本位币，见 currency.py）
+    add_column_if_missing(cursor, 'accounts', 'currency', "TEXT NOT NULL DEFAULT 'CNY'")
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS exchange_rates (
+        currency TEXT NOT NULL,
+        rate_date TEXT NOT NULL,   -- YYYY-MM-DD
+        rate REAL NOT NULL,
+        PRIMARY KEY (currency, rate_date)
+    ) WITHOUT ROWID
+    ''')
+    
+    # 按年份归档：已归档年份及其按月汇总（见 archive.py）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS archived_years (
+        year TEXT PRIMARY KEY,        -- YYYY
+        path TEXT NOT NULL,
+        transaction_count INTEGER NOT NULL DEFAULT 0,
+        archived_at TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS archive_rollups (
+        month TEXT NOT NULL,          -- YYYY-MM
+        user_id INTEGER NOT NULL,
+        account_id INTEGER NOT NULL,
+        category_id INTEGER NOT NULL,
+        type TEXT NOT NULL,
+        total_amount REAL NOT NULL,
+        transaction_count INTEGER NOT NULL,
+        PRIMARY KEY (month, user_id, account_id, category_id, type)
+    ) WITHOUT ROWID
+    ''')
+    
+    # 分库模式下的跨库共享账户目录（只在主库中使用，见 sharding.py）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS shard_account_links (
+        linked_user_id INTEGER NOT NULL,
+        account_id INTEGER NOT NULL,
+        owner_user_id INTEGER NOT NULL,
+        permission_level TEXT NOT NULL,
+        PRIMARY KEY (linked_user_id, account_id)
+    ) WITHOUT ROWID
+    ''')
+    
+    # 预置分类去重：user_id 为 NULL 时 UNIQUE(user_id, name, type) 不生效，
+    # 旧版本会重复插入预置分类。去重后用部分唯一索引保证预置分类唯一
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_categories_preset'")
+    if cursor.fetchone() is None:
+        from category_catalog import dedupe_preset_categories
+        removed = dedupe_preset_categories(cursor)
+        if removed:
+            print(f"清理了 {removed} 个重复的预置分类")
+        cursor.execute('CREATE UNIQUE INDEX idx_categories_preset ON categories(name, type) WHERE user_id IS NULL')
+    
+    # 变更日志（CDC）：交易、账户和账户共享的每次增删改按顺序追加一条记录（见 change_log.py）
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS change_log (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,  -- 变更序号，压缩后也不会复用
+        table_name TEXT NOT NULL,
+        op TEXT NOT NULL,                       -- insert / update / delete / archive
+        row_id INTEGER,
+        payload TEXT,                           -- 变更后的行（删除时为删除前的行），JSON
+        changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS change_consumers (
+        name TEXT PRIMARY KEY,
+        last_seq INTEGER NOT NULL DEFAULT 0,    -- 消费者已处理的最大变更序号
+        updated_at TIMESTAMP
+    )
+    ''')
+    change_log_columns = {
+        'transactions': ('id', 'user_id', 'account_id', 'type', 'amount', 'category_id', 'date', 'description',
+                         'transfer_id'),
+        'accounts': ('id', 'user_id', 'name', 'type', 'balance', 'initial_balance', 'currency'),
+        'user_account_links': ('id', 'owner_user_id', 'linked_user_id', 'account_id', 'permission_level'),
+    }
+    # 账户余额随每笔交易变化，已由交易的变更体现，账户只记录其他字段的修改；
+    # 交易只记录载荷中字段的修改，重算指纹等内部列的 UPDATE 不产生变更
+    change_log_update_of = {
+        'transactions': ' OF user_id, account_id, type, amount, category_id, date, description, transfer_id',
+        'accounts': ' OF user_id, name, type, initial_balance, currency',
+    }
+    for table, columns in change_log_columns.items():
+        for op, event, row in (('insert', 'INSERT', 'NEW'), ('update', 'UPDATE', 'NEW'), ('delete', 'DELETE', 'OLD')):
+            payload = ', '.join(f"'{column}', {row}.{column}" for column in columns)
+            update_of = change_log_update_of.get(table, '') if op == 'update' else ''
+            create_trigger(cursor, f'trg_change_log_{table}_{op}', f'''
+            AFTER {event}{update_of} ON {table}
+            BEGIN
+                INSERT INTO change_log (table_name, op, row_id, payload)
+                VALUES ('{table}', '{op}', {row}.id, json_object({payload}));
+            END
+            ''')
+    
+    # 插入预置分类（唯一索引保证重复执行不会产生重复记录）
     if not db_exists:
         print("初始化新数据库，插入预置分类...")
-        preset_categories = [
-            (None, '工资', 'income'),
-            (None, '奖金', 'income'),
-            (None, '餐饮', 'expense'),
-            (None, '交通', 'expense'),
-            (None, '购物', 'expense'),
-            (None, '医疗', 'expense'),
-            (None, '教育', 'expense'),
-            (None, '娱乐', 'expense'),
-            (None, '其他', 'expense')
-        ]
-        
-        cursor.executemany('INSERT OR IGNORE INTO categories (user_id, name, type) VALUES (?, ?, ?)', preset_categories)
-        print(f"插入了 {len(preset_categories)} 个预置分类")
+    cursor.executemany('INSERT OR IGNORE INTO categories (user_id, name, type) VALUES (?, ?, ?)', PRESET_CATEGORIES)
+    if not db_exists:
+        print(f"插入了 {len(PRESET_CATEGORIES)} 个预置分类")
     
     conn.commit()
     conn.close()
 
-def get_db_connection():
-    return sqlite3.connect(DB_PATH)
\ No newline at end of file
+def get_db_connection(db_path=None):
+    _connections_opened.inc()
+    db_path = db_path or DB_PATH
+    # 开启 SQL 统计时返回带耗时记录的连接（见 query_profiler.py）
+    if query_profiler.is_enabled():
+        return sqlite3.connect(db_path, factory=query_profiler.ProfiledConnection)
+    return sqlite3.connect(db_path)
\ No newline at end of file
@@ -0,0 +1,194 @@
+# dedup.py
+"""
+重复交易检测
+
+1. 精确重复：每条交易保存指纹（账户、类型、日期、金额、规范化备注的哈希），
+   transactions.fingerprint 上有索引，新增交易时一次索引查找即可判断是否重复。
+2. 近似重复：按 (账户, 类型, 金额) 分桶，只在桶内比较日期相近、备注相似的交易，
+   避免对整个账本做两两比较。
+
+用法：
+    python dedup.py scan [--user 1] [--days 3] [--similarity 0.8]
+    python dedup.py backfill     # 重新计算所有交易的指纹
+"""
+import argparse
+import hashlib
+import unicodedata
+from datetime import datetime
+from difflib import SequenceMatcher
+from database import get_db_connection
+
+
+def normalize_description(description):
+    """规范化备注：全角转半角、转小写、去掉标点和空白"""
+    if not description:
+        return ''
+    text = unicodedata.normalize('NFKC', description).lower()
+    return ''.join(ch for ch in text if ch.isalnum())
+
+
+def transaction_fingerprint(account_id, type, amount, date, description):
+    """计算交易指纹"""
+    key = '|'.join([
+        str(account_id),
+        type,
+        str(date)[:10],
+        f'{round(float(amount), 2):.2f}',
+        normalize_description(description),
+    ])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+
+
+def find_duplicate(cursor, fingerprint):
+    """返回指纹相同的已有交易ID，没有则返回 None"""
+    cursor.execute('SELECT id FROM transactions WHERE fingerprint = ? LIMIT 1', (fingerprint,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def find_existing_fingerprints(cursor, fingerprints, chunk_size=500):
+    """批量查询已存在的指纹，返回集合"""
+    fingerprints = list(fingerprints)
+    existing = set()
+    for i in range(0, len(fingerprints), chunk_size):
+        chunk = fingerprints[i:i + chunk_size]
+        cursor.execute(f'''SELECT fingerprint FROM transactions
+                           WHERE fingerprint IN ({', '.join('?' * len(chunk))})''', chunk)
+        existing.update(row[0] for row in cursor.fetchall())
+    return existing
+
+
+def find_duplicate_transaction(account_id, type, amount, date, description=None):
+    """检查一笔待录入的交易是否与已有交易重复，返回重复交易ID或 None"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    duplicate_id = find_duplicate(cursor, transaction_fingerprint(account_id, type, amount, date, description))
+    conn.close()
+    return duplicate_id
+
+
+def backfill_fingerprints(cursor, only_missing=True, batch_size=5000):
+    """为已有交易计算指纹（由调用方负责提交）"""
+    where = 'WHERE fingerprint IS NULL' if only_missing else ''
+    cursor.execute(f'SELECT id, account_id, type, amount, date, description FROM transactions {where}')
+    rows = cursor.fetchall()
+    updates = [(transaction_fingerprint(account_id, t_type, amount, t_date, description), tid)
+               for tid, account_id, t_type, amount, t_date, description in rows]
+    for i in range(0, len(updates), batch_size):
+        cursor.executemany('UPDATE transactions SET fingerprint = ? WHERE id = ?', updates[i:i + batch_size])
+    return len(updates)
+
+
+def scan_near_duplicates(user_id=None, date_window_days=3, similarity=0.8):
+    """
+    扫描整个账本中的近似重复交易
+    :param user_id: 只扫描该用户的交易（默认全部）
+    :param date_window_days: 日期相差不超过该天数视为可能重复
+    :param similarity: 规范化备注的相似度阈值 (0~1)
+    :return: [[(id, account_id, type, amount, date, description), ...], ...] 每组为一批疑似重复
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    where = 'WHERE user_id = ?' if user_id is not None else ''
+    params = (user_id,) if user_id is not None else ()
+    # 只取同一桶内至少有两条记录的交易，按桶和日期排序后流式处理
+    cursor.execute(f'''
+        SELECT id, account_id, type, amount, date, description, bucket FROM (
+            SELECT id, account_id, type, amount, date, description,
+                   account_id || '|' || type || '|' || CAST(ROUND(amount * 100) AS INTEGER) AS bucket,
+                   COUNT(*) OVER (PARTITION BY account_id, type, CAST(ROUND(amount * 100) AS INTEGER)) AS bucket_size
+            FROM transactions {where}
+        )
+        WHERE bucket_size > 1
+        ORDER BY bucket, date, id
+    ''', params)
+
+    groups = []
+    bucket_key = None
+    bucket_rows = []
+    while True:
+        rows = cursor.fetchmany(1000)
+        for row in rows:
+            if row[6] != bucket_key:
+                groups.extend(_group_bucket(bucket_rows, date_window_days, similarity))
+                bucket_key, bucket_rows = row[6], []
+            bucket_rows.append(row[:6])
+        if not rows:
+            break
+    groups.extend(_group_bucket(bucket_rows, date_window_days, similarity))
+    conn.close()
+    return groups
+
+
+def _to_date(value):
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _similar(a, b, threshold):
+    if a == b:
+        return True
+    if not a or not b:
+        return False
+    return SequenceMatcher(None, a, b).ratio() >= threshold
+
+
+def _group_bucket(rows, date_window_days, similarity):
+    """桶内（已按日期排序）把日期相近且备注相似的交易连成组"""
+    if len(rows) < 2:
+        return []
+    dates = [_to_date(row[4]) for row in rows]
+    texts = [normalize_description(row[5]) for row in rows]
+    parent = list(range(len(rows)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i in range(len(rows)):
+        j = i + 1
+        # 只比较日期窗口内的后续记录
+        while j < len(rows) and (dates[j] - dates[i]).days <= date_window_days:
+            if _similar(texts[i], texts[j], similarity):
+                parent[find(j)] = find(i)
+            j += 1
+
+    clusters = {}
+    for i in range(len(rows)):
+        clusters.setdefault(find(i), []).append(rows[i])
+    return [cluster for cluster in clusters.values() if len(cluster) > 1]
+
+
+def print_duplicate_groups(groups, limit=50):
+    if not groups:
+        print("✅ 未发现疑似重复的交易")
+        return
+    print(f"⚠️  发现 {len(groups)} 组疑似重复的交易:")
+    for group in groups[:limit]:
+        print("-" * 60)
+        for tid, account_id, t_type, amount, t_date, description in group:
+            print(f"  {tid} | 账户 {account_id} | {t_type} | {amount:.2f} | {t_date} | {description or ''}")
+    if len(groups) > limit:
+        print(f"... 其余 {len(groups) - limit} 组未显示")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='重复交易检测')
+    sub = parser.add_subparsers(dest='command', required=True)
+    scan = sub.add_parser('scan', help='扫描近似重复的交易')
+    scan.add_argument('--user', type=int, help='只扫描该用户的交易')
+    scan.add_argument('--days', type=int, default=3, help='日期窗口（天）')
+    scan.add_argument('--similarity', type=float, default=0.8, help='备注相似度阈值')
+    scan.add_argument('--limit', type=int, default=50, help='最多显示的组数')
+    sub.add_parser('backfill', help='重新计算所有交易的指纹')
+    args = parser.parse_args()
+
+    if args.command == 'scan':
+        print_duplicate_groups(scan_near_duplicates(args.user, args.days, args.similarity), args.limit)
+    else:
+        conn = get_db_connection()
+        count = backfill_fingerprints(conn.cursor(), only_missing=False)
+        conn.commit()
+        conn.close()
+        print(f"已更新 {count} 条交易的指纹")
@@ -0,0 +1,291 @@
+# exporter.py
+"""
+交易数据流式导出（CSV / JSON Lines / Parquet）
+
+查询结果用 fetchmany 分块读取、逐块写出，内存占用与数据量无关。
+支持与 get_all_accessible_transactions 相同的过滤条件，已归档年份的交易一并导出。
+
+增量模式按导出任务名记录已处理到的变更日志序号（见 change_log.py）：第一次为全量导出，
+之后只导出新增、修改（当前行）和删除（删除前的行）的交易，op 列标明是哪一种。
+导出任务同时登记为变更日志的消费者，未导出的变更不会被 truncate_consumed 删除。
+
+Parquet 需要安装 pyarrow（可选依赖）。
+
+用法：
+    python exporter.py out.csv --format csv --user 1
+    python exporter.py out.jsonl --format jsonl --since-last warehouse
+    python exporter.py out.parquet --format parquet --start-date 2024-01-01
+"""
+import argparse
+import csv
+import json
+import time
+from database import get_db_connection
+from query_builder import ACCESSIBLE_CONDITION, compile_query
+from archive import transactions_source
+from change_log import commit_offset
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+EXPORT_COLUMNS = ['id', 'user_id', 'account_id', 'account', 'type', 'amount', 'category_id',
+                  'category', 'date', 'description', 'transaction_owner', 'ownership', 'created_at']
+# 增量导出多一列 op：upsert 为新增或修改后的当前行，delete 为删除前的行
+INCREMENTAL_COLUMNS = EXPORT_COLUMNS + ['op']
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+# 导出任务在变更日志中登记的消费者名前缀，保证未导出的变更不会被 truncate_consumed 删除
+CONSUMER_PREFIX = 'export:'
+
+_ROW_COLUMNS = '''t.id, t.user_id, t.account_id, a.name as account, t.type, t.amount, t.category_id,
+           c.name as category, t.date, t.description, u.username as transaction_owner,
+           CASE WHEN ? IS NULL THEN NULL WHEN t.user_id = ? THEN 'own' ELSE 'linked' END as ownership'''
+
+# 区间内每笔交易最新的一条变更；归档事件没有行ID，归档不改变交易内容，不需要导出
+_LATEST_CHANGES = '''
+    SELECT cl.row_id, cl.op, cl.payload FROM change_log cl
+    JOIN (SELECT row_id, MAX(seq) AS seq FROM change_log
+          WHERE table_name = 'transactions' AND row_id IS NOT NULL AND seq > ? AND seq <= ?
+          GROUP BY row_id) latest ON cl.seq = latest.seq'''
+
+
+def _scoped(query, params, user_id, filters):
+    """追加可访问交易的限制和过滤条件，按交易ID排序"""
+    if user_id is not None:
+        query += f' AND {ACCESSIBLE_CONDITION}'
+        params.extend([user_id, user_id])
+    query, filter_values = compile_query(query, filters, order_by='t.id')
+    return query, params + filter_values
+
+
+def _full_query(cursor, user_id, filters):
+    # 日期范围涉及已归档年份时合并归档分区
+    source = transactions_source(cursor, filters.get('start_date'), filters.get('end_date'))
+    query = f'''
+    SELECT {_ROW_COLUMNS}, t.created_at
+    FROM {source} t
+    JOIN categories c ON t.category_id = c.id
+    JOIN accounts a ON t.account_id = a.id
+    JOIN users u ON t.user_id = u.id
+    WHERE 1 = 1
+    '''
+    return _scoped(query, [user_id, user_id], user_id, filters)
+
+
+def _incremental_queries(cursor, user_id, filters, since_seq, until_seq):
+    # 新增和修改过的交易取当前行（可能已被归档）
+    source = transactions_source(cursor)
+    upserts = f'''
+    SELECT {_ROW_COLUMNS}, t.created_at, 'upsert' as op
+    FROM ({_LATEST_CHANGES}) l
+    JOIN {source} t ON t.id = l.row_id
+    JOIN categories c ON t.category_id = c.id
+    JOIN accounts a ON t.account_id = a.id
+    JOIN users u ON t.user_id = u.id
+    WHERE l.op != 'delete'
+    '''
+    # 已删除的交易取变更日志中删除前的行，账户、分类和用户仍存在时补上名称
+    payload_columns = ', '.join(f"json_extract(payload, '$.{column}') AS {column}"
+                                for column in ('id', 'user_id', 'account_id', 'type', 'amount',
+                                               'category_id', 'date', 'description'))
+    deletes = f'''
+    SELECT {_ROW_COLUMNS}, NULL as created_at, 'delete' as op
+    FROM (SELECT {payload_columns} FROM ({_LATEST_CHANGES}) WHERE op = 'delete') t
+    LEFT JOIN categories c ON t.category_id = c.id
+    LEFT JOIN accounts a ON t.account_id = a.id
+    LEFT JOIN users u ON t.user_id = u.id
+    WHERE 1 = 1
+    '''
+    params = [user_id, user_id, since_seq, until_seq]
+    return [_scoped(upserts, list(params), user_id, filters), _scoped(deletes, list(params), user_id, filters)]
+
+
+def iter_transaction_chunks(user_id=None, filters=None, chunk_size=5000, cursor=None,
+                            since_seq=None, until_seq=None):
+    """
+    按交易ID升序分块读取交易
+    :param user_id: 导出该用户可访问的交易（自己的和被共享账户上的）；为空时导出全部用户，ownership 为空
+    :param filters: 过滤条件，键见 query_builder.TRANSACTION_FILTERS
+    :param chunk_size: 每块行数
+    :param cursor: 使用调用方的游标（默认新建连接；不能处于事务中，需要时会 ATTACH 归档文件）
+    :param since_seq: 为空时读取全部交易（包括已归档年份）；否则只读取变更序号在
+                      (since_seq, until_seq] 内增删改过的交易，先是新增和修改的，再是删除的
+    :param until_seq: 增量读取的变更序号上限
+    :return: 生成器，每次产出一个行元组列表，列顺序见 EXPORT_COLUMNS（增量读取时为 INCREMENTAL_COLUMNS）
+    """
+    filters = filters or {}
+    own_conn = None
+    if cursor is None:
+        own_conn = get_db_connection()
+        cursor = own_conn.cursor()
+
+    try:
+        if since_seq is None:
+            queries = [_full_query(cursor, user_id, filters)]
+        else:
+            queries = _incremental_queries(cursor, user_id, filters, since_seq, until_seq)
+        for query, params in queries:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+    finally:
+        if own_conn is not None:
+            own_conn.close()
+
+
+class CsvExportWriter:
+    def __init__(self, path, columns=EXPORT_COLUMNS):
+        self._file = open(path, 'w', encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(columns)
+
+    def write_rows(self, rows):
+        self._writer.writerows(rows)
+
+    def close(self):
+        self._file.close()
+
+
+class JsonLinesExportWriter:
+    def __init__(self, path, columns=EXPORT_COLUMNS):
+        self._file = open(path, 'w', encoding='utf-8')
+        self._columns = columns
+
+    def write_rows(self, rows):
+        self._file.writelines(json.dumps(dict(zip(self._columns, row)), ensure_ascii=False) + '\n'
+                              for row in rows)
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetExportWriter:
+    """每个数据块写为一个 row group"""
+
+    def __init__(self, path, columns=EXPORT_COLUMNS):
+        if pa is None:
+            raise ValueError("导出 Parquet 需要安装 pyarrow: pip install pyarrow")
+        integer_columns = {'id', 'user_id', 'account_id', 'category_id'}
+        self._schema = pa.schema([
+            (column, pa.int64() if column in integer_columns else
+             pa.float64() if column == 'amount' else pa.string())
+            for column in columns
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def write_rows(self, rows):
+        columns = list(zip(*rows))
+        arrays = [pa.array([None if v is None else str(v) for v in col], type=field.type)
+                  if field.type == pa.string() else pa.array(col, type=field.type)
+                  for col, field in zip(columns, self._schema)]
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self._schema))
+
+    def close(self):
+        self._writer.close()
+
+
+_WRITERS = {
+    'csv': CsvExportWriter,
+    'jsonl': JsonLinesExportWriter,
+    'parquet': ParquetExportWriter,
+}
+
+
+def get_export_state(name):
+    """返回导出任务已处理到的变更序号（从未导出，或旧版本按交易ID记录时为 None）"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT last_seq FROM export_state WHERE name = ?', (name,))
+    row = cursor.fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def export_transactions(path, format='csv', user_id=None, filters=None, since_last=None,
+                        chunk_size=5000):
+    """
+    导出交易
+    :param path: 输出文件路径
+    :param format: csv / jsonl / parquet
+    :param user_id: 只导出该用户可访问的交易（默认全部用户）
+    :param filters: 过滤条件
+    :param since_last: 增量导出任务名；指定后只导出上次该任务之后增删改的交易（第一次为全量，
+                       带 op 列），并在成功后更新记录
+    :param chunk_size: 每次读取的行数
+    :return: {'rows', 'seconds', 'rows_per_second', 'last_seq'}，last_seq 为本次处理到的变更序号
+    """
+    if format not in _WRITERS:
+        raise ValueError(f"不支持的导出格式: {format}，可选: {', '.join(FORMATS)}")
+
+    since_seq = get_export_state(since_last) if since_last else None
+    # 先取变更序号上限：导出期间的新变更留给下一次（已导出的当前行再导出一次不影响结果）
+    conn = get_db_connection()
+    last_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM change_log').fetchone()[0]
+    conn.close()
+
+    started = time.perf_counter()
+    writer = _WRITERS[format](path, INCREMENTAL_COLUMNS if since_last else EXPORT_COLUMNS)
+    rows_written = 0
+    try:
+        for rows in iter_transaction_chunks(user_id, filters, chunk_size, since_seq=since_seq,
+                                            until_seq=last_seq):
+            if since_last and since_seq is None:
+                # 第一次增量导出为全量导出，每行都是 upsert
+                rows = [row + ('upsert',) for row in rows]
+            writer.write_rows(rows)
+            rows_written += len(rows)
+    finally:
+        writer.close()
+    elapsed = time.perf_counter() - started
+
+    if since_last:
+        conn = get_db_connection()
+        conn.execute('''
+            INSERT INTO export_state (name, last_seq, exported_at, rows_exported)
+            VALUES (?, ?, CURRENT_TIMESTAMP, ?)
+            ON CONFLICT(name) DO UPDATE SET last_seq = excluded.last_seq,
+                exported_at = excluded.exported_at,
+                rows_exported = export_state.rows_exported + excluded.rows_exported
+        ''', (since_last, last_seq, rows_written))
+        conn.commit()
+        conn.close()
+        commit_offset(CONSUMER_PREFIX + since_last, last_seq)
+
+    return {
+        'rows': rows_written,
+        'seconds': round(elapsed, 4),
+        'rows_per_second': round(rows_written / elapsed, 1) if elapsed > 0 else None,
+        'last_seq': last_seq,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='交易数据流式导出')
+    parser.add_argument('path', help='输出文件路径')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--user', type=int, help='只导出该用户可访问的交易')
+    parser.add_argument('--type', choices=['income', 'expense'])
+    parser.add_argument('--category-id', type=int)
+    parser.add_argument('--account-id', type=int)
+    parser.add_argument('--start-date')
+    parser.add_argument('--end-date')
+    parser.add_argument('--since-last', metavar='NAME', help='增量导出任务名')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    args = parser.parse_args()
+
+    cli_filters = {key: value for key, value in (('type', args.type), ('category_id', args.category_id),
+                                                 ('account_id', args.account_id),
+                                                 ('start_date', args.start_date),
+                                                 ('end_date', args.end_date)) if value is not None}
+    stats = export_transactions(args.path, args.format, args.user, cli_filters, args.since_last,
+                                args.chunk_size)
+    print(f"导出 {stats['rows']} 条交易，耗时 {stats['seconds']:.2f}s，"
+          f"{stats['rows_per_second'] or 0:.0f} 行/秒")
@@ -0,0 +1,214 @@
+# forecast.py
+"""
+收支趋势与预测
+
+按 (用户, 分类) 构建跨年份的月度序列：热库交易按月汇总，已归档年份直接使用 archive_rollups，
+一次查询取出所有用户所有分类的序列，缺少交易的月份补 0。每条序列计算：
+
+- 移动平均（最近 window 个月）
+- 季节指数：各自然月的平均值 / 整体平均值（至少两整年数据才计算，否则全部为 1）
+- 预测：先去除季节性，再用线性趋势（最小二乘）或指数平滑（Holt 线性趋势）外推，最后乘回季节指数
+
+转账不计入序列；各账户金额按交易日汇率折算到报告币种（已归档月份按该月最后一天的汇率），
+与 StatisticsManager.get_by_month 一致。
+
+用法：
+    python forecast.py [--user 1] [--type expense] [--horizon 3] [--method exponential]
+"""
+import argparse
+from datetime import date
+from database import get_db_connection
+from currency import BASE_CURRENCY, convert_grouped
+
+METHODS = ('linear', 'exponential')
+
+
+def _month_index(month):
+    """'YYYY-MM' 转换为连续的月序号"""
+    return int(month[:4]) * 12 + int(month[5:7]) - 1
+
+
+def _month_label(index):
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def load_monthly_series(cursor, user_id=None, type='expense', end_month=None, reporting_currency=BASE_CURRENCY):
+    """
+    读取所有 (用户, 分类) 的月度序列
+    :param user_id: 只读取该用户（默认全部用户）
+    :param type: 'income' 或 'expense'
+    :param end_month: 序列截止月份 'YYYY-MM'（默认为数据中最新的完整月份）
+    :param reporting_currency: 报告币种，与其相同的币种不做折算
+    :return: {(user_id, category_id): (起始月份, [每月金额])}
+    """
+    user_filter = ' AND t.user_id = ?' if user_id is not None else ''
+    params = [reporting_currency, type] + ([user_id] if user_id is not None else [])
+    # 与报告币种相同的账户折算日期为 NULL，按月合并为一组；外币按日期分组后批量折算
+    cursor.execute(f'''
+        SELECT t.user_id, t.category_id, strftime('%Y-%m', t.date) AS month, a.currency,
+               CASE WHEN a.currency = ? THEN NULL ELSE t.date END AS rate_date, SUM(t.amount)
+        FROM transactions t
+        JOIN accounts a ON a.id = t.account_id
+        WHERE t.type = ? AND t.transfer_id IS NULL{user_filter}
+        GROUP BY t.user_id, t.category_id, month, a.currency, rate_date
+        UNION ALL
+        SELECT t.user_id, t.category_id, t.month, a.currency,
+               CASE WHEN a.currency = ? THEN NULL ELSE date(t.month || '-01', '+1 month', '-1 day') END AS rate_date,
+               SUM(t.total_amount)
+        FROM archive_rollups t
+        JOIN accounts a ON a.id = t.account_id
+        WHERE t.type = ?{user_filter}
+        GROUP BY t.user_id, t.category_id, t.month, a.currency, rate_date
+    ''', params + params)
+    totals = convert_grouped([(row[:3], row[3], row[4], row[5]) for row in cursor.fetchall()], reporting_currency)
+    if not totals:
+        return {}
+    rows = sorted((uid, category_id, month, total) for (uid, category_id, month), total in totals.items())
+
+    if end_month is None:
+        latest = max(row[2] for row in rows)
+        # 本月尚未结束，默认不参与预测
+        if latest >= date.today().strftime('%Y-%m'):
+            latest = _month_label(_month_index(date.today().strftime('%Y-%m')) - 1)
+        end_month = latest
+    end = _month_index(end_month)
+
+    series = {}
+    for uid, category_id, month, total in rows:
+        index = _month_index(month)
+        if index > end:
+            continue
+        key = (uid, category_id)
+        if key not in series:
+            series[key] = (index, [0.0] * (end - index + 1))
+        start, values = series[key]
+        values[index - start] += total
+    return {key: (_month_label(start), values) for key, (start, values) in series.items()}
+
+
+def moving_average(values, window=3):
+    """最近 window 个月的平均值（不足 window 个月时取全部）"""
+    tail = values[-window:]
+    return sum(tail) / len(tail) if tail else 0.0
+
+
+def seasonal_indices(values, start_month, period=12):
+    """
+    各自然月的季节指数（索引 0 为 1 月）
+    少于两个完整周期或整体平均为 0 时返回全 1
+    """
+    overall = sum(values) / len(values) if values else 0.0
+    if len(values) < 2 * period or overall == 0:
+        return [1.0] * period
+    sums = [0.0] * period
+    counts = [0] * period
+    first = _month_index(start_month)
+    for offset, value in enumerate(values):
+        slot = (first + offset) % period
+        sums[slot] += value
+        counts[slot] += 1
+    return [(sums[i] / counts[i]) / overall if counts[i] else 1.0 for i in range(period)]
+
+
+def linear_trend(values):
+    """最小二乘拟合 y = intercept + slope * x，返回 (intercept, slope)"""
+    n = len(values)
+    if n < 2:
+        return (values[0] if values else 0.0), 0.0
+    mean_x = (n - 1) / 2
+    mean_y = sum(values) / n
+    sxx = sum((x - mean_x) ** 2 for x in range(n))
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in enumerate(values))
+    slope = sxy / sxx
+    return mean_y - slope * mean_x, slope
+
+
+def exponential_smoothing(values, alpha=0.5, beta=0.3):
+    """Holt 线性趋势指数平滑，返回最后的 (水平, 趋势)"""
+    if not values:
+        return 0.0, 0.0
+    level, trend = values[0], (values[1] - values[0]) if len(values) > 1 else 0.0
+    for value in values[1:]:
+        previous_level = level
+        level = alpha * value + (1 - alpha) * (level + trend)
+        trend = beta * (level - previous_level) + (1 - beta) * trend
+    return level, trend
+
+
+def forecast_series(values, start_month, horizon=3, method='exponential', window=3):
+    """
+    预测一条月度序列
+    :return: {'moving_average', 'seasonality', 'trend', 'forecast': [(月份, 金额)]}
+    """
+    if method not in METHODS:
+        raise ValueError(f"不支持的预测方法 {method}，可选: {', '.join(METHODS)}")
+    first = _month_index(start_month)
+    seasonality = seasonal_indices(values, start_month)
+    adjusted = [value / (seasonality[(first + i) % 12] or 1.0) for i, value in enumerate(values)]
+
+    if method == 'linear':
+        intercept, slope = linear_trend(adjusted)
+        base, trend = intercept + slope * (len(adjusted) - 1), slope
+    else:
+        base, trend = exponential_smoothing(adjusted)
+
+    last = first + len(values) - 1
+    forecast = []
+    for step in range(1, horizon + 1):
+        index = last + step
+        # 支出和收入不会为负，趋势外推到 0 以下时截断
+        forecast.append((_month_label(index), round(max(base + trend * step, 0.0) * seasonality[index % 12], 2)))
+    return {
+        'moving_average': round(moving_average(values, window), 2),
+        'seasonality': [round(s, 3) for s in seasonality],
+        'trend': round(trend, 2),
+        'forecast': forecast,
+    }
+
+
+def forecast_all(user_id=None, type='expense', horizon=3, method='exponential', window=3,
+                 end_month=None, cursor=None, reporting_currency=BASE_CURRENCY):
+    """
+    对所有 (用户, 分类) 的月度序列做预测
+    :param cursor: 复用调用方的游标（默认新建连接）
+    :param reporting_currency: 报告币种
+    :return: {(user_id, category_id): {'start_month', 'history', 'moving_average', 'seasonality', 'trend', 'forecast'}}
+    """
+    conn = None
+    if cursor is None:
+        conn = get_db_connection()
+        cursor = conn.cursor()
+    try:
+        series = load_monthly_series(cursor, user_id, type, end_month, reporting_currency)
+    finally:
+        if conn:
+            conn.close()
+
+    results = {}
+    for key, (start_month, values) in series.items():
+        result = forecast_series(values, start_month, horizon, method, window)
+        result['start_month'] = start_month
+        result['history'] = [round(v, 2) for v in values]
+        results[key] = result
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='收支趋势与预测')
+    parser.add_argument('--user', type=int, help='只预测该用户（默认全部用户）')
+    parser.add_argument('--type', choices=('income', 'expense'), default='expense')
+    parser.add_argument('--horizon', type=int, default=3, help='预测未来几个月')
+    parser.add_argument('--method', choices=METHODS, default='exponential')
+    parser.add_argument('--window', type=int, default=3, help='移动平均窗口（月）')
+    args = parser.parse_args()
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    results = forecast_all(args.user, args.type, args.horizon, args.method, args.window, cursor=cursor)
+    cursor.execute('SELECT id, name FROM categories')
+    names = dict(cursor.fetchall())
+    conn.close()
+    for (uid, category_id), result in sorted(results.items()):
+        forecast = ', '.join(f"{month}: {amount:.2f}" for month, amount in result['forecast'])
+        print(f"用户 {uid} | {names.get(category_id, category_id)} | 移动平均 {result['moving_average']:.2f} | "
+              f"趋势 {result['trend']:+.2f}/月 | 预测 {forecast}")
@@ -0,0 +1,122 @@
+# log_config.py
+"""
+结构化、分级的日志
+
+所有模块通过 get_logger(__name__) 获取 'finance.*' 下的日志器，使用 %s 占位符传参：
+    logger.debug('用户 %s 注册成功', username)
+级别未开启时 logging 直接返回，不做任何字符串格式化和 I/O。
+
+setup_logging() 在 'finance' 日志器上安装 QueueHandler：业务线程只把日志记录放入队列，
+格式化与写入由后台 QueueListener 线程完成，不阻塞调用方。
+
+环境变量（main.py 启动时读取）：
+  FINANCE_LOG_LEVEL   日志级别，默认 WARNING
+  FINANCE_LOG_FORMAT  json 输出结构化日志，默认 text
+  FINANCE_LOG_FILE    写入文件而不是标准错误
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from datetime import datetime
+
+ROOT_LOGGER_NAME = 'finance'
+
+# LogRecord 自带的属性，其余属性视为通过 extra= 传入的结构化字段
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+logging.getLogger(ROOT_LOGGER_NAME).setLevel(logging.WARNING)
+
+
+def get_logger(name):
+    """返回 'finance' 下的日志器，name 通常为 __name__"""
+    if name == ROOT_LOGGER_NAME or name.startswith(ROOT_LOGGER_NAME + '.'):
+        return logging.getLogger(name)
+    return logging.getLogger(f'{ROOT_LOGGER_NAME}.{name}')
+
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON，extra= 传入的字段原样保留"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """只做必要的准备工作：保留 args，把格式化推迟到监听线程"""
+
+    def prepare(self, record):
+        if record.exc_info and not record.exc_text:
+            # 异常对象不能跨线程安全地延后格式化
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level='WARNING', structured=False, log_file=None, stream=None):
+    """
+    配置 'finance' 日志器
+    :param level: 日志级别（名称或数值）
+    :param structured: True 输出 JSON 行，False 输出普通文本
+    :param log_file: 日志文件路径，为空时写入 stream（默认标准错误）
+    :return: 后台 QueueListener
+    """
+    global _listener
+    shutdown_logging()
+
+    if log_file:
+        target = logging.FileHandler(log_file, encoding='utf-8')
+    else:
+        target = logging.StreamHandler(stream or sys.stderr)
+    if structured:
+        target.setFormatter(JsonFormatter())
+    else:
+        target.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_QueueHandler(log_queue))
+    root.setLevel(level.upper() if isinstance(level, str) else level)
+    root.propagate = False
+
+    _listener = logging.handlers.QueueListener(log_queue, target, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown_logging():
+    """停止后台线程并写出队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def setup_from_env():
+    """根据环境变量配置日志"""
+    return setup_logging(level=os.environ.get('FINANCE_LOG_LEVEL', 'WARNING'),
+                         structured=os.environ.get('FINANCE_LOG_FORMAT', 'text').lower() == 'json',
+                         log_file=os.environ.get('FINANCE_LOG_FILE') or None)
+
+
+atexit.register(shutdown_logging)
@@ -4,47 +4,20 @@ import platform
 from database import init_db, get_db_connection
 from auth import register_user, login_user
 from transaction_manager import add_transaction, get_transactions, edit_transaction, delete_transaction
+from transaction_search import search_transactions
+from dedup import find_duplicate_transaction
+from budgets import set_budget, delete_budget, get_budget_status, get_alerts, acknowledge_alerts, print_budget_status
+from anomalies import get_flags, mark_reviewed, print_flags
+from transfers import transfer, get_transfers, delete_transfer
+from recurring import add_recurring_rule, get_recurring_rules, deactivate_rule, materialize_due, FREQUENCIES
+from category_catalog import get_user_categories
 from account_manager import add_account, get_accounts, delete_account, update_account
-from mystatistics import get_category_stats, get_monthly_stats, get_account_stats, get_summary
+from mystatistics import get_category_stats, get_monthly_stats, get_account_stats, get_summary, get_forecast, get_top_payees
 from utils import input_date, input_float, input_int
+from metrics import start_from_env as start_metrics_from_env
+from log_config import setup_from_env as setup_logging_from_env
 
 
-# 在 main.py 中修改 get_user_categories 函数
-def get_user_categories(user_id, transaction_type=None):
-    """返回用户可见的分类 (id, name, type)，去除重复"""
-    conn = get_db_connection()
-    cur = conn.cursor()
-    
-    if transaction_type:
-        # 使用 DISTINCT 确保不返回重复记录
-        cur.execute("""
-            SELECT DISTINCT id, name, type, user_id 
-            FROM categories 
-            WHERE (user_id = ? OR user_id IS NULL) AND type = ?
-            ORDER BY user_id DESC, id ASC
-        """, (user_id, transaction_type))
-    else:
-        cur.execute("""
-            SELECT DISTINCT id, name, type, user_id 
-            FROM categories 
-            WHERE (user_id = ? OR user_id IS NULL)
-            ORDER BY user_id DESC, id ASC
-        """, (user_id,))
-    
-    rows = cur.fetchall()
-    conn.close()
-
-    # 使用字典来确保名称唯一性
-    seen_names = set()
-    unique_categories = []
-    
-    for cid, name, ctype, cuid in rows:
-        if name not in seen_names:
-            seen_names.add(name)
-            unique_categories.append((cid, name, ctype))
-    
-    return unique_categories
-
 def validate_account_access(user_id, account_id):
     conn = get_db_connection()
     cur = conn.cursor()
@@ -113,15 +86,37 @@ def add_transaction_flow(current_user):
     
     desc = input("备注(可选): ").strip() or None
     
+    # 录入前检查是否与已有交易重复
+    duplicate_id = find_duplicate_transaction(aid, t, amt, dt.strftime('%Y-%m-%d'), desc)
+    if duplicate_id is not None:
+        if input(f"与已有交易 {duplicate_id} 完全相同，仍然添加? (y/n): ").lower() != 'y':
+            print("已取消")
+            return
+    
     # 修复日期格式字符串
     ok = add_transaction(user_id, aid, t, amt, cid, dt.strftime('%Y-%m-%d'), desc)
     print("添加成功" if ok else "添加失败")
+    if ok:
+        show_budget_alerts(user_id)
+
+
+def show_budget_alerts(user_id):
+    """显示并标记新的预算提醒"""
+    alerts = get_alerts(user_id)
+    for _, category, pk, threshold, spent, amount, _ in alerts:
+        if threshold >= 1:
+            print(f"⚠️  预算超支：{category} {pk} 已支出 {spent:.2f}，预算 {amount:.2f}")
+        else:
+            print(f"💡 预算提醒：{category} {pk} 已支出 {spent:.2f}，达到预算 {amount:.2f} 的 {threshold * 100:.0f}%")
+    if alerts:
+        acknowledge_alerts(user_id, [a[0] for a in alerts])
 
 
 def view_transactions_flow(current_user):
     user_id = current_user[0]
     filters = {}
-    print("1. 全部 2. 按类型 3. 按分类 4. 按时间 5. 组合")
+    keyword = None
+    print("1. 全部 2. 按类型 3. 按分类 4. 按时间 5. 组合 6. 按备注搜索")
     ch = input("请选择: ").strip()
     if ch == '2':
         while True:
@@ -157,8 +152,14 @@ def view_transactions_flow(current_user):
         if input("按时间过滤? (y/n): ").lower() == 'y':
             filters['start_date'] = input("开始日期: ")
             filters['end_date'] = input("结束日期: ")
+    elif ch == '6':
+        keyword = input("搜索关键词(多个词用空格分隔): ").strip()
 
-    records = get_transactions(user_id, filters)
+    if keyword:
+        # 搜索结果按相关度排序，去掉最后的相关度得分列
+        records = [r[:7] for r in search_transactions(user_id, keyword, filters)]
+    else:
+        records = get_transactions(user_id, filters)
     if not records:
         print("没有记录")
         return
@@ -360,8 +361,132 @@ def unshare_account_flow(current_user):
     print(message)
 
 
+def recurring_flow(current_user):
+    """定期交易管理"""
+    user_id = current_user[0]
+    while True:
+        print("\n=== 定期交易 ===")
+        print("1 添加规则 2 查看规则 3 停用规则 4 立即生成到期交易 5 返回")
+        c = input("请选择: ").strip()
+        if c == '1':
+            accounts = get_accounts(user_id)
+            if not accounts:
+                print("暂无账户，请先添加账户！")
+                continue
+            for a in accounts:
+                print(f"{a[0]}. {a[1]}")
+            aid = input_int("请选择账户ID: ")
+            t = input("类型 (income/expense): ").lower()
+            cats = get_user_categories(user_id, t)
+            for cat in cats:
+                print(f"{cat[0]}. {cat[1]}")
+            cid = input_int("请选择分类ID: ")
+            amt = input_float("金额: ")
+            freq = input(f"周期 ({'/'.join(FREQUENCIES)}): ").strip().lower()
+            interval = input_int("每隔几个周期 (1 表示每个周期): ")
+            start = input_date("首次日期")
+            end = input("结束日期 (YYYY-MM-DD，回车表示不结束): ").strip() or None
+            desc = input("备注(可选): ").strip() or None
+            rule_id = add_recurring_rule(user_id, aid, t, amt, cid, freq, start.strftime('%Y-%m-%d'),
+                                         interval, end, desc)
+            if rule_id:
+                print(f"规则 {rule_id} 添加成功")
+        elif c == '2':
+            rules = get_recurring_rules(user_id)
+            if not rules:
+                print("暂无定期交易规则")
+            for r in rules:
+                status = f"下次 {r[8]}" if r[9] and r[8] else "已停用"
+                print(f"{r[0]} | {r[1]} | {r[2]} | {r[3]:.2f} | {r[4]} | 每{r[7]}个{r[6]} | {status} | {r[5] or ''}")
+        elif c == '3':
+            rid = input_int("规则ID: ")
+            print("已停用" if deactivate_rule(user_id, rid) else "规则不存在")
+        elif c == '4':
+            result = materialize_due(user_id=user_id)
+            if result:
+                print(f"生成 {result['inserted']} 笔交易")
+        elif c == '5':
+            break
+        else:
+            print("无效选择")
+
+
+def budget_flow(current_user):
+    """预算管理"""
+    user_id = current_user[0]
+    while True:
+        print("\n=== 预算 ===")
+        print("1 查看本期预算 2 设置预算 3 删除预算 4 返回")
+        c = input("请选择: ").strip()
+        if c == '1':
+            print_budget_status(get_budget_status(user_id))
+        elif c == '2':
+            cats = get_user_categories(user_id, 'expense')
+            print("0. 全部支出")
+            for cat in cats:
+                print(f"{cat[0]}. {cat[1]}")
+            cid = input_int("请选择分类ID: ") or None
+            period = 'yearly' if input("周期 (1 每月 2 每年): ").strip() == '2' else 'monthly'
+            amt = input_float("预算金额: ")
+            ratio = input("提醒比例 (0-1，回车默认0.8): ").strip()
+            currency = input("币种 (回车默认 CNY，只统计该币种账户上的支出): ").strip() or None
+            budget_id = set_budget(user_id, amt, cid, period, float(ratio) if ratio else 0.8, currency)
+            if budget_id:
+                print(f"预算 {budget_id} 已设置")
+                show_budget_alerts(user_id)
+        elif c == '3':
+            bid = input_int("预算ID: ")
+            print("已删除" if delete_budget(user_id, bid) else "预算不存在")
+        elif c == '4':
+            break
+        else:
+            print("无效选择")
+
+
+def transfer_flow(current_user):
+    """账户间转账"""
+    user_id = current_user[0]
+    while True:
+        print("\n=== 转账 ===")
+        print("1 转账 2 查看转账 3 删除转账 4 返回")
+        c = input("请选择: ").strip()
+        if c == '1':
+            accounts = get_accounts(user_id)
+            if len(accounts) < 2:
+                print("至少需要两个账户才能转账！")
+                continue
+            for a in accounts:
+                print(f"{a[0]}. {a[1]} (余额 {a[3]:.2f})")
+            from_id = input_int("转出账户ID: ")
+            to_id = input_int("转入账户ID: ")
+            amt = input_float("金额: ")
+            d = input_date("日期")
+            desc = input("备注(可选): ").strip() or None
+            transfer_id = transfer(user_id, from_id, to_id, amt, d.strftime('%Y-%m-%d'), desc)
+            if transfer_id:
+                print(f"转账 {transfer_id} 成功")
+        elif c == '2':
+            rows = get_transfers(user_id)
+            if not rows:
+                print("暂无转账记录")
+            for r in rows:
+                print(f"{r[0]} | {r[1]} | {r[2]} -> {r[3]} | {r[4]:.2f} -> {r[5]:.2f} | {r[6] or ''}")
+        elif c == '3':
+            tid = input_int("转账ID: ")
+            if delete_transfer(user_id, tid):
+                print("删除成功")
+        elif c == '4':
+            break
+        else:
+            print("无效选择")
+
+
 def main():
+    setup_logging_from_env()
     init_db()
+    start_metrics_from_env()
+    # 启动时补生成所有到期的定期交易
+    materialize_due()
     current_user = None
     while True:
         if current_user is None:
@@ -391,7 +516,7 @@ def main():
                 print("无效选择")
         else:
             print("\n=== 主菜单 ===")
-            print("1 添加交易 2 查看交易 3 管理账户 4 查看统计 5 账户关联 6退出登录")
+            print("1 添加交易 2 查看交易 3 管理账户 4 查看统计 5 账户关联 6退出登录 7 定期交易 8 预算 9 转账")
             c = input("请选择: ").strip()
             if c == '1':
                 add_transaction_flow(current_user)
@@ -405,7 +530,8 @@ def main():
                     name = input("名称: ")
                     at = input("类型: ")
                     bal = input_float("初始余额: ")
-                    add_account(current_user[0], name, at, bal)
+                    cur = input("币种(回车默认CNY): ").strip().upper() or 'CNY'
+                    add_account(current_user[0], name, at, bal, cur)
                 elif ac == '2':
                     for a in get_accounts(current_user[0]):
                         print(f"{a[0]} | {a[1]} | {a[2]} | {a[3]}")
@@ -441,7 +567,7 @@ def main():
                     pass
             elif c == '4':
                 print("\n--- 统计 ---")
-                print("1 分类 2 月份 3 账户 4 汇总")
+                print("1 分类 2 月份 3 账户 4 汇总 5 预测 6 异常交易 7 收款方排行")
                 sc = input("请选择: ").strip()
                 if sc == '1':
                     s = input("开始: ")
@@ -462,10 +588,30 @@ def main():
                     e = input("结束: ")
                     for k, v in get_summary(current_user[0], s, e).items():
                         print(f"{k}: {v}")
+                elif sc == '5':
+                    t = 'income' if input("类型 (1 支出 2 收入): ").strip() == '2' else 'expense'
+                    m = 'linear' if input("方法 (1 指数平滑 2 线性趋势): ").strip() == '2' else 'exponential'
+                    get_forecast(current_user[0], t, input_int("预测月数: ") or 3, m)
+                elif sc == '6':
+                    flags = get_flags(current_user[0])
+                    print_flags(flags)
+                    if flags and input("全部标记为已复核? (y/n): ").strip().lower() == 'y':
+                        mark_reviewed(current_user[0])
+                elif sc == '7':
+                    s = input("开始(回车表示全部历史): ").strip() or None
+                    e = input("结束(回车表示至今): ").strip() or None
+                    by = 'count' if input("排序 (1 金额 2 笔数): ").strip() == '2' else 'amount'
+                    get_top_payees(current_user[0], s, e, by=by)
             elif c == '5':
                 account_sharing_flow(current_user)
             elif c == '6':
                 current_user = None
+            elif c == '7':
+                recurring_flow(current_user)
+            elif c == '8':
+                budget_flow(current_user)
+            elif c == '9':
+                transfer_flow(current_user)
             else:
                 print("无效选择")
 
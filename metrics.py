@@ -0,0 +1,281 @@
+# metrics.py
+"""
+Prometheus 文本格式的运行指标
+
+每个指标按线程分片累加：写入只修改当前线程自己的字典，不加锁；
+只有在输出 /metrics 时才把所有线程的分片汇总，因此对业务调用的开销可以忽略。
+
+开启 HTTP 端点：
+  1. 代码中调用 metrics.start_metrics_server(port=9108)
+  2. 环境变量 FINANCE_METRICS_PORT=9108（main.py 启动时读取）
+然后访问 http://127.0.0.1:9108/metrics
+"""
+import functools
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(labelnames, key, extra=None):
+    pairs = [f'{name}="{value}"' for name, value in zip(labelnames, key)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    """按线程分片存储数值的指标基类"""
+
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        self._children = {}
+        with _registry_lock:
+            _registry.append(self)
+
+    def _shard(self):
+        """当前线程的分片（首次使用时注册）"""
+        shard = getattr(self._local, 'values', None)
+        if shard is None:
+            shard = self._local.values = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+        return shard
+
+    def _all_shards(self):
+        with self._shards_lock:
+            return list(self._shards)
+
+    def labels(self, **labels):
+        """返回绑定了标签值的子指标，同一组标签总是返回同一对象"""
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"标签不匹配: 需要 {self.labelnames}，实际 {tuple(labels)}")
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children.setdefault(key, self._child_class(self, key))
+        return child
+
+    def reset(self):
+        for shard in self._all_shards():
+            shard.clear()
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} {self.type_name}']
+        lines.extend(self._render_samples())
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ('_metric', '_key')
+
+    def __init__(self, metric, key):
+        self._metric = metric
+        self._key = key
+
+    def inc(self, amount=1):
+        shard = self._metric._shard()
+        shard[self._key] = shard.get(self._key, 0) + amount
+
+
+class Counter(_Metric):
+    """单调递增计数器"""
+
+    type_name = 'counter'
+    _child_class = _CounterChild
+
+    def inc(self, amount=1, **labels):
+        self.labels(**labels).inc(amount)
+
+    def collect(self):
+        """汇总所有线程分片：{标签值元组: 数值}"""
+        totals = {}
+        for shard in self._all_shards():
+            for key, value in list(shard.items()):
+                totals[key] = totals.get(key, 0) + value
+        return totals
+
+    def _render_samples(self):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {value}'
+                for key, value in sorted(self.collect().items())]
+
+
+class _Timer:
+    """记录代码块耗时的上下文管理器"""
+
+    __slots__ = ('_child', '_start')
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._child.observe(time.perf_counter() - self._start)
+        return False
+
+
+class _HistogramChild:
+    __slots__ = ('_metric', '_key')
+
+    def __init__(self, metric, key):
+        self._metric = metric
+        self._key = key
+
+    def observe(self, value):
+        shard = self._metric._shard()
+        state = shard.get(self._key)
+        if state is None:
+            # 布局：[各桶计数..., 总次数, 总和]
+            state = shard[self._key] = [0] * (len(self._metric.buckets) + 2)
+        for i, bound in enumerate(self._metric.buckets):
+            if value <= bound:
+                state[i] += 1
+                break
+        state[-2] += 1
+        state[-1] += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class Histogram(_Metric):
+    """耗时等数值的分布直方图（单位：秒）"""
+
+    type_name = 'histogram'
+    _child_class = _HistogramChild
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        self.labels(**labels).observe(value)
+
+    def collect(self):
+        """汇总所有线程分片：{标签值元组: [各桶计数..., 总次数, 总和]}"""
+        totals = {}
+        for shard in self._all_shards():
+            for key, state in list(shard.items()):
+                merged = totals.get(key)
+                if merged is None:
+                    totals[key] = list(state)
+                else:
+                    for i, value in enumerate(state):
+                        merged[i] += value
+        return totals
+
+    def _render_samples(self):
+        lines = []
+        for key, state in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f'{self.name}_bucket{labels} {state[-2]}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {state[-2]}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {state[-1]}')
+        return lines
+
+
+# ---------------------------------------------------------------------------
+# 账本相关指标
+# ---------------------------------------------------------------------------
+TRANSACTION_OPS = Counter('finance_transaction_ops_total',
+                          '交易增删改次数', ('op', 'result'))
+TRANSACTION_OP_SECONDS = Histogram('finance_transaction_op_seconds',
+                                   '交易增删改耗时（秒）', ('op',))
+STATISTICS_CALLS = Counter('finance_statistics_calls_total',
+                           '统计方法调用次数', ('method', 'result'))
+STATISTICS_SECONDS = Histogram('finance_statistics_seconds',
+                               '统计方法耗时（秒）', ('method',))
+CACHE_REQUESTS = Counter('finance_cache_requests_total',
+                         '缓存查询次数', ('cache', 'result'))
+LOGIN_ATTEMPTS = Counter('finance_login_attempts_total',
+                         '登录尝试次数', ('result',))
+DB_CONNECTIONS = Counter('finance_db_connections_total',
+                         '打开的数据库连接数')
+
+
+def instrument(counter, histogram, **labels):
+    """
+    装饰器：记录函数调用次数与耗时
+    返回 False 的调用记为 result="rejected"，抛出异常记为 result="error"，其余为 "ok"
+    """
+    outcomes = {name: counter.labels(result=name, **labels) for name in ('ok', 'rejected', 'error')}
+    timer = histogram.labels(**labels)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            outcome = 'error'
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+                outcome = 'rejected' if result is False else 'ok'
+                return result
+            finally:
+                timer.observe(time.perf_counter() - start)
+                outcomes[outcome].inc()
+        return wrapper
+    return decorator
+
+
+def render_metrics():
+    """生成全部指标的 Prometheus 文本格式"""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = render_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 不在控制台输出访问日志
+        pass
+
+
+def start_metrics_server(port=9108, host='127.0.0.1'):
+    """在后台线程启动 /metrics 端点，返回 server 对象（调用 shutdown() 停止）"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    thread = threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    return server
+
+
+def start_from_env():
+    """根据环境变量 FINANCE_METRICS_PORT 启动指标端点，未设置时不做任何事"""
+    port = os.environ.get('FINANCE_METRICS_PORT')
+    if not port:
+        return None
+    return start_metrics_server(int(port), os.environ.get('FINANCE_METRICS_HOST', '127.0.0.1'))
@@ -2,6 +2,12 @@ import sqlite3
 import re
 from datetime import datetime, date
 from database import get_db_connection
+from metrics import instrument, STATISTICS_CALLS, STATISTICS_SECONDS
+from log_config import get_logger
+from archive import transactions_source, get_monthly_rollups
+from currency import BASE_CURRENCY, convert_grouped
+from forecast import forecast_all, METHODS as FORECAST_METHODS
+from payees import top_payees
 from typing import List, Dict, Tuple, Optional, Union
 import textwrap
 import os
@@ -10,6 +16,8 @@ import os
 StatResult = List[Dict[str, Union[str, float, int]]]
 SummaryResult = Dict[str, float]
 
+logger = get_logger(__name__)
+
 
 class StatisticsVisualizer:
     """统计结果可视化类"""
@@ -116,6 +124,41 @@ class StatisticsVisualizer:
             print(f"  💸 支出: {data['expense']:>10.2f}")
             print(f"  ⚖️  结余: {balance:>10.2f} {'✅' if balance >= 0 else '❌'}")
 
+    @staticmethod
+    def print_forecast(results: StatResult, title: str = "支出预测"):
+        """打印分类预测结果"""
+        if not results:
+            print("📊 暂无足够的历史数据进行预测")
+            return
+
+        print(f"\n{'='*70}")
+        print(f"🔮 {title}")
+        print(f"{'='*70}")
+        months = [month for month, _ in results[0]['forecast']]
+        print(f"\n{'分类':<12} {'移动平均':>10} {'趋势/月':>9} " + ' '.join(f"{m:>10}" for m in months))
+        print("-" * (34 + 11 * len(months)))
+        for item in results:
+            trend_emoji = "📈" if item['trend'] > 0 else "📉" if item['trend'] < 0 else "➖"
+            print(f"{item['category']:<12} {item['moving_average']:>10.2f} {trend_emoji}{item['trend']:>+7.2f} "
+                  + ' '.join(f"{amount:>10.2f}" for _, amount in item['forecast']))
+
+    @staticmethod
+    def print_top_payees(results: StatResult, title: str = "收款方排行"):
+        """打印收款方排行"""
+        if not results:
+            print("📊 暂无收款方数据")
+            return
+
+        print(f"\n{'='*60}")
+        print(f"🏪 {title}")
+        print(f"{'='*60}")
+        top = max((item['total_amount'] or 0) for item in results) or 1
+        for rank, item in enumerate(results, 1):
+            approx = '' if item['exact'] else f" (±{item['error']})"
+            bar = "█" * int((item['total_amount'] or 0) / top * 20)
+            print(f"  {rank:>2}. {item['payee'][:16]:<16} {item['total_amount']:>10.2f} "
+                  f"{item['transaction_count']:>5}笔{approx} {bar}")
+
     @staticmethod
     def print_summary(summary: SummaryResult):
         """打印财务汇总结果"""
@@ -152,11 +195,15 @@ class StatisticsVisualizer:
 class StatisticsManager:
     """财务统计管理器，封装各类统计方法"""
     
-    def __init__(self, user_id: int):
-        """初始化统计管理器，绑定用户ID"""
+    def __init__(self, user_id: int, reporting_currency: Optional[str] = None):
+        """
+        初始化统计管理器，绑定用户ID
+        :param reporting_currency: 报告币种，各账户的金额按交易日汇率折算到该币种（默认本位币）
+        """
         if not isinstance(user_id, int) or user_id <= 0:
             raise ValueError("用户ID必须是正整数")
         self.user_id = user_id
+        self.reporting_currency = (reporting_currency or BASE_CURRENCY).upper()
         self.conn = None
         self.cursor = None
         self.visualizer = StatisticsVisualizer()
@@ -235,6 +282,16 @@ class StatisticsManager:
         except Exception as e:
             raise ValueError(f"结果格式化失败: {str(e)}")
 
+    def _converted_totals(self, query: str, params: tuple) -> Dict[tuple, float]:
+        """
+        执行按 (分组键..., 币种, 折算日期, 金额) 汇总的查询，并折算到报告币种
+        与报告币种相同的账户折算日期为 NULL，SQL 中直接合并为一组，不需要逐日折算
+        :return: {分组键元组: 折算后的金额}
+        """
+        self.cursor.execute(query, (self.reporting_currency,) + params)
+        rows = [(row[:-3], row[-3], row[-2], row[-1]) for row in self.cursor.fetchall()]
+        return convert_grouped(rows, self.reporting_currency)
+
     def _check_user_exists(self) -> bool:
         """检查用户是否存在"""
         try:
@@ -244,6 +301,7 @@ class StatisticsManager:
             # 如果users表不存在，假设用户有效（向后兼容）
             return True
 
+    @instrument(STATISTICS_CALLS, STATISTICS_SECONDS, method='get_by_category')
     def get_by_category(self, start_date: str, end_date: str, display: bool = True) -> StatResult:
         """
         按分类统计收支
@@ -266,22 +324,29 @@ class StatisticsManager:
             if end_date > today:
                 print(f"📅 已将结束日期从 {end_date} 调整为 {actual_end_date}")
 
-            query = '''
+            source = transactions_source(self.cursor, start_date, actual_end_date)
+            query = f'''
             SELECT 
                 c.name as category, 
                 t.type as transaction_type, 
+                a.currency,
+                CASE WHEN a.currency = ? THEN NULL ELSE t.date END as rate_date,
                 COALESCE(SUM(t.amount), 0) as total_amount
-            FROM transactions t
+            FROM {source} t
             JOIN categories c ON t.category_id = c.id
+            JOIN accounts a ON t.account_id = a.id
             WHERE 
                 t.user_id = ? 
                 AND t.date BETWEEN ? AND ?
-            GROUP BY category, transaction_type
-            HAVING total_amount > 0  -- 只显示有交易的分类
-            ORDER BY total_amount DESC
+                AND t.transfer_id IS NULL  -- 转账不计入收支
+            GROUP BY category, transaction_type, a.currency, rate_date
             '''
-            self.cursor.execute(query, (self.user_id, start_date, actual_end_date))
-            results = self._get_formatted_results(self.cursor)
+            totals = self._converted_totals(query, (self.user_id, start_date, actual_end_date))
+            # 只显示有交易的分类，按折算后的金额降序
+            results = sorted(({'category': category, 'transaction_type': transaction_type,
+                               'total_amount': round(total, 2)}
+                              for (category, transaction_type), total in totals.items() if total > 0),
+                             key=lambda r: r['total_amount'], reverse=True)
             
             if display:
                 if not results:
@@ -298,9 +363,10 @@ class StatisticsManager:
         except Exception as e:
             raise ValueError(f"按分类统计时发生未知错误: {str(e)}")
 
+    @instrument(STATISTICS_CALLS, STATISTICS_SECONDS, method='get_by_month')
     def get_by_month(self, target_year: int, display: bool = True) -> StatResult:
         """
-        按月份统计指定年份的收支
+        按月份统计指定年份的收支（各账户金额按交易日汇率折算到报告币种）
         :param target_year: 目标年份 (如2024)
         :param display: 是否显示可视化结果
         :return: 按月份统计的结果
@@ -317,16 +383,29 @@ class StatisticsManager:
                 strftime('%m', t.date) as month,
                 strftime('%Y-%m', t.date) as month_year,  -- 更友好的月份格式
                 t.type as transaction_type,
+                a.currency,
+                CASE WHEN a.currency = ? THEN NULL ELSE t.date END as rate_date,
                 COALESCE(SUM(t.amount), 0) as total_amount
             FROM transactions t
+            JOIN accounts a ON t.account_id = a.id
             WHERE 
                 t.user_id = ? 
                 AND strftime('%Y', t.date) = ?
-            GROUP BY month, transaction_type
-            ORDER BY month, transaction_type
+                AND t.transfer_id IS NULL  -- 转账不计入收支
+            GROUP BY month, transaction_type, a.currency, rate_date
             '''
-            self.cursor.execute(query, (self.user_id, str(target_year)))
-            results = self._get_formatted_results(self.cursor)
+            totals = self._converted_totals(query, (self.user_id, str(target_year)))
+            
+            # 已归档年份不打开归档文件，直接合并归档时保存的按月汇总
+            rollups = get_monthly_rollups(self.cursor, self.user_id, target_year, self.reporting_currency)
+            if rollups:
+                archived = convert_grouped([(row[:3], row[3], row[4], row[5]) for row in rollups],
+                                           self.reporting_currency)
+                for key, total in archived.items():
+                    totals[key] = totals.get(key, 0) + total
+            results = [{'month': month, 'month_year': month_year, 'transaction_type': transaction_type,
+                        'total_amount': round(total, 2)}
+                       for (month, month_year, transaction_type), total in sorted(totals.items())]
             
             if display:
                 if not results:
@@ -343,6 +422,7 @@ class StatisticsManager:
         except Exception as e:
             raise ValueError(f"按月份统计时发生未知错误: {str(e)}")
 
+    @instrument(STATISTICS_CALLS, STATISTICS_SECONDS, method='get_by_account')
     def get_by_account(self, start_date: str, end_date: str, display: bool = True) -> StatResult:
         """
         按账户统计收支
@@ -365,22 +445,28 @@ class StatisticsManager:
             if end_date > today:
                 print(f"📅 已将结束日期从 {end_date} 调整为 {actual_end_date}")
 
-            query = '''
+            source = transactions_source(self.cursor, start_date, actual_end_date)
+            query = f'''
             SELECT 
                 a.name as account,
                 t.type as transaction_type,
+                a.currency,
+                CASE WHEN a.currency = ? THEN NULL ELSE t.date END as rate_date,
                 COALESCE(SUM(t.amount), 0) as total_amount
-            FROM transactions t
+            FROM {source} t
             JOIN accounts a ON t.account_id = a.id
             WHERE 
                 t.user_id = ? 
                 AND t.date BETWEEN ? AND ?
-            GROUP BY account, transaction_type
-            HAVING total_amount > 0  -- 只显示有交易的账户
-            ORDER BY total_amount DESC
+                AND t.transfer_id IS NULL  -- 转账不计入收支
+            GROUP BY account, transaction_type, a.currency, rate_date
             '''
-            self.cursor.execute(query, (self.user_id, start_date, actual_end_date))
-            results = self._get_formatted_results(self.cursor)
+            totals = self._converted_totals(query, (self.user_id, start_date, actual_end_date))
+            # 只显示有交易的账户，按折算后的金额降序
+            results = sorted(({'account': account, 'transaction_type': transaction_type,
+                               'total_amount': round(total, 2)}
+                              for (account, transaction_type), total in totals.items() if total > 0),
+                             key=lambda r: r['total_amount'], reverse=True)
             
             if display:
                 if not results:
@@ -397,6 +483,7 @@ class StatisticsManager:
         except Exception as e:
             raise ValueError(f"按账户统计时发生未知错误: {str(e)}")
 
+    @instrument(STATISTICS_CALLS, STATISTICS_SECONDS, method='get_financial_summary')
     def get_financial_summary(self, start_date: str, end_date: str, display: bool = True) -> SummaryResult:
         """
         获取指定日期范围内的财务汇总
@@ -419,19 +506,19 @@ class StatisticsManager:
             if end_date > today:
                 print(f"📅 已将结束日期从 {end_date} 调整为 {actual_end_date}")
 
-            # 总收入
-            self.cursor.execute('''
-            SELECT COALESCE(SUM(amount), 0) FROM transactions 
-            WHERE user_id = ? AND type = 'income' AND date BETWEEN ? AND ?
-            ''', (self.user_id, start_date, actual_end_date))
-            total_income = round(self.cursor.fetchone()[0], 2)
+            source = transactions_source(self.cursor, start_date, actual_end_date)
             
-            # 总支出
-            self.cursor.execute('''
-            SELECT COALESCE(SUM(amount), 0) FROM transactions 
-            WHERE user_id = ? AND type = 'expense' AND date BETWEEN ? AND ?
+            # 总收入与总支出（按账户币种和交易日期折算到报告币种）
+            totals = self._converted_totals(f'''
+            SELECT t.type, a.currency, CASE WHEN a.currency = ? THEN NULL ELSE t.date END as rate_date,
+                   SUM(t.amount)
+            FROM {source} t
+            JOIN accounts a ON t.account_id = a.id
+            WHERE t.user_id = ? AND t.date BETWEEN ? AND ? AND t.transfer_id IS NULL
+            GROUP BY t.type, a.currency, rate_date
             ''', (self.user_id, start_date, actual_end_date))
-            total_expense = round(self.cursor.fetchone()[0], 2)
+            total_income = round(totals.get(('income',), 0), 2)
+            total_expense = round(totals.get(('expense',), 0), 2)
             
             # 计算储蓄率（避免除零错误）
             saving_rate = 0.0
@@ -444,6 +531,7 @@ class StatisticsManager:
                 "balance": round(total_income - total_expense, 2),
                 "saving_rate": saving_rate,
                 "period": f"{start_date} 至 {actual_end_date}",
+                "currency": self.reporting_currency,
                 "user_id": self.user_id
             }
             
@@ -469,36 +557,155 @@ class StatisticsManager:
         except Exception as e:
             raise ValueError(f"财务汇总统计时发生未知错误: {str(e)}")
 
+    @instrument(STATISTICS_CALLS, STATISTICS_SECONDS, method='get_forecast')
+    def get_forecast(self, transaction_type: str = 'expense', horizon: int = 3, method: str = 'exponential',
+                     window: int = 3, display: bool = True) -> StatResult:
+        """
+        按分类预测未来几个月的收支（跨年份的月度序列，含已归档年份）
+        :param transaction_type: 'income' 或 'expense'
+        :param horizon: 预测未来几个月
+        :param method: 'linear'（线性趋势）或 'exponential'（指数平滑）
+        :param window: 移动平均窗口（月）
+        :param display: 是否显示可视化结果
+        :return: 每个分类的移动平均、趋势、季节指数和预测值，按预测的下月金额降序
+        """
+        try:
+            if transaction_type not in ('income', 'expense'):
+                raise ValueError("交易类型必须是 income 或 expense")
+            if method not in FORECAST_METHODS:
+                raise ValueError(f"预测方法必须是 {' 或 '.join(FORECAST_METHODS)}")
+            if not isinstance(horizon, int) or not 1 <= horizon <= 24:
+                raise ValueError("预测月数必须在 1 到 24 之间")
+
+            if not self._check_user_exists():
+                raise ValueError(f"用户ID {self.user_id} 不存在")
+
+            forecasts = forecast_all(self.user_id, transaction_type, horizon, method, window, cursor=self.cursor,
+                                     reporting_currency=self.reporting_currency)
+            self.cursor.execute('SELECT id, name FROM categories')
+            names = dict(self.cursor.fetchall())
+            results = [{
+                'category': names.get(category_id, str(category_id)),
+                'transaction_type': transaction_type,
+                'start_month': item['start_month'],
+                'history': item['history'],
+                'moving_average': item['moving_average'],
+                'trend': item['trend'],
+                'seasonality': item['seasonality'],
+                'forecast': item['forecast'],
+            } for (_, category_id), item in forecasts.items()]
+            results.sort(key=lambda r: r['forecast'][0][1], reverse=True)
+
+            if display:
+                title = "收入预测" if transaction_type == 'income' else "支出预测"
+                self.visualizer.print_forecast(results, f"{title} (未来 {horizon} 个月)")
+
+            return results
+
+        except sqlite3.Error as e:
+            raise ValueError(f"收支预测失败: {str(e)}")
+        except ValueError as e:
+            raise e
+        except Exception as e:
+            raise ValueError(f"收支预测时发生未知错误: {str(e)}")
+
+    @instrument(STATISTICS_CALLS, STATISTICS_SECONDS, method='get_top_payees')
+    def get_top_payees(self, start_date: Optional[str] = None, end_date: Optional[str] = None, n: int = 10,
+                       by: str = 'amount', transaction_type: str = 'expense', mode: str = 'auto',
+                       display: bool = True) -> StatResult:
+        """
+        按收款方（规范化后的备注）排行
+        :param start_date: 开始日期 (YYYY-MM-DD)，为空表示不限
+        :param end_date: 结束日期 (YYYY-MM-DD)，为空表示不限
+        :param n: 返回前几名
+        :param by: 'amount' 按金额，'count' 按笔数
+        :param transaction_type: 'income' 或 'expense'
+        :param mode: 'exact' 精确，'approximate' 近似（Space-Saving），'auto' 日期范围一年以内精确、否则近似
+        :param display: 是否显示可视化结果
+        :return: [{'payee', 'total_amount', 'transaction_count', 'error', 'exact'}]，金额为报告币种
+        """
+        try:
+            if start_date and end_date:
+                self._validate_date_range(start_date, end_date)
+            elif (start_date and not self._validate_date_format(start_date)) or \
+                    (end_date and not self._validate_date_format(end_date)):
+                raise ValueError("日期格式无效，请使用 YYYY-MM-DD 格式")
+            if transaction_type not in ('income', 'expense'):
+                raise ValueError("交易类型必须是 income 或 expense")
+            if not isinstance(n, int) or n <= 0:
+                raise ValueError("排行数量必须是正整数")
+
+            if not self._check_user_exists():
+                raise ValueError(f"用户ID {self.user_id} 不存在")
+
+            results = top_payees(self.cursor, self.user_id, start_date, end_date, n, by,
+                                 transaction_type, mode, reporting_currency=self.reporting_currency)
+
+            if display:
+                period = f"{start_date or '最早'} 至 {end_date or '今天'}"
+                self.visualizer.print_top_payees(results, f"收款方排行 ({period})")
+
+            return results
+
+        except sqlite3.Error as e:
+            raise ValueError(f"收款方排行统计失败: {str(e)}")
+        except ValueError as e:
+            raise e
+        except Exception as e:
+            raise ValueError(f"收款方排行统计时发生未知错误: {str(e)}")
+
 
 # 便捷函数：外部调用接口
-def get_category_stats(user_id: int, start_date: str, end_date: str, display: bool = True) -> StatResult:
+def get_category_stats(user_id: int, start_date: str, end_date: str, display: bool = True,
+                       reporting_currency: Optional[str] = None) -> StatResult:
     """按分类统计的便捷接口"""
-    print(f"📊 正在获取用户 {user_id} 的分类统计...")
-    with StatisticsManager(user_id) as manager:
+    logger.debug('正在获取用户 %s 的分类统计', user_id)
+    with StatisticsManager(user_id, reporting_currency) as manager:
         return manager.get_by_category(start_date, end_date, display)
 
 
-def get_monthly_stats(user_id: int, year: int, display: bool = True) -> StatResult:
+def get_monthly_stats(user_id: int, year: int, display: bool = True,
+                      reporting_currency: Optional[str] = None) -> StatResult:
     """按月份统计的便捷接口"""
-    print(f"📊 正在获取用户 {user_id} 的 {year} 年月度统计...")
-    with StatisticsManager(user_id) as manager:
+    logger.debug('正在获取用户 %s 的 %s 年月度统计', user_id, year)
+    with StatisticsManager(user_id, reporting_currency) as manager:
         return manager.get_by_month(year, display)
 
 
-def get_account_stats(user_id: int, start_date: str, end_date: str, display: bool = True) -> StatResult:
+def get_account_stats(user_id: int, start_date: str, end_date: str, display: bool = True,
+                      reporting_currency: Optional[str] = None) -> StatResult:
     """按账户统计的便捷接口"""
-    print(f"📊 正在获取用户 {user_id} 的账户统计...")
-    with StatisticsManager(user_id) as manager:
+    logger.debug('正在获取用户 %s 的账户统计', user_id)
+    with StatisticsManager(user_id, reporting_currency) as manager:
         return manager.get_by_account(start_date, end_date, display)
 
 
-def get_summary(user_id: int, start_date: str, end_date: str, display: bool = True) -> SummaryResult:
+def get_summary(user_id: int, start_date: str, end_date: str, display: bool = True,
+                reporting_currency: Optional[str] = None) -> SummaryResult:
     """获取财务汇总的便捷接口"""
-    print(f"📊 正在获取用户 {user_id} 的财务汇总...")
-    with StatisticsManager(user_id) as manager:
+    logger.debug('正在获取用户 %s 的财务汇总', user_id)
+    with StatisticsManager(user_id, reporting_currency) as manager:
         return manager.get_financial_summary(start_date, end_date, display)
 
 
+def get_forecast(user_id: int, transaction_type: str = 'expense', horizon: int = 3,
+                 method: str = 'exponential', display: bool = True,
+                 reporting_currency: Optional[str] = None) -> StatResult:
+    """分类收支预测的便捷接口"""
+    logger.debug('正在获取用户 %s 的%s预测', user_id, transaction_type)
+    with StatisticsManager(user_id, reporting_currency) as manager:
+        return manager.get_forecast(transaction_type, horizon, method, display=display)
+
+
+def get_top_payees(user_id: int, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                   n: int = 10, by: str = 'amount', mode: str = 'auto', display: bool = True,
+                   reporting_currency: Optional[str] = None) -> StatResult:
+    """收款方排行的便捷接口"""
+    logger.debug('正在获取用户 %s 的收款方排行', user_id)
+    with StatisticsManager(user_id, reporting_currency) as manager:
+        return manager.get_top_payees(start_date, end_date, n, by, mode=mode, display=display)
+
+
 # 使用示例和文档
 def print_usage_examples():
     """打印使用示例"""
@@ -520,6 +727,12 @@ def print_usage_examples():
 5. 只看可视化 (不返回数据):
    get_category_stats(1, "2024-01-01", "2024-12-31")
 
+6. 未来 3 个月的支出预测:
+   forecast = get_forecast(1, "expense", horizon=3)
+
+7. 全部历史中花钱最多的 10 个收款方 (近似):
+   top = get_top_payees(1, n=10)
+
 注意:
 - 日期格式必须为 YYYY-MM-DD
 - 用户ID必须是正整数
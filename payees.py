@@ -0,0 +1,170 @@
+# payees.py
+"""
+收款方排行（钱花到了哪里）
+
+收款方取交易备注去掉首尾空格、转为小写后的结果。transactions.payee 是按该规则生成的虚拟列
+（见 database.init_db），并建有 (user_id, payee) 索引，不占额外存储，写入路径也无需改动。
+
+两种模式：
+- exact：GROUP BY 精确汇总，适合较短的日期范围
+- approximate：流式读取交易，用 Space-Saving 草图只保留 capacity 个计数器，
+  内存与不同收款方的数量无关，适合跨多个归档年份的全部历史；
+  每个结果附带误差上界，真实值在 [估计值 - 误差, 估计值] 之间，排在前面的收款方结果通常是精确的
+
+两种模式都按交易所在账户的币种分组，用 currency.convert_grouped 按交易日汇率折算到报告币种后再排行。
+"""
+import heapq
+from datetime import datetime
+from archive import transactions_source
+from currency import BASE_CURRENCY, convert_grouped
+
+PAYEE_EXPRESSION = 'lower(trim(description))'
+EXACT_RANGE_DAYS = 366         # auto 模式下不超过该天数的日期范围使用精确汇总
+RANKINGS = ('amount', 'count')
+MODES = ('auto', 'exact', 'approximate')
+
+
+def normalize_payee(description):
+    """与 transactions.payee 相同的规范化（SQLite 的 lower 只转换 ASCII 字母）"""
+    if not description:
+        return ''
+    return ''.join(ch.lower() if ch.isascii() else ch for ch in description.strip(' '))
+
+
+class SpaceSaving:
+    """
+    带权 Space-Saving 草图：最多保留 capacity 个计数器
+    新项目在计数器已满时替换当前最小的计数器，并把被替换的计数记为误差上界
+    """
+
+    def __init__(self, capacity=1000):
+        self.capacity = capacity
+        self.counters = {}          # 项目 -> [估计值, 误差上界, 次数, 附加值合计]
+        self._heap = []             # (估计值, 项目)，惰性删除过期条目
+
+    def update(self, item, weight=1.0, extra=0.0):
+        """
+        :param weight: 计入估计值的权重
+        :param extra: 与估计值无关、随计数器一起累加的值（计数器被替换后从 0 重新累加）
+        """
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += weight
+            counter[2] += 1
+            counter[3] += extra
+            heapq.heappush(self._heap, (counter[0], item))
+            # 过期条目太多时重建堆，保持堆大小与计数器数量同级
+            if len(self._heap) > 4 * self.capacity:
+                self._heap = [(value[0], key) for key, value in self.counters.items()]
+                heapq.heapify(self._heap)
+            return
+        if len(self.counters) < self.capacity:
+            self.counters[item] = [weight, 0.0, 1, extra]
+            heapq.heappush(self._heap, (weight, item))
+            return
+        while True:
+            value, victim = heapq.heappop(self._heap)
+            current = self.counters.get(victim)
+            if current is not None and current[0] == value:
+                break
+        del self.counters[victim]
+        self.counters[item] = [value + weight, value, 1, extra]
+        heapq.heappush(self._heap, (value + weight, item))
+
+    def top(self, n):
+        """估计值最大的 n 个项目 [(项目, 估计值, 误差上界, 次数, 附加值合计)]"""
+        ranked = heapq.nlargest(n, self.counters.items(), key=lambda entry: entry[1][0])
+        return [(item, *counter) for item, counter in ranked]
+
+
+def _range_days(start_date, end_date):
+    if not start_date or not end_date:
+        return None
+    return (datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days
+
+
+def top_payees(cursor, user_id, start_date=None, end_date=None, n=10, by='amount', type='expense',
+               mode='auto', capacity=None, chunk_size=5000, reporting_currency=BASE_CURRENCY):
+    """
+    按收款方排行
+    :param cursor: 数据库游标（不能处于事务中，日期范围涉及已归档年份时需要 ATTACH 归档文件）
+    :param by: 'amount' 按金额合计排序，'count' 按笔数排序
+    :param mode: 'exact'、'approximate' 或 'auto'（日期范围不超过 EXACT_RANGE_DAYS 天时精确，否则近似）
+    :param capacity: 近似模式的计数器数量（默认 max(50 * n, 1000)）
+    :param reporting_currency: 报告币种，金额按交易日汇率折算到该币种
+    :return: [{'payee', 'total_amount', 'transaction_count', 'error', 'exact'}]，按排序依据降序
+    """
+    if by not in RANKINGS:
+        raise ValueError(f"排序依据必须是 {' 或 '.join(RANKINGS)}")
+    if mode not in MODES:
+        raise ValueError(f"模式必须是 {', '.join(MODES)} 之一")
+    if mode == 'auto':
+        days = _range_days(start_date, end_date)
+        mode = 'exact' if days is not None and days <= EXACT_RANGE_DAYS else 'approximate'
+
+    source = transactions_source(cursor, start_date, end_date)
+    # 归档分区没有虚拟列，合并归档时按相同规则现场计算
+    payee = 't.payee' if source == 'transactions' else PAYEE_EXPRESSION.replace('description', 't.description')
+    where = f"t.user_id = ? AND t.type = ? AND t.transfer_id IS NULL AND {payee} != ''"
+    # 第一个参数是 SELECT 中的报告币种：与其相同的币种折算日期为 NULL，不需要逐日折算
+    params = [reporting_currency, user_id, type]
+    if start_date:
+        where += ' AND t.date >= ?'
+        params.append(start_date)
+    if end_date:
+        where += ' AND t.date <= ?'
+        params.append(end_date)
+
+    rate_date = 'CASE WHEN a.currency = ? THEN NULL ELSE t.date END'
+
+    if mode == 'exact':
+        cursor.execute(f'''
+            SELECT {payee} AS payee, a.currency, {rate_date} AS rate_date,
+                   SUM(t.amount) AS total_amount, COUNT(*) AS transaction_count
+            FROM {source} t
+            JOIN accounts a ON t.account_id = a.id
+            WHERE {where}
+            GROUP BY {payee}, a.currency, rate_date
+        ''', params)
+        groups = cursor.fetchall()
+        totals = convert_grouped([(name, currency, on_date, total) for name, currency, on_date, total, _ in groups],
+                                 reporting_currency)
+        counts = {}
+        for name, _, _, _, count in groups:
+            counts[name] = counts.get(name, 0) + count
+        ranking = totals if by == 'amount' else counts
+        top = sorted(ranking, key=ranking.get, reverse=True)[:n]
+        return [{'payee': name, 'total_amount': round(totals[name], 2), 'transaction_count': counts[name],
+                 'error': 0, 'exact': True} for name in top]
+
+    sketch = SpaceSaving(capacity or max(50 * n, 1000))
+    cursor.execute(f'''
+        SELECT {payee}, a.currency, {rate_date}, t.amount
+        FROM {source} t
+        JOIN accounts a ON t.account_id = a.id
+        WHERE {where}
+    ''', params)
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        # 每块按行号折算一次，同一币种的汇率序列只取一次
+        converted = convert_grouped([(index, currency, on_date, amount)
+                                     for index, (_, currency, on_date, amount) in enumerate(rows)],
+                                    reporting_currency)
+        for index, (name, _, _, _) in enumerate(rows):
+            amount = converted[index]
+            if by == 'amount':
+                sketch.update(name, amount)
+            else:
+                sketch.update(name, 1, amount)
+    results = []
+    # 排序依据为估计值；另一项只统计进入草图之后的部分（误差为 0 时与精确值相同）
+    for name, value, error, count, amount in sketch.top(n):
+        if by == 'amount':
+            results.append({'payee': name, 'total_amount': round(value, 2), 'transaction_count': count,
+                            'error': round(error, 2), 'exact': error == 0})
+        else:
+            results.append({'payee': name, 'total_amount': round(amount, 2), 'transaction_count': int(value),
+                            'error': int(error), 'exact': error == 0})
+    return results
@@ -0,0 +1,117 @@
+# query_builder.py
+"""
+交易查询条件与更新语句的构建
+
+- 筛选条件只接受 TRANSACTION_FILTERS 中的字段，值一律作为参数绑定，不拼接到 SQL 中
+- UPDATE 语句只允许白名单中的列，字典中出现其他键时抛出 ValueError
+- 相同“形状”（基础查询 + 出现的筛选字段 + 排序）编译出的 SQL 文本由 lru_cache 缓存，
+  每次得到同一个字符串对象；在同一个连接上重复执行时直接命中 sqlite3 的预编译语句缓存
+
+用法：
+    sql, params = compile_query(BASE_SQL, filters, order_by='t.date DESC')
+    cursor.execute(sql, base_params + params)
+"""
+from functools import lru_cache
+
+# 用户可访问的交易：自己写入的交易，以及自己的账户和被共享账户上的交易（账户取消共享后，
+# 用户在该账户上写入的交易仍然可见）。参数为 [user_id, user_id]；两个条件各走一个索引
+# （idx_transactions_account / idx_transactions_user_payee），由 SQLite 合并为 MULTI-INDEX OR
+ACCESSIBLE_CONDITION = ('(t.account_id IN (SELECT account_id FROM user_accessible_accounts WHERE user_id = ?)'
+                        ' OR t.user_id = ?)')
+
+
+def _like_pattern(text):
+    escaped = text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+# 筛选字段 -> (条件, 参数转换)；字段按此顺序出现在 SQL 中，保证同一组字段得到同一形状
+TRANSACTION_FILTERS = {
+    'type': ('t.type = ?', None),
+    'category_id': ('t.category_id = ?', None),
+    'account_id': ('t.account_id = ?', None),
+    'start_date': ('t.date >= ?', None),
+    'end_date': ('t.date <= ?', None),
+    'min_amount': ('t.amount >= ?', None),
+    'max_amount': ('t.amount <= ?', None),
+    'text': ("t.description LIKE ? ESCAPE '\\'", _like_pattern),
+}
+
+# 允许通过 UPDATE 修改的列
+EDITABLE_COLUMNS = {
+    'transactions': ('account_id', 'type', 'amount', 'category_id', 'date', 'description'),
+    'accounts': ('name', 'type', 'balance', 'currency'),
+}
+
+
+def _present_filters(filters, allowed=None):
+    """按固定顺序返回出现且非空的筛选字段，遇到未知字段时抛出 ValueError"""
+    if not filters:
+        return ()
+    allowed = allowed or TRANSACTION_FILTERS
+    unknown = [key for key in filters if key not in allowed]
+    if unknown:
+        raise ValueError(f"不支持的筛选条件: {', '.join(map(str, unknown))}")
+    return tuple(key for key in allowed if filters.get(key) not in (None, ''))
+
+
+@lru_cache(maxsize=256)
+def _compile(base_sql, keys, order_by, limit):
+    sql = base_sql
+    for key in keys:
+        sql += f' AND {TRANSACTION_FILTERS[key][0]}'
+    if order_by:
+        sql += f' ORDER BY {order_by}'
+    if limit:
+        sql += ' LIMIT ?'
+    return sql
+
+
+def filter_params(filters, keys):
+    params = []
+    for key in keys:
+        transform = TRANSACTION_FILTERS[key][1]
+        params.append(transform(filters[key]) if transform else filters[key])
+    return params
+
+
+def compile_query(base_sql, filters=None, order_by=None, limit=None):
+    """
+    在基础查询（以 WHERE 子句结尾）后追加筛选条件、排序和 LIMIT
+    :param base_sql: 基础查询，筛选条件以 AND 接在其后
+    :param filters: 筛选字段字典，键见 TRANSACTION_FILTERS，值为 None 或空字符串的字段忽略
+    :param order_by: 排序子句（由调用方给出的常量，不能来自用户输入）
+    :param limit: 最多返回行数
+    :return: (sql, 筛选参数列表)，limit 不为空时参数列表末尾包含 limit
+    """
+    keys = _present_filters(filters)
+    sql = _compile(base_sql, keys, order_by, limit is not None)
+    params = filter_params(filters, keys)
+    if limit is not None:
+        params.append(limit)
+    return sql, params
+
+
+@lru_cache(maxsize=64)
+def _compile_update(table, columns, extra_set, where):
+    assignments = [f'{column} = ?' for column in columns]
+    if extra_set:
+        assignments.append(extra_set)
+    return f'UPDATE {table} SET {", ".join(assignments)} WHERE {where}'
+
+
+def compile_update(table, updates, where, extra_set=None):
+    """
+    生成只包含白名单列的 UPDATE 语句
+    :param table: 表名（须在 EDITABLE_COLUMNS 中）
+    :param updates: {列名: 新值}
+    :param where: WHERE 子句（调用方给出的常量，参数另行追加）
+    :param extra_set: 额外的赋值子句，例如 "fingerprint = ?"
+    :return: (sql, 赋值参数列表)，列按白名单顺序排列
+    """
+    allowed = EDITABLE_COLUMNS[table]
+    unknown = [key for key in updates if key not in allowed]
+    if unknown:
+        raise ValueError(f"不允许修改的字段: {', '.join(map(str, unknown))}")
+    columns = tuple(column for column in allowed if column in updates)
+    return _compile_update(table, columns, extra_set, where), [updates[column] for column in columns]
@@ -0,0 +1,342 @@
+# query_profiler.py
+"""
+SQL 查询耗时统计与慢查询记录
+
+开启后 database.get_db_connection() 返回的连接会被包装，记录每条 SQL 语句的：
+  - 调用次数、总耗时、最大耗时、耗时直方图
+  - 返回行数
+超过慢查询阈值的语句会连同 EXPLAIN QUERY PLAN 一起写入日志。
+
+开启方式：
+  1. 代码中调用 query_profiler.enable(slow_ms=50)
+  2. 环境变量 FINANCE_SQL_PROFILE=1（可选 FINANCE_SQL_SLOW_MS、FINANCE_SQL_PROFILE_OUT）
+
+命令行报告：
+  python query_profiler.py report profile.json     # 打印已保存的快照
+  python query_profiler.py bench --transactions 20000   # 运行基准测试并打印报告
+"""
+import argparse
+import atexit
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+
+from log_config import get_logger
+
+logger = get_logger('sql')
+
+# 耗时直方图的桶上限（毫秒），最后一个桶收纳所有更慢的语句
+HISTOGRAM_BUCKETS_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, float('inf'))
+
+# 不对这些语句执行 EXPLAIN QUERY PLAN
+_NO_EXPLAIN_PREFIXES = ('EXPLAIN', 'PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT',
+                        'RELEASE', 'CREATE', 'DROP', 'ALTER', 'ATTACH', 'DETACH', 'VACUUM', 'ANALYZE')
+
+_enabled = False
+_slow_ms = 100.0
+_lock = threading.Lock()
+_stats = {}
+_slow_queries = []
+_MAX_SLOW_QUERIES = 200
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """压缩空白，得到用于聚合统计的语句键"""
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+class StatementStats:
+    """单条（归一化后的）SQL 语句的统计信息"""
+
+    __slots__ = ('sql', 'calls', 'total_ms', 'max_ms', 'rows', 'histogram')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.histogram = [0] * len(HISTOGRAM_BUCKETS_MS)
+
+    def record_call(self, elapsed_ms):
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        if elapsed_ms > self.max_ms:
+            self.max_ms = elapsed_ms
+        for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.histogram[i] += 1
+                break
+
+    def as_dict(self):
+        return {
+            'sql': self.sql,
+            'calls': self.calls,
+            'total_ms': round(self.total_ms, 4),
+            'avg_ms': round(self.total_ms / self.calls, 4) if self.calls else 0.0,
+            'max_ms': round(self.max_ms, 4),
+            'rows': self.rows,
+            'histogram': {('+inf' if bound == float('inf') else str(bound)): count
+                          for bound, count in zip(HISTOGRAM_BUCKETS_MS, self.histogram)},
+        }
+
+
+def enable(slow_ms=None):
+    """开启 SQL 统计；slow_ms 为慢查询阈值（毫秒）"""
+    global _enabled, _slow_ms
+    if slow_ms is not None:
+        _slow_ms = float(slow_ms)
+    _enabled = True
+
+
+def disable():
+    """关闭 SQL 统计（已收集的数据保留）"""
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """清空已收集的统计数据"""
+    with _lock:
+        _stats.clear()
+        _slow_queries.clear()
+
+
+def _get_stats(key):
+    stats = _stats.get(key)
+    if stats is None:
+        stats = _stats.setdefault(key, StatementStats(key))
+    return stats
+
+
+def _explain(connection, sql, params):
+    """获取语句的查询计划，失败时返回 None"""
+    if sql.lstrip().upper().startswith(_NO_EXPLAIN_PREFIXES):
+        return None
+    try:
+        cursor = sqlite3.Connection.cursor(connection)
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        plan = [row[-1] for row in cursor.fetchall()]
+        cursor.close()
+        return plan
+    except sqlite3.Error:
+        return None
+
+
+class ProfiledCursor(sqlite3.Cursor):
+    """记录执行与读取耗时的游标"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._key = None
+        self._sql = None
+        self._params = ()
+        self._call_ms = 0.0
+        self._slow_logged = False
+
+    def _begin(self, sql, params):
+        self._key = normalize_sql(sql)
+        self._sql = sql
+        self._params = params
+        self._call_ms = 0.0
+        self._slow_logged = False
+
+    def _record(self, elapsed_ms, rows=0, new_call=False):
+        with _lock:
+            stats = _get_stats(self._key)
+            if new_call:
+                stats.record_call(elapsed_ms)
+            else:
+                stats.total_ms += elapsed_ms
+                if self._call_ms + elapsed_ms > stats.max_ms:
+                    stats.max_ms = self._call_ms + elapsed_ms
+            stats.rows += rows
+        self._call_ms += elapsed_ms
+        if not self._slow_logged and self._call_ms >= _slow_ms:
+            self._slow_logged = True
+            self._log_slow()
+
+    def _log_slow(self):
+        plan = _explain(self.connection, self._sql, self._params)
+        entry = {
+            'sql': self._key,
+            'elapsed_ms': round(self._call_ms, 3),
+            'plan': plan,
+            'at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        }
+        with _lock:
+            _slow_queries.append(entry)
+            del _slow_queries[:-_MAX_SLOW_QUERIES]
+        logger.warning('慢查询 %.1f ms: %s | 查询计划: %s', self._call_ms, self._key,
+                       ' / '.join(plan) if plan else '无')
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, parameters)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._record((time.perf_counter() - start) * 1000, new_call=True)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql, ())
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._record((time.perf_counter() - start) * 1000, new_call=True)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        if self._key is not None:
+            self._record((time.perf_counter() - start) * 1000, rows=0 if row is None else 1)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        if self._key is not None:
+            self._record((time.perf_counter() - start) * 1000, rows=len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        if self._key is not None:
+            self._record((time.perf_counter() - start) * 1000, rows=len(rows))
+        return rows
+
+
+class ProfiledConnection(sqlite3.Connection):
+    """默认创建 ProfiledCursor 的数据库连接"""
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def snapshot(sort_by='total_ms'):
+    """
+    获取当前统计快照
+    :param sort_by: 排序字段（total_ms / calls / max_ms / rows）
+    :return: {'enabled', 'slow_ms', 'statements': [...], 'slow_queries': [...]}
+    """
+    with _lock:
+        statements = [stats.as_dict() for stats in _stats.values()]
+        slow = list(_slow_queries)
+    statements.sort(key=lambda item: item[sort_by], reverse=True)
+    return {
+        'enabled': _enabled,
+        'slow_ms': _slow_ms,
+        'statements': statements,
+        'slow_queries': slow,
+    }
+
+
+def dump(path, sort_by='total_ms'):
+    """将统计快照保存为 JSON 文件"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot(sort_by), f, ensure_ascii=False, indent=2)
+
+
+def format_report(snap, top=20, sql_width=90):
+    """将快照格式化为文本报告"""
+    statements = snap.get('statements', [])
+    total = sum(item['total_ms'] for item in statements) or 1.0
+    lines = [
+        f"{'='*120}",
+        f"SQL 耗时报告 (慢查询阈值: {snap.get('slow_ms')} ms, 共 {len(statements)} 条语句)",
+        f"{'='*120}",
+        f"{'占比':>6} {'总耗时ms':>10} {'次数':>8} {'平均ms':>9} {'最大ms':>9} {'行数':>9}  SQL",
+        "-" * 120,
+    ]
+    for item in statements[:top]:
+        sql = item['sql']
+        if len(sql) > sql_width:
+            sql = sql[:sql_width - 3] + '...'
+        lines.append(f"{item['total_ms'] / total * 100:>5.1f}% {item['total_ms']:>10.2f} "
+                     f"{item['calls']:>8} {item['avg_ms']:>9.3f} {item['max_ms']:>9.3f} "
+                     f"{item['rows']:>9}  {sql}")
+    slow = snap.get('slow_queries', [])
+    if slow:
+        lines.append(f"\n慢查询 (最近 {len(slow)} 条):")
+        for entry in slow[-top:]:
+            lines.append(f"  {entry['elapsed_ms']:>9.2f} ms  {entry['sql'][:sql_width]}")
+            for step in entry.get('plan') or []:
+                lines.append(f"      └ {step}")
+    return '\n'.join(lines)
+
+
+def _configure_from_env():
+    if os.environ.get('FINANCE_SQL_PROFILE', '').lower() in ('1', 'true', 'yes'):
+        enable(os.environ.get('FINANCE_SQL_SLOW_MS'))
+        output = os.environ.get('FINANCE_SQL_PROFILE_OUT')
+        if output:
+            atexit.register(dump, output)
+
+
+_configure_from_env()
+
+
+def _run_bench(args):
+    """开启统计后运行基准测试场景，然后打印报告"""
+    root = os.path.dirname(os.path.abspath(__file__))
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    from benchmarks import run_benchmarks
+
+    bench_args = run_benchmarks.build_arg_parser().parse_args(
+        ['--transactions', str(args.transactions), '--repeat', str(args.repeat)])
+    enable(args.slow_ms)
+    run_benchmarks.run(bench_args)
+    return snapshot(args.sort)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='SQL 耗时统计报告')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    report = sub.add_parser('report', help='打印已保存的统计快照')
+    report.add_argument('path', help='dump() 生成的 JSON 文件')
+    report.add_argument('--top', type=int, default=20)
+
+    bench = sub.add_parser('bench', help='运行基准测试并打印统计报告')
+    bench.add_argument('--transactions', type=int, default=20000)
+    bench.add_argument('--repeat', type=int, default=5)
+    bench.add_argument('--slow-ms', type=float, default=50)
+    bench.add_argument('--sort', default='total_ms', choices=['total_ms', 'calls', 'max_ms', 'rows'])
+    bench.add_argument('--top', type=int, default=20)
+    bench.add_argument('--output', help='同时保存快照到 JSON 文件')
+
+    args = parser.parse_args(argv)
+    if args.command == 'report':
+        with open(args.path, encoding='utf-8') as f:
+            snap = json.load(f)
+    else:
+        snap = _run_bench(args)
+        if args.output:
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(snap, f, ensure_ascii=False, indent=2)
+    print(format_report(snap, args.top))
+
+
+if __name__ == '__main__':
+    # 以脚本方式运行时，通过模块名导入，保证与 database 使用同一份统计数据
+    import query_profiler
+    query_profiler.main()
@@ -0,0 +1,130 @@
+# reconciliation.py
+"""
+账户余额对账
+
+accounts.balance 由增删改交易时增量维护，这里从账本重新计算并核对：
+    期望余额 = 初始余额 + 账本净额（收入为正，支出为负）
+
+所有账户在一次分组查询中完成计算。每次对账后为每个账户保存检查点
+（已核对到的最大交易ID + 截至该处的账本净额），之后的对账只扫描检查点之后的交易；
+检查点之前的交易被修改或删除时，数据库触发器会使对应检查点失效。
+
+用法：
+    python reconciliation.py            # 只报告不一致的账户
+    python reconciliation.py --repair   # 同时修复余额
+    python reconciliation.py --full     # 忽略检查点，全量重算
+"""
+import argparse
+import sqlite3
+import time
+from database import get_db_connection
+
+# 余额比较的容差（金额保留两位小数）
+TOLERANCE = 0.005
+
+
+def reconcile_balances(repair=False, full=False, account_ids=None):
+    """
+    核对（并可选修复）账户余额
+    :param repair: 是否把不一致账户的余额修正为期望值
+    :param full: 是否忽略检查点全量重算
+    :param account_ids: 只核对指定账户（默认全部）
+    :return: 对账报告字典
+    """
+    started = time.perf_counter()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        # 加写锁，保证核对期间账本和余额不被修改
+        cursor.execute('BEGIN IMMEDIATE')
+        if full:
+            cursor.execute('DELETE FROM balance_checkpoints')
+
+        # 一次分组扫描：以账户为外层，每个账户在索引上只读取检查点之后的交易
+        query = '''
+        SELECT a.id, a.user_id, a.name, a.balance, COALESCE(a.initial_balance, 0),
+               COALESCE(c.ledger_net, 0),
+               COALESCE(SUM(CASE WHEN t.type = 'income' THEN t.amount ELSE -t.amount END), 0),
+               MAX(t.id), COUNT(t.id)
+        FROM accounts a
+        LEFT JOIN balance_checkpoints c ON c.account_id = a.id
+        LEFT JOIN transactions t
+               ON t.account_id = a.id AND t.id > COALESCE(c.last_transaction_id, 0)
+        '''
+        params = []
+        if account_ids:
+            query += f" WHERE a.id IN ({', '.join('?' * len(account_ids))})"
+            params.extend(account_ids)
+        query += ' GROUP BY a.id'
+        cursor.execute(query, params)
+        rows = cursor.fetchall()
+
+        mismatches = []
+        checkpoints = []
+        scanned = 0
+        for (account_id, user_id, name, balance, initial, cp_net,
+             delta_net, last_id, row_count) in rows:
+            scanned += row_count
+            ledger_net = cp_net + delta_net
+            expected = round(initial + ledger_net, 2)
+            if abs((balance or 0) - expected) > TOLERANCE:
+                mismatches.append({
+                    'account_id': account_id,
+                    'user_id': user_id,
+                    'name': name,
+                    'balance': balance,
+                    'expected': expected,
+                    'difference': round((balance or 0) - expected, 2),
+                })
+            if last_id is not None:
+                checkpoints.append((account_id, last_id, ledger_net))
+
+        cursor.executemany('''
+            INSERT OR REPLACE INTO balance_checkpoints (account_id, last_transaction_id, ledger_net, checked_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+        ''', checkpoints)
+
+        if repair and mismatches:
+            cursor.executemany('UPDATE accounts SET balance = ? WHERE id = ?',
+                               [(item['expected'], item['account_id']) for item in mismatches])
+
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        raise ValueError(f"余额对账失败: {str(e)}")
+    finally:
+        conn.close()
+
+    return {
+        'accounts_checked': len(rows),
+        'transactions_scanned': scanned,
+        'mismatches': mismatches,
+        'repaired': len(mismatches) if repair else 0,
+        'elapsed_seconds': round(time.perf_counter() - started, 4),
+    }
+
+
+def print_report(report):
+    """打印对账报告"""
+    print(f"\n{'='*60}")
+    print("🔍 余额对账报告")
+    print(f"{'='*60}")
+    print(f"核对账户: {report['accounts_checked']}  扫描交易: {report['transactions_scanned']}  "
+          f"耗时: {report['elapsed_seconds']:.3f}s")
+    if not report['mismatches']:
+        print("✅ 所有账户余额与账本一致")
+        return
+    print(f"❌ {len(report['mismatches'])} 个账户余额不一致:")
+    for item in report['mismatches']:
+        print(f"  账户 {item['account_id']} ({item['name']}, 用户 {item['user_id']}): "
+              f"余额 {item['balance']:.2f} 期望 {item['expected']:.2f} 差额 {item['difference']:+.2f}")
+    if report['repaired']:
+        print(f"🔧 已修复 {report['repaired']} 个账户")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='账户余额对账')
+    parser.add_argument('--repair', action='store_true', help='修复不一致的余额')
+    parser.add_argument('--full', action='store_true', help='忽略检查点全量重算')
+    args = parser.parse_args()
+    print_report(reconcile_balances(repair=args.repair, full=args.full))
@@ -0,0 +1,205 @@
+# recurring.py
+"""
+定期交易（房租、工资、订阅等）
+
+规则按 daily / weekly / monthly / yearly 加间隔描述发生日期，按月和按年的规则以首次日期为锚点
+（例如每月 31 日，在小月取当月最后一天）。materialize_due 一次处理所有用户所有到期的规则：
+在一个事务内批量生成到今天为止的全部交易（走 insert_transaction_rows 批量写入路径），
+并推进每条规则的 next_date。
+
+重复执行是幂等的：next_date 与交易在同一事务中更新，且 transactions(recurring_rule_id, date)
+上有唯一索引，已生成过的日期会被跳过。
+
+用法：
+    python recurring.py run [--today 2024-12-31]
+"""
+import argparse
+import calendar
+from datetime import date, datetime, timedelta
+from database import get_db_connection
+from dedup import transaction_fingerprint
+
+FREQUENCIES = ('daily', 'weekly', 'monthly', 'yearly')
+
+
+def _parse_date(value):
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def _add_months(anchor, months):
+    """anchor 之后 months 个月的同一天（超过当月天数时取月末）"""
+    month_index = anchor.month - 1 + months
+    year, month = anchor.year + month_index // 12, month_index % 12 + 1
+    return date(year, month, min(anchor.day, calendar.monthrange(year, month)[1]))
+
+
+def occurrence_date(frequency, interval, start, n):
+    """第 n 次（从 0 开始）发生的日期"""
+    if frequency == 'daily':
+        return start + timedelta(days=n * interval)
+    if frequency == 'weekly':
+        return start + timedelta(weeks=n * interval)
+    if frequency == 'monthly':
+        return _add_months(start, n * interval)
+    return _add_months(start, 12 * n * interval)
+
+
+def add_recurring_rule(user_id, account_id, type, amount, category_id, frequency, start_date,
+                       interval=1, end_date=None, description=None):
+    """
+    添加定期交易规则
+    :return: 规则ID，失败时返回 False
+    """
+    from account_sharing import validate_linked_account_access
+
+    if frequency not in FREQUENCIES:
+        print(f"错误：不支持的周期 {frequency}，可选: {', '.join(FREQUENCIES)}")
+        return False
+    if type not in ('income', 'expense') or amount <= 0 or interval < 1:
+        print("错误：类型、金额或间隔无效。")
+        return False
+    try:
+        start = _parse_date(start_date)
+        end = _parse_date(end_date) if end_date else None
+    except ValueError:
+        print("错误：日期格式无效，请使用 YYYY-MM-DD。")
+        return False
+    if end and end < start:
+        print("错误：结束日期不能早于开始日期。")
+        return False
+    if not validate_linked_account_access(user_id, account_id, require_write=True):
+        print("错误：账户不存在或您没有写权限。")
+        return False
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT id FROM categories WHERE id = ? AND (user_id = ? OR user_id IS NULL)', (category_id, user_id))
+    if not cursor.fetchone():
+        conn.close()
+        print("错误：分类不存在或不可用。")
+        return False
+    cursor.execute('''
+        INSERT INTO recurring_rules (user_id, account_id, type, amount, category_id, description,
+                                     frequency, interval, start_date, end_date, next_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, account_id, type, amount, category_id, description, frequency, interval,
+          start.isoformat(), end.isoformat() if end else None, start.isoformat()))
+    rule_id = cursor.lastrowid
+    conn.commit()
+    conn.close()
+    return rule_id
+
+
+def get_recurring_rules(user_id):
+    """返回用户的定期交易规则 [(id, 账户, 类型, 金额, 分类, 备注, 周期, 间隔, 下次日期, 是否启用)]"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT r.id, a.name, r.type, r.amount, c.name, r.description, r.frequency, r.interval,
+               r.next_date, r.active
+        FROM recurring_rules r
+        JOIN accounts a ON a.id = r.account_id
+        JOIN categories c ON c.id = r.category_id
+        WHERE r.user_id = ?
+        ORDER BY r.active DESC, r.next_date
+    ''', (user_id,))
+    rules = cursor.fetchall()
+    conn.close()
+    return rules
+
+
+def deactivate_rule(user_id, rule_id):
+    """停用规则（已生成的交易保留），返回是否成功"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('UPDATE recurring_rules SET active = 0 WHERE id = ? AND user_id = ?', (rule_id, user_id))
+    updated = cursor.rowcount > 0
+    conn.commit()
+    conn.close()
+    return updated
+
+
+def materialize_due(today=None, user_id=None, batch_size=5000):
+    """
+    为所有到期的规则生成交易
+    :param today: 生成到该日期为止（默认今天）
+    :param user_id: 只处理该用户的规则（默认全部用户）
+    :param batch_size: 每次 executemany 写入的行数
+    :return: {'rules': 处理的规则数, 'inserted': 新增交易数, 'skipped': 已存在而跳过的数量}
+    """
+    from transaction_manager import insert_transaction_rows
+
+    today = _parse_date(today) if today else date.today()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        # 规则所有者失去账户写权限后不再生成交易
+        query = '''
+            SELECT r.id, r.user_id, r.account_id, r.type, r.amount, r.category_id, r.description,
+                   r.frequency, r.interval, r.start_date, r.end_date, r.occurrences
+            FROM recurring_rules r
+            WHERE r.active = 1 AND r.next_date <= ?
+              AND EXISTS (SELECT 1 FROM user_accessible_accounts ua
+                          WHERE ua.user_id = r.user_id AND ua.account_id = r.account_id AND ua.can_write = 1)
+        '''
+        params = [today.isoformat()]
+        if user_id is not None:
+            query += ' AND r.user_id = ?'
+            params.append(user_id)
+        cursor.execute(query, params)
+        rules = cursor.fetchall()
+
+        rows = []
+        rule_updates = []
+        for (rule_id, owner_id, account_id, t_type, amount, category_id, description,
+             frequency, interval, start_date, end_date, occurrences) in rules:
+            start = _parse_date(start_date)
+            limit = min(today, _parse_date(end_date)) if end_date else today
+            n = occurrences
+            day = occurrence_date(frequency, interval, start, n)
+            while day <= limit:
+                rows.append((owner_id, account_id, t_type, amount, category_id, day.isoformat(), description,
+                             transaction_fingerprint(account_id, t_type, amount, day, description), rule_id))
+                n += 1
+                day = occurrence_date(frequency, interval, start, n)
+            finished = end_date is not None and day > _parse_date(end_date)
+            rule_updates.append((None if finished else day.isoformat(), n, 0 if finished else 1, rule_id))
+
+        # 跳过已生成过的（规则, 日期）
+        existing = set()
+        rule_ids = [rule[0] for rule in rules]
+        for i in range(0, len(rule_ids), 500):
+            chunk = rule_ids[i:i + 500]
+            cursor.execute(f'''SELECT recurring_rule_id, date FROM transactions
+                               WHERE recurring_rule_id IN ({', '.join('?' * len(chunk))})''', chunk)
+            existing.update(cursor.fetchall())
+        new_rows = [row for row in rows if (row[8], row[5]) not in existing]
+        # 按日期顺序写入：每日余额快照触发器只需更新当天及之后的快照，顺序写入时每笔只涉及最新一天
+        new_rows.sort(key=lambda row: (row[5], row[1]))
+
+        for i in range(0, len(new_rows), batch_size):
+            insert_transaction_rows(cursor, new_rows[i:i + batch_size], extra_columns=('recurring_rule_id',))
+        cursor.executemany('UPDATE recurring_rules SET next_date = ?, occurrences = ?, active = ? WHERE id = ?',
+                           rule_updates)
+        conn.commit()
+        return {'rules': len(rules), 'inserted': len(new_rows), 'skipped': len(rows) - len(new_rows)}
+    except Exception as e:
+        conn.rollback()
+        print(f"错误：生成定期交易失败: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='定期交易')
+    sub = parser.add_subparsers(dest='command', required=True)
+    run_parser = sub.add_parser('run', help='生成所有到期的定期交易')
+    run_parser.add_argument('--today', help='生成到该日期为止 (YYYY-MM-DD)')
+    run_parser.add_argument('--user', type=int, help='只处理该用户的规则')
+    args = parser.parse_args()
+
+    result = materialize_due(args.today, args.user)
+    if result:
+        print(f"处理 {result['rules']} 条规则，生成 {result['inserted']} 笔交易，跳过已存在的 {result['skipped']} 笔")
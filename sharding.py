@@ -0,0 +1,246 @@
+# sharding.py
+"""
+可选的分库模式
+
+用户表和跨库共享目录保留在主库（DB_PATH），账户与交易按用户分散到
+data/shards/finance-<序号>.db 共 N 个文件中，不同分库的写入各自加锁，可以并行。
+
+- 用户按 user_id 的哈希固定路由到一个分库，其名下账户都创建在该分库
+- 账户ID按分库交错分配（id % N == 分库序号），由账户ID即可找到所在分库
+- 交易写入账户所在分库，余额更新始终在同一个库的事务内完成
+- 共享账户的关联记录写在账户所在分库，同时在主库 shard_account_links 中登记，
+  被共享用户据此找到需要查询的其他分库
+- 账户、交易和关联记录的ID都按分库交错分配，在所有分库间唯一
+
+通过环境变量 FINANCE_SHARDS=<分库数> 开启，或调用 configure()。分库模式是独立的入口：
+只有本模块的函数读写分库，transaction_manager、account_sharing 等模块始终使用主库，
+行为不受分库设置影响。
+"""
+import os
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import database
+from dedup import transaction_fingerprint
+from query_builder import compile_query
+
+SHARD_DIR = os.path.join('data', 'shards')
+
+_shard_count = int(os.environ.get('FINANCE_SHARDS', '0') or 0)
+_shard_dir = SHARD_DIR
+
+
+def configure(shard_count, shard_dir=SHARD_DIR):
+    """设置分库数量和目录；shard_count 小于 2 时关闭分库模式"""
+    global _shard_count, _shard_dir
+    _shard_count = shard_count
+    _shard_dir = shard_dir
+
+
+def is_enabled():
+    return _shard_count > 1
+
+
+def shard_count():
+    return _shard_count
+
+
+def shard_path(index):
+    return os.path.join(_shard_dir, f'finance-{index}.db')
+
+
+def shard_for_user(user_id):
+    """用户所在的分库（用于创建账户）"""
+    return zlib.crc32(str(user_id).encode('utf-8')) % _shard_count
+
+
+def shard_for_account(account_id):
+    return account_id % _shard_count
+
+
+def get_shard_connection(index):
+    return database.get_db_connection(shard_path(index))
+
+
+def init_shards():
+    """创建并初始化所有分库文件"""
+    os.makedirs(_shard_dir, exist_ok=True)
+    for index in range(_shard_count):
+        database.init_db(shard_path(index))
+
+
+def _next_id(cursor, table, index):
+    """本分库中下一个满足 id % N == 分库序号 的ID（须在写事务内调用）"""
+    cursor.execute(f'SELECT COALESCE(MAX(id), ?) + ? FROM {table}', (index - _shard_count, _shard_count))
+    return cursor.fetchone()[0]
+
+
+def create_account(user_id, name, type, balance=0.0):
+    """
+    在用户所在分库创建账户
+    :return: 新账户ID，失败时返回 None
+    """
+    index = shard_for_user(user_id)
+    conn = get_shard_connection(index)
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        account_id = _next_id(cursor, 'accounts', index)
+        cursor.execute('''INSERT INTO accounts (id, user_id, name, type, balance, initial_balance)
+                          VALUES (?, ?, ?, ?, ?, ?)''', (account_id, user_id, name, type, balance, balance))
+        conn.commit()
+        return account_id
+    except Exception as e:
+        conn.rollback()
+        print(f"错误：创建账户失败: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+def _has_access(cursor, user_id, account_id, require_write=False):
+    # 分库中的 user_accessible_accounts 由本分库的账户和关联记录触发器维护
+    cursor.execute('SELECT can_write FROM user_accessible_accounts WHERE user_id = ? AND account_id = ?',
+                   (user_id, account_id))
+    row = cursor.fetchone()
+    return row is not None and (bool(row[0]) or not require_write)
+
+
+def validate_account_access(user_id, account_id, require_write=False):
+    """在账户所在分库检查用户是否为所有者或被共享用户"""
+    conn = get_shard_connection(shard_for_account(account_id))
+    try:
+        return _has_access(conn.cursor(), user_id, account_id, require_write)
+    finally:
+        conn.close()
+
+
+def add_transaction(user_id, account_id, type, amount, category_id, date, description=None):
+    """
+    在账户所在分库写入一笔交易并更新余额
+    :return: (分库序号, 交易ID)，失败时返回 False；交易ID在所有分库间唯一
+    """
+    from transaction_manager import insert_transaction_rows
+
+    index = shard_for_account(account_id)
+    conn = get_shard_connection(index)
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        if not _has_access(cursor, user_id, account_id, require_write=True):
+            conn.rollback()
+            print("错误：账户不存在或您没有写权限。")
+            return False
+        # 跨库共享账户上只能使用预置分类和账户所在分库中的分类
+        cursor.execute('SELECT id FROM categories WHERE id = ? AND (user_id = ? OR user_id IS NULL)',
+                       (category_id, user_id))
+        if not cursor.fetchone():
+            conn.rollback()
+            print("错误：分类不存在或不可用。")
+            return False
+        transaction_id = _next_id(cursor, 'transactions', index)
+        insert_transaction_rows(cursor, [(user_id, account_id, type, amount, category_id, date, description,
+                                          transaction_fingerprint(account_id, type, amount, date, description),
+                                          transaction_id)], extra_columns=('id',))
+        conn.commit()
+        return index, transaction_id
+    except Exception as e:
+        conn.rollback()
+        print(f"错误：添加交易失败: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+def _register_link(linked_user_id, account_id, owner_user_id, permission_level):
+    """在主库 shard_account_links 目录中登记共享账户"""
+    directory = database.get_db_connection()
+    try:
+        directory.execute('''INSERT OR REPLACE INTO shard_account_links
+                             (linked_user_id, account_id, owner_user_id, permission_level)
+                             VALUES (?, ?, ?, ?)''', (linked_user_id, account_id, owner_user_id, permission_level))
+        directory.commit()
+    finally:
+        directory.close()
+
+
+def share_account(owner_user_id, linked_user_id, account_id, permission_level='read'):
+    """
+    共享账户：关联记录写入账户所在分库，并在主库目录中登记
+    :return: (是否成功, 提示信息)
+    """
+    conn = get_shard_connection(shard_for_account(account_id))
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT 1 FROM accounts WHERE id = ? AND user_id = ?', (account_id, owner_user_id))
+        if not cursor.fetchone():
+            return False, "账户不存在或无权操作"
+        cursor.execute('SELECT 1 FROM user_account_links WHERE linked_user_id = ? AND account_id = ?',
+                       (linked_user_id, account_id))
+        if cursor.fetchone():
+            return False, "该账户已经关联给此用户"
+        link_id = _next_id(cursor, 'user_account_links', shard_for_account(account_id))
+        cursor.execute('''INSERT INTO user_account_links (id, owner_user_id, linked_user_id, account_id, permission_level)
+                          VALUES (?, ?, ?, ?, ?)''',
+                       (link_id, owner_user_id, linked_user_id, account_id, permission_level))
+        # 先提交分库中的关联记录再登记目录；目录登记失败时删除已提交的关联记录，两边都不生效
+        conn.commit()
+        try:
+            _register_link(linked_user_id, account_id, owner_user_id, permission_level)
+        except Exception:
+            cursor.execute('DELETE FROM user_account_links WHERE id = ?', (link_id,))
+            conn.commit()
+            raise
+        return True, "账户关联成功"
+    except Exception as e:
+        conn.rollback()
+        return False, f"关联失败: {str(e)}"
+    finally:
+        conn.close()
+
+
+def get_linked_account_ids(user_id):
+    """返回共享给用户的账户 {分库序号: [账户ID, ...]}"""
+    conn = database.get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT account_id FROM shard_account_links WHERE linked_user_id = ?', (user_id,))
+    by_shard = {}
+    for (account_id,) in cursor.fetchall():
+        by_shard.setdefault(shard_for_account(account_id), []).append(account_id)
+    conn.close()
+    return by_shard
+
+
+def _query_shard(index, user_id, filters):
+    conn = get_shard_connection(index)
+    cursor = conn.cursor()
+    # 与 get_all_accessible_transactions 相同：本分库中用户拥有的和共享给用户的账户上的交易
+    query = '''
+    SELECT ?, t.id, t.type, t.amount, c.name as category, a.name as account, t.date, t.description
+    FROM user_accessible_accounts ua
+    JOIN transactions t ON t.account_id = ua.account_id
+    JOIN categories c ON t.category_id = c.id
+    JOIN accounts a ON t.account_id = a.id
+    WHERE ua.user_id = ?
+    '''
+    try:
+        query, params = compile_query(query, filters)
+        cursor.execute(query, [index, user_id] + params)
+        return cursor.fetchall()
+    finally:
+        conn.close()
+
+
+def get_accessible_transactions(user_id, filters=None):
+    """
+    查询用户自己的和共享给用户的交易（并行查询涉及的分库后合并）
+    :return: [(分库序号, 交易ID, 类型, 金额, 分类, 账户, 日期, 备注)]，按日期倒序
+    """
+    filters = filters or {}
+    # 用户自己的账户在自己的分库，共享给用户的账户按目录找到所在分库
+    shards = set(get_linked_account_ids(user_id)) | {shard_for_user(user_id)}
+    with ThreadPoolExecutor(max_workers=len(shards)) as pool:
+        parts = pool.map(lambda index: _query_shard(index, user_id, filters), shards)
+        rows = [row for part in parts for row in part]
+    rows.sort(key=lambda row: (row[6], row[1]), reverse=True)
+    return rows
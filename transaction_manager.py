@@ -1,10 +1,29 @@
+import sqlite3
 from database import get_db_connection
 from datetime import datetime
+from metrics import instrument, TRANSACTION_OPS, TRANSACTION_OP_SECONDS
 
 # 添加账户共享相关的导入
 from account_sharing import validate_linked_account_access
+from dedup import transaction_fingerprint, find_duplicate, find_existing_fingerprints
+from archive import transactions_source
+from query_builder import ACCESSIBLE_CONDITION, compile_query, compile_update
+from anomalies import score_transactions
 
-def add_transaction(user_id, account_id, type, amount, category_id, date, description=None):
+def is_valid_date(value):
+    """日期须为 YYYY-MM-DD 格式的有效日期"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d') == value
+    except (TypeError, ValueError):
+        return False
+
+def signed_amount(type, amount):
+    """交易对账户余额的影响：收入为正，支出为负"""
+    return amount if type == 'income' else -amount
+
+@instrument(TRANSACTION_OPS, TRANSACTION_OP_SECONDS, op='add')
+def add_transaction(user_id, account_id, type, amount, category_id, date, description=None,
+                    allow_duplicate=True):
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -21,173 +40,264 @@ def add_transaction(user_id, account_id, type, amount, category_id, date, descri
         print("错误：分类不存在或不可用。")
         return False
 
-    # 首先更新账户余额
-    if type == 'income':
-        cursor.execute('UPDATE accounts SET balance = balance + ? WHERE id = ?', (amount, account_id))
-    else:
-        cursor.execute('UPDATE accounts SET balance = balance - ? WHERE id = ?', (amount, account_id))
-    
-    # 插入交易记录
-    cursor.execute('''
-    INSERT INTO transactions (user_id, account_id, type, amount, category_id, date, description)
-    VALUES (?, ?, ?, ?, ?, ?, ?)
-    ''', (user_id, account_id, type, amount, category_id, date, description))
+    # 同一天两笔相同的交易是正常情况，默认照常写入；allow_duplicate=False 时拒绝完全重复的交易
+    # （同账户、类型、日期、金额、备注）
+    fingerprint = transaction_fingerprint(account_id, type, amount, date, description)
+    if not allow_duplicate:
+        duplicate_id = find_duplicate(cursor, fingerprint)
+        if duplicate_id is not None:
+            conn.close()
+            print(f"错误：与已有交易 {duplicate_id} 重复。")
+            return False
+
+    # 插入交易记录、更新账户余额并做异常评分
+    insert_transaction_rows(cursor, [(user_id, account_id, type, amount, category_id, date, description,
+                                      fingerprint)])
     
     conn.commit()
     conn.close()
     return True
 
+def insert_transaction_rows(cursor, rows, extra_columns=()):
+    """
+    批量写入交易并更新余额（不做权限检查，不提交）
+    rows: [(user_id, account_id, type, amount, category_id, date, description, fingerprint, *extra)]
+    extra_columns: 每行末尾附加值对应的列名，例如 ('recurring_rule_id',)
+    每个账户的余额变化先汇总，再用一条 UPDATE 写入；新交易按已有基线批量做异常评分，与交易在同一事务中提交
+    """
+    deltas = {}
+    for row in rows:
+        deltas[row[1]] = deltas.get(row[1], 0) + signed_amount(row[2], row[3])
+    columns = ['user_id', 'account_id', 'type', 'amount', 'category_id', 'date', 'description', 'fingerprint']
+    columns.extend(extra_columns)
+    cursor.executemany(f'''
+    INSERT INTO transactions ({', '.join(columns)})
+    VALUES ({', '.join('?' * len(columns))})
+    ''', rows)
+    # 写入期间持有写锁，新交易的ID是连续的，最后一个为 last_insert_rowid()（触发器内的写入不影响它）
+    if rows:
+        cursor.execute('SELECT last_insert_rowid()')
+        last_id = cursor.fetchone()[0]
+        score_transactions(cursor, range(last_id - len(rows) + 1, last_id + 1))
+    cursor.executemany('UPDATE accounts SET balance = balance + ? WHERE id = ?',
+                       [(delta, account_id) for account_id, delta in deltas.items() if delta != 0])
+
+@instrument(TRANSACTION_OPS, TRANSACTION_OP_SECONDS, op='add_batch')
+def add_transactions(user_id, transactions, skip_duplicates=True):
+    """
+    批量添加交易，全部写入在一个事务内完成
+    transactions: 字典列表，键为 account_id、type、amount、category_id、date、description（可选）
+    skip_duplicates: True 时跳过与已有交易或本批次内重复的记录，False 时照常写入
+    返回: {'inserted': 写入条数, 'duplicates': [重复记录下标], 'rejected': [(下标, 原因)]}
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    result = {'inserted': 0, 'duplicates': [], 'rejected': []}
+    account_access = {}
+    category_access = {}
+    candidates = []
+    
+    for index, item in enumerate(transactions):
+        account_id = item.get('account_id')
+        category_id = item.get('category_id')
+        t_type = item.get('type')
+        amount = item.get('amount')
+        if t_type not in ('income', 'expense') or amount is None or amount <= 0:
+            result['rejected'].append((index, '类型或金额无效'))
+            continue
+        if not is_valid_date(item.get('date')):
+            result['rejected'].append((index, '日期无效（应为 YYYY-MM-DD）'))
+            continue
+        # 同一批次中账户和分类的权限只检查一次
+        if account_id not in account_access:
+            account_access[account_id] = validate_linked_account_access(user_id, account_id, require_write=True)
+        if not account_access[account_id]:
+            result['rejected'].append((index, '账户不存在或没有写权限'))
+            continue
+        if category_id not in category_access:
+            cursor.execute('SELECT id FROM categories WHERE id = ? AND (user_id = ? OR user_id IS NULL)',
+                           (category_id, user_id))
+            category_access[category_id] = cursor.fetchone() is not None
+        if not category_access[category_id]:
+            result['rejected'].append((index, '分类不存在或不可用'))
+            continue
+        fingerprint = transaction_fingerprint(account_id, t_type, amount, item['date'], item.get('description'))
+        candidates.append((index, (user_id, account_id, t_type, amount, category_id, item['date'],
+                                   item.get('description'), fingerprint)))
+    
+    rows = []
+    if skip_duplicates:
+        existing = find_existing_fingerprints(cursor, {row[7] for _, row in candidates})
+        for index, row in candidates:
+            if row[7] in existing:
+                result['duplicates'].append(index)
+            else:
+                existing.add(row[7])
+                rows.append(row)
+    else:
+        rows = [row for _, row in candidates]
+    
+    try:
+        insert_transaction_rows(cursor, rows)
+        conn.commit()
+        result['inserted'] = len(rows)
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"错误：批量添加交易失败: {e}")
+        return False
+    finally:
+        conn.close()
+    return result
+
 def get_transactions(user_id, filters=None):
-    # filters 可以是一个字典，包含类型、分类、时间范围等
+    # filters 可以是一个字典，键见 query_builder.TRANSACTION_FILTERS（类型、分类、账户、时间范围、金额范围、备注文本）
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # 修改查询：包括用户自己的交易和关联账户的交易
-    query = '''
+    filters = filters or {}
+    # 日期范围涉及已归档年份时合并归档分区
+    source = transactions_source(cursor, filters.get('start_date'), filters.get('end_date'))
+    
+    # 用户自己写入的交易，以及自己的账户和被共享账户上的交易
+    query = f'''
     SELECT t.id, t.type, t.amount, c.name as category, a.name as account, t.date, t.description
-    FROM transactions t
+    FROM {source} t
     JOIN categories c ON t.category_id = c.id
     JOIN accounts a ON t.account_id = a.id
-    WHERE (t.user_id = ? OR t.account_id IN (
-        SELECT account_id FROM user_account_links WHERE linked_user_id = ?
-    ))
+    WHERE {ACCESSIBLE_CONDITION}
     '''
-    params = [user_id, user_id]
-    
-    if filters:
-        if 'type' in filters:
-            query += ' AND t.type = ?'
-            params.append(filters['type'])
-        if 'category_id' in filters:
-            query += ' AND t.category_id = ?'
-            params.append(filters['category_id'])
-        if 'start_date' in filters:
-            query += ' AND t.date >= ?'
-            params.append(filters['start_date'])
-        if 'end_date' in filters:
-            query += ' AND t.date <= ?'
-            params.append(filters['end_date'])
-    
-    query += ' ORDER BY t.date DESC'
-    cursor.execute(query, params)
+    try:
+        query, params = compile_query(query, filters, order_by='t.date DESC')
+    except ValueError:
+        conn.close()
+        raise
+    cursor.execute(query, [user_id, user_id] + params)
     transactions = cursor.fetchall()
     conn.close()
     return transactions
 
+@instrument(TRANSACTION_OPS, TRANSACTION_OP_SECONDS, op='edit')
 def edit_transaction(transaction_id, user_id, updates):
-    # updates 是一个字典，包含要更新的字段
+    # updates 是一个字典，包含要更新的字段（只允许 query_builder.EDITABLE_COLUMNS 中的列）
+    try:
+        compile_update('transactions', updates, 'id = ?')
+    except ValueError as e:
+        print(f"错误：{e}")
+        return False
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # 修改：先获取原交易记录，检查用户是否有权限编辑
-    cursor.execute('''
-        SELECT t.account_id, t.type, t.amount, t.user_id 
-        FROM transactions t
-        WHERE t.id = ? AND (t.user_id = ? OR t.account_id IN (
-            SELECT account_id FROM user_account_links 
-            WHERE linked_user_id = ? AND permission_level = 'write'
-        ))
-    ''', (transaction_id, user_id, user_id))
-    
-    old_trans = cursor.fetchone()
-    if not old_trans:
-        conn.close()
-        print("错误：交易记录不存在或您没有编辑权限。")
-        return False
-    
-    old_account_id, old_type, old_amount, transaction_owner = old_trans
-    
-    # 检查新账户的权限（如果更新了账户）
-    new_account_id = updates.get('account_id', old_account_id)
-    if new_account_id != old_account_id:
-        if not validate_linked_account_access(user_id, new_account_id, require_write=True):
-            conn.close()
-            print("错误：您没有对新账户的写权限。")
+    try:
+        # 显式开启写事务：读取原记录、更新记录和调整余额在同一个锁内完成
+        cursor.execute('BEGIN IMMEDIATE')
+        
+        # 获取原交易记录，同时检查权限：交易是用户自己写入的，或用户对交易所在账户有写权限
+        cursor.execute('''
+            SELECT t.account_id, t.type, t.amount, t.date, t.description, t.transfer_id 
+            FROM transactions t
+            WHERE t.id = ? AND (t.user_id = ? OR EXISTS (
+                SELECT 1 FROM user_accessible_accounts ua
+                WHERE ua.user_id = ? AND ua.account_id = t.account_id AND ua.can_write = 1
+            ))
+        ''', (transaction_id, user_id, user_id))
+        
+        old_trans = cursor.fetchone()
+        if not old_trans:
+            conn.rollback()
+            print("错误：交易记录不存在或您没有编辑权限。")
             return False
-    
-    # 首先恢复原账户余额
-    if old_type == 'income':
-        cursor.execute('UPDATE accounts SET balance = balance - ? WHERE id = ?', (old_amount, old_account_id))
-    else:
-        cursor.execute('UPDATE accounts SET balance = balance + ? WHERE id = ?', (old_amount, old_account_id))
-    
-    # 更新交易记录
-    set_clause = []
-    params = []
-    for key, value in updates.items():
-        set_clause.append(f"{key} = ?")
-        params.append(value)
-    params.append(transaction_id)
-    
-    # 修改：更新条件，只更新用户有权限的交易
-    cursor.execute(f'''
-        UPDATE transactions 
-        SET {", ".join(set_clause)} 
-        WHERE id = ? AND (user_id = ? OR account_id IN (
-            SELECT account_id FROM user_account_links 
-            WHERE linked_user_id = ? AND permission_level = 'write'
-        ))
-    ''', params + [user_id, user_id])
-    
-    # 更新新账户余额
-    new_type = updates.get('type', old_type)
-    new_amount = updates.get('amount', old_amount)
-    
-    if new_type == 'income':
-        cursor.execute('UPDATE accounts SET balance = balance + ? WHERE id = ?', (new_amount, new_account_id))
-    else:
-        cursor.execute('UPDATE accounts SET balance = balance - ? WHERE id = ?', (new_amount, new_account_id))
-    
-    conn.commit()
-    conn.close()
-    return True
+        
+        old_account_id, old_type, old_amount, old_date, old_description, transfer_id = old_trans
+        if transfer_id is not None:
+            conn.rollback()
+            print(f"错误：该交易属于转账 {transfer_id}，请删除整笔转账后重新转账。")
+            return False
+        
+        # 检查新账户的权限（如果更新了账户）
+        new_account_id = updates.get('account_id', old_account_id)
+        if new_account_id != old_account_id:
+            if not validate_linked_account_access(user_id, new_account_id, require_write=True):
+                conn.rollback()
+                print("错误：您没有对新账户的写权限。")
+                return False
+        
+        new_type = updates.get('type', old_type)
+        new_amount = updates.get('amount', old_amount)
+        
+        # 更新交易记录（权限已在本事务内验证过，只允许白名单中的字段），同时重新计算指纹
+        query, params = compile_update('transactions', updates, 'id = ?', extra_set='fingerprint = ?')
+        params.append(transaction_fingerprint(new_account_id, new_type, new_amount,
+                                              updates.get('date', old_date),
+                                              updates.get('description', old_description)))
+        params.append(transaction_id)
+        cursor.execute(query, params)
+        
+        # 计算每个受影响账户的余额净变化，每个账户最多一条 UPDATE
+        deltas = {old_account_id: -signed_amount(old_type, old_amount)}
+        deltas[new_account_id] = deltas.get(new_account_id, 0) + signed_amount(new_type, new_amount)
+        cursor.executemany('UPDATE accounts SET balance = balance + ? WHERE id = ?',
+                           [(delta, account_id) for account_id, delta in deltas.items() if delta != 0])
+        
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"错误：修改交易记录失败: {e}")
+        return False
+    finally:
+        conn.close()
 
+@instrument(TRANSACTION_OPS, TRANSACTION_OP_SECONDS, op='delete')
 def delete_transaction(transaction_id, user_id):
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # 修改：先获取交易记录，检查用户是否有权限删除
-    cursor.execute('''
-        SELECT account_id, type, amount 
-        FROM transactions 
-        WHERE id = ? AND (user_id = ? OR account_id IN (
-            SELECT account_id FROM user_account_links 
-            WHERE linked_user_id = ? AND permission_level = 'write'
-        ))
-    ''', (transaction_id, user_id, user_id))
-    
-    trans = cursor.fetchone()
-    if not trans:
-        conn.close()
-        print("错误：交易记录不存在或您没有删除权限。")
+    try:
+        # 读取、权限检查和删除在同一个写事务内完成
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            SELECT t.account_id, t.type, t.amount, t.transfer_id 
+            FROM transactions t
+            WHERE t.id = ? AND (t.user_id = ? OR EXISTS (
+                SELECT 1 FROM user_accessible_accounts ua
+                WHERE ua.user_id = ? AND ua.account_id = t.account_id AND ua.can_write = 1
+            ))
+        ''', (transaction_id, user_id, user_id))
+        
+        trans = cursor.fetchone()
+        if not trans:
+            conn.rollback()
+            print("错误：交易记录不存在或您没有删除权限。")
+            return False
+        
+        account_id, type, amount, transfer_id = trans
+        if transfer_id is not None:
+            conn.rollback()
+            print(f"错误：该交易属于转账 {transfer_id}，请通过删除转账同时删除两条记录。")
+            return False
+        
+        # 恢复账户余额
+        cursor.execute('UPDATE accounts SET balance = balance - ? WHERE id = ?',
+                       (signed_amount(type, amount), account_id))
+        
+        # 删除交易记录（权限已在本事务内验证过）
+        cursor.execute('DELETE FROM transactions WHERE id = ?', (transaction_id,))
+        
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"错误：删除交易记录失败: {e}")
         return False
-    
-    account_id, type, amount = trans
-    
-    # 恢复账户余额
-    if type == 'income':
-        cursor.execute('UPDATE accounts SET balance = balance - ? WHERE id = ?', (amount, account_id))
-    else:
-        cursor.execute('UPDATE accounts SET balance = balance + ? WHERE id = ?', (amount, account_id))
-    
-    # 删除交易记录
-    cursor.execute('''
-        DELETE FROM transactions 
-        WHERE id = ? AND (user_id = ? OR account_id IN (
-            SELECT account_id FROM user_account_links 
-            WHERE linked_user_id = ? AND permission_level = 'write'
-        ))
-    ''', (transaction_id, user_id, user_id))
-    
-    conn.commit()
-    conn.close()
-    return True
+    finally:
+        conn.close()
 
 # 新增函数：获取用户有权限访问的所有账户的交易
 def get_all_accessible_transactions(user_id, filters=None):
     """
     获取用户有权限访问的所有账户的交易记录
-    包括用户自己的账户和关联账户
+    包括用户自己写入的交易、用户自己的账户和关联账户上的交易
     """
     if filters is None:
         filters = {}
@@ -195,43 +305,29 @@ def get_all_accessible_transactions(user_id, filters=None):
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    # 构建查询：包括用户自己的交易和所有关联账户的交易
-    query = '''
+    # 日期范围涉及已归档年份时合并归档分区
+    source = transactions_source(cursor, filters.get('start_date'), filters.get('end_date'))
+    
+    # 构建查询：用户自己写入的交易，以及自己的账户和所有关联账户上的交易
+    query = f'''
     SELECT t.id, t.type, t.amount, c.name as category, a.name as account, 
            t.date, t.description, u.username as transaction_owner,
            CASE 
                WHEN t.user_id = ? THEN 'own'
                ELSE 'linked'
            END as ownership
-    FROM transactions t
+    FROM {source} t
     JOIN categories c ON t.category_id = c.id
     JOIN accounts a ON t.account_id = a.id
     JOIN users u ON t.user_id = u.id
-    WHERE (t.user_id = ? OR t.account_id IN (
-        SELECT account_id FROM user_account_links WHERE linked_user_id = ?
-    ))
+    WHERE {ACCESSIBLE_CONDITION}
     '''
-    params = [user_id, user_id, user_id]
-    
-    if filters:
-        if 'type' in filters:
-            query += ' AND t.type = ?'
-            params.append(filters['type'])
-        if 'category_id' in filters:
-            query += ' AND t.category_id = ?'
-            params.append(filters['category_id'])
-        if 'start_date' in filters:
-            query += ' AND t.date >= ?'
-            params.append(filters['start_date'])
-        if 'end_date' in filters:
-            query += ' AND t.date <= ?'
-            params.append(filters['end_date'])
-        if 'account_id' in filters:
-            query += ' AND t.account_id = ?'
-            params.append(filters['account_id'])
-    
-    query += ' ORDER BY t.date DESC, t.id DESC'
-    cursor.execute(query, params)
+    try:
+        query, params = compile_query(query, filters, order_by='t.date DESC, t.id DESC')
+    except ValueError:
+        conn.close()
+        raise
+    cursor.execute(query, [user_id, user_id, user_id] + params)
     transactions = cursor.fetchall()
     conn.close()
     
@@ -0,0 +1,92 @@
+# transaction_search.py
+"""
+交易备注全文搜索
+
+使用 transactions_fts（FTS5 外部内容表，trigram 分词）按相关度排序返回结果，
+并与 get_all_accessible_transactions 一样只返回用户自己和被共享账户上的交易。
+
+trigram 分词要求每个检索词至少 3 个字符；更短的词（例如两个汉字的“午餐”）
+改用 LIKE 在候选结果上过滤。
+"""
+import sqlite3
+from database import get_db_connection
+from query_builder import ACCESSIBLE_CONDITION, compile_query
+
+MIN_FTS_TERM_LENGTH = 3
+
+
+def _fts_available(cursor):
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'transactions_fts'")
+    return cursor.fetchone() is not None
+
+
+def _quote(term):
+    """把检索词转为 FTS5 短语，避免其中的特殊字符被当作查询语法"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def search_transactions(user_id, query, filters=None, limit=50):
+    """
+    按备注搜索交易
+    :param user_id: 当前用户ID
+    :param query: 检索词，多个词用空格分隔（需全部匹配）
+    :param filters: 可选过滤条件，键见 query_builder.TRANSACTION_FILTERS
+    :param limit: 最多返回条数
+    :return: [(id, type, amount, category, account, date, description, score)]，
+             score 越小越相关；只有短词时 score 为 None，按日期倒序
+    """
+    terms = [term for term in (query or '').split() if term]
+    if not terms:
+        return []
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    fts_terms = [term for term in terms if len(term) >= MIN_FTS_TERM_LENGTH]
+    like_terms = [term for term in terms if len(term) < MIN_FTS_TERM_LENGTH]
+    if not _fts_available(cursor):
+        fts_terms, like_terms = [], terms
+
+    if fts_terms:
+        query_sql = '''
+        SELECT t.id, t.type, t.amount, c.name as category, a.name as account,
+               t.date, t.description, bm25(transactions_fts) as score
+        FROM transactions_fts
+        JOIN transactions t ON t.id = transactions_fts.rowid
+        JOIN categories c ON t.category_id = c.id
+        JOIN accounts a ON t.account_id = a.id
+        WHERE transactions_fts MATCH ?
+        '''
+        params = [' AND '.join(_quote(term) for term in fts_terms)]
+    else:
+        query_sql = '''
+        SELECT t.id, t.type, t.amount, c.name as category, a.name as account,
+               t.date, t.description, NULL as score
+        FROM transactions t
+        JOIN categories c ON t.category_id = c.id
+        JOIN accounts a ON t.account_id = a.id
+        WHERE 1 = 1
+        '''
+        params = []
+
+    # 权限：自己写入的交易，以及自己的账户或被共享账户上的交易
+    query_sql += f' AND {ACCESSIBLE_CONDITION}'
+    params.extend([user_id, user_id])
+
+    for term in like_terms:
+        query_sql += " AND t.description LIKE ? ESCAPE '\\'"
+        escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        params.append(f'%{escaped}%')
+
+    order_by = 'score, t.date DESC' if fts_terms else 't.date DESC, t.id DESC'
+    try:
+        # 未知的筛选字段抛出 ValueError，同样要关闭连接
+        query_sql, filter_values = compile_query(query_sql, filters, order_by=order_by, limit=limit)
+        cursor.execute(query_sql, params + filter_values)
+        results = cursor.fetchall()
+    except sqlite3.OperationalError as e:
+        print(f"错误：搜索失败: {e}")
+        results = []
+    finally:
+        conn.close()
+    return results
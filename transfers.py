@@ -0,0 +1,182 @@
+# transfers.py
+"""
+账户间转账
+
+一笔转账在 transfers 表中记一行，并在 transactions 中写两条腿：转出账户一笔支出、转入账户一笔收入，
+两条腿的 transfer_id 指向同一笔转账，分类为预置的“转账”分类。
+两条腿、两个账户的余额更新和转账记录在同一个 SQLite 事务内完成，不会出现只转出没转入的情况。
+
+转账只是资金在自己账户之间移动，不计入收支统计和预算（统计查询与预算触发器都排除 transfer_id 非空的交易）。
+两条腿不能单独编辑或删除，只能通过 delete_transfer 整笔删除。
+"""
+import sqlite3
+from database import get_db_connection
+from dedup import transaction_fingerprint
+
+TRANSFER_CATEGORY = '转账'
+
+
+def _transfer_categories(cursor):
+    """预置“转账”分类的ID：{'income': id, 'expense': id}"""
+    cursor.execute('SELECT type, id FROM categories WHERE user_id IS NULL AND name = ?', (TRANSFER_CATEGORY,))
+    return dict(cursor.fetchall())
+
+
+def transfer_batch(user_id, transfers):
+    """
+    批量转账，全部写入在一个事务内完成
+    transfers: 字典列表，键为 from_account、to_account、amount、date、description（可选）、
+               to_amount（可选，转入金额；两个账户币种不同且未提供时按当日汇率折算）
+    返回: {'inserted': [转账ID], 'rejected': [(下标, 原因)]}，写入失败时返回 False
+    """
+    from account_sharing import validate_linked_account_access
+    from currency import convert
+    from transaction_manager import insert_transaction_rows
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    result = {'inserted': [], 'rejected': []}
+    try:
+        categories = _transfer_categories(cursor)
+        if len(categories) != 2:
+            print("错误：缺少预置的转账分类，请先初始化数据库。")
+            return False
+
+        # 同一批次中每个账户的权限和币种只查一次
+        account_access = {}
+        account_currency = {}
+        accepted = []
+        for index, item in enumerate(transfers):
+            from_account, to_account = item.get('from_account'), item.get('to_account')
+            amount, t_date = item.get('amount'), item.get('date')
+            if from_account == to_account:
+                result['rejected'].append((index, '转出和转入账户相同'))
+                continue
+            if amount is None or amount <= 0 or not t_date:
+                result['rejected'].append((index, '金额或日期无效'))
+                continue
+            for account_id in (from_account, to_account):
+                if account_id not in account_access:
+                    account_access[account_id] = validate_linked_account_access(user_id, account_id,
+                                                                                require_write=True)
+            if not (account_access[from_account] and account_access[to_account]):
+                result['rejected'].append((index, '账户不存在或没有写权限'))
+                continue
+            for account_id in (from_account, to_account):
+                if account_id not in account_currency:
+                    cursor.execute('SELECT currency FROM accounts WHERE id = ?', (account_id,))
+                    account_currency[account_id] = cursor.fetchone()[0]
+            to_amount = item.get('to_amount')
+            if to_amount is None:
+                try:
+                    to_amount = round(convert(amount, account_currency[from_account],
+                                              account_currency[to_account], t_date), 2)
+                except ValueError as e:
+                    result['rejected'].append((index, str(e)))
+                    continue
+            accepted.append((index, from_account, to_account, amount, to_amount, str(t_date)[:10],
+                             item.get('description')))
+
+        if not accepted:
+            return result
+
+        cursor.execute('BEGIN IMMEDIATE')
+        # 在写锁内分配转账ID，转账记录和两条腿都可以用 executemany 批量写入
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM transfers')
+        next_id = cursor.fetchone()[0] + 1
+        transfer_rows = []
+        legs = []
+        for offset, (index, from_account, to_account, amount, to_amount, t_date, description) in enumerate(accepted):
+            transfer_id = next_id + offset
+            transfer_rows.append((transfer_id, user_id, from_account, to_account, amount, to_amount,
+                                  t_date, description))
+            legs.append((user_id, from_account, 'expense', amount, categories['expense'], t_date, description,
+                         transaction_fingerprint(from_account, 'expense', amount, t_date, description), transfer_id))
+            legs.append((user_id, to_account, 'income', to_amount, categories['income'], t_date, description,
+                         transaction_fingerprint(to_account, 'income', to_amount, t_date, description), transfer_id))
+        cursor.executemany('''
+            INSERT INTO transfers (id, user_id, from_account_id, to_account_id, amount, to_amount, date, description)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', transfer_rows)
+        # 按日期顺序写入，每日余额快照触发器只需更新最新的快照
+        legs.sort(key=lambda row: row[5])
+        insert_transaction_rows(cursor, legs, extra_columns=('transfer_id',))
+        conn.commit()
+        result['inserted'] = [row[0] for row in transfer_rows]
+        return result
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"错误：转账失败: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+def transfer(user_id, from_account, to_account, amount, date, description=None, to_amount=None):
+    """
+    从一个账户转账到另一个账户
+    :param to_amount: 转入金额（默认与转出金额相同；两个账户币种不同时按当日汇率折算）
+    :return: 转账ID，失败时返回 False
+    """
+    result = transfer_batch(user_id, [{'from_account': from_account, 'to_account': to_account,
+                                       'amount': amount, 'date': date, 'description': description,
+                                       'to_amount': to_amount}])
+    if not result:
+        return False
+    if result['rejected']:
+        print(f"错误：{result['rejected'][0][1]}")
+        return False
+    return result['inserted'][0]
+
+
+def get_transfers(user_id, start_date=None, end_date=None):
+    """返回用户的转账 [(id, 日期, 转出账户, 转入账户, 转出金额, 转入金额, 备注)]，按日期倒序"""
+    query = '''
+        SELECT tr.id, tr.date, fa.name, ta.name, tr.amount, tr.to_amount, tr.description
+        FROM transfers tr
+        JOIN accounts fa ON fa.id = tr.from_account_id
+        JOIN accounts ta ON ta.id = tr.to_account_id
+        WHERE tr.user_id = ?
+    '''
+    params = [user_id]
+    if start_date:
+        query += ' AND tr.date >= ?'
+        params.append(start_date)
+    if end_date:
+        query += ' AND tr.date <= ?'
+        params.append(end_date)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(query + ' ORDER BY tr.date DESC, tr.id DESC', params)
+    rows = cursor.fetchall()
+    conn.close()
+    return rows
+
+
+def delete_transfer(user_id, transfer_id):
+    """整笔删除转账（两条腿及其余额影响一起撤销），返回是否成功"""
+    from transaction_manager import signed_amount
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('SELECT account_id, type, amount FROM transactions WHERE transfer_id = ? AND user_id = ?',
+                       (transfer_id, user_id))
+        legs = cursor.fetchall()
+        if not legs:
+            conn.rollback()
+            print("错误：转账不存在或不属于您。")
+            return False
+        cursor.executemany('UPDATE accounts SET balance = balance - ? WHERE id = ?',
+                           [(signed_amount(t_type, amount), account_id) for account_id, t_type, amount in legs])
+        cursor.execute('DELETE FROM transactions WHERE transfer_id = ?', (transfer_id,))
+        cursor.execute('DELETE FROM transfers WHERE id = ?', (transfer_id,))
+        conn.commit()
+        return True
+    except sqlite3.Error as e:
+        conn.rollback()
+        print(f"错误：删除转账失败: {e}")
+        return False
+    finally:
+        conn.close()